@@ -11,6 +11,7 @@ from taxi_driver_env.constants import (
     WINDOW_HEIGHT,
     WINDOW_WIDTH,
 )
+from taxi_driver_env.game.entities import world, world_chunks
 from taxi_driver_env.game.scenes import first_scene, next_scene
 
 
@@ -34,6 +35,8 @@ def main():
         pr.end_drawing()
         scene = next_scene(scene, next)
 
+    world.unload_baked_layers()
+    world_chunks.unload_baked_layers()
     pr.close_window()
 
 
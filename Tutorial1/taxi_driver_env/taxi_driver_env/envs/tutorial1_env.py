@@ -1,3 +1,4 @@
+import pickle
 import random
 
 import gymnasium as gym
@@ -10,19 +11,40 @@ from taxi_driver_env.constants import (
     WINDOW_HEIGHT,
     WINDOW_WIDTH,
 )
+from taxi_driver_env.game.entities import world
 from taxi_driver_env.game.scenes import trainer
+from taxi_driver_env.physic.engine import PhysicStepper
 
 
 class Tutorial1Env(gym.Env):
     metadata = {"render_modes": ["human"], "render_fps": 10}  # type: ignore # noqa: RUF012
 
-    def __init__(self, agent_count=10, render_mode=None, render_fps=None):
+    def __init__(
+        self,
+        agent_count=10,
+        render_mode=None,
+        render_fps=None,
+        *,
+        physic_rate=FRAME_RATE,
+        sub_steps=1,
+        continuous_collision=False,
+        distance_field=False,
+        car_collision=False,
+    ):
         assert render_mode is None or render_mode in self.metadata["render_modes"]
 
         self.agent_count = agent_count
         self.render_mode = render_mode or self.metadata["render_modes"][0]
         self.render_fps = render_fps or self.metadata["render_fps"]
         self.agent_count = agent_count
+        self.physic_rate = physic_rate
+
+        trainer.set_physic_stepper(
+            PhysicStepper(
+                physic_rate, sub_steps, continuous_collision=continuous_collision, distance_field=distance_field
+            )
+        )
+        trainer.set_car_collision(car_collision)
 
         agent_space = gym.spaces.Dict(
             {
@@ -57,12 +79,12 @@ class Tutorial1Env(gym.Env):
         return self._get_obs(), self._get_info()
 
     def step(self, action):
-        for i, agent in enumerate(trainer.get_agents()):
-            throttle, wheel = action[i]
+        for agent in trainer.get_active_agents():
+            throttle, wheel = action[agent.vin]
             agent.push_throttle(throttle)
             agent.turn_wheel(wheel)
 
-        trainer.update(1 / FRAME_RATE)
+        trainer.update(1 / self.physic_rate)
         terminated = trainer.is_terminated()
 
         if self.render_mode == "human":
@@ -71,21 +93,42 @@ class Tutorial1Env(gym.Env):
                 self._gfx_initialized = True
             self._gfx_render()
 
-        return self._get_obs(), 0, terminated, False, self._get_info()
+        return self._get_obs(), trainer.get_agent_rewards().copy(), terminated, False, self._get_info()
+
+    def get_state(self) -> bytes:
+        return pickle.dumps(
+            {
+                "trainer": trainer.get_state(),
+                "random": random.getstate(),
+                "np_random": np.random.get_state(),
+                "env_random": self.np_random.bit_generator.state,
+            },
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+
+    def set_state(self, state: bytes) -> None:
+        snapshot = pickle.loads(state)
+        assert len(snapshot["trainer"]["agents"]) == self.agent_count
+
+        trainer.set_state(snapshot["trainer"])
+        random.setstate(snapshot["random"])
+        np.random.set_state(snapshot["np_random"])
+        self.np_random.bit_generator.state = snapshot["env_random"]
+        self._agent_spawned = True
 
     def close(self):
         if self.render_mode == "human" and self._gfx_initialized:
             self._gfx_close()
 
     def _get_obs(self):
-        return [trainer.get_agent_obs(x) for x in trainer.get_agents()]
+        return list(trainer.get_agent_observations())
 
     def _get_info(self):
-        agents = trainer.get_agents()
         best_agent = trainer.get_best_agent()
         return {
-            "scores": [trainer.get_agent_score(x) for x in agents],
+            "scores": trainer.get_agent_scores().tolist(),
             "best_agent_vin": best_agent.vin if best_agent is not None else -1,
+            "agent_mask": trainer.get_agent_mask(),
         }
 
     def _gfx_init(self):
@@ -101,4 +144,5 @@ class Tutorial1Env(gym.Env):
         pr.end_drawing()
 
     def _gfx_close(self):
+        world.unload_baked_layers()
         pr.close_window()
@@ -1,7 +1,10 @@
+import numpy as np
 import pyray as pr
 
 from taxi_driver_env.constants import WINDOW_HEIGHT, WINDOW_WIDTH
 from taxi_driver_env.game.entities import car
+from taxi_driver_env.math.geom import Point
+from taxi_driver_env.math.linalg import lst_2_vec
 
 ZOOM_DEFAULT = 20
 ZOOM_ACCELERATION_COEF = 0.1
@@ -20,6 +23,11 @@ class CameraFollower:
     def set_target(self, acar: car.Car) -> None:
         self.car = acar
 
+    def get_view(self) -> tuple[Point, float]:
+        # The circle around the target through the corners of the window
+        center = Point(lst_2_vec([self.camera.target.x, self.camera.target.y]))
+        return center, float(np.hypot(WINDOW_WIDTH, WINDOW_HEIGHT)) * 0.5 / self.camera.zoom
+
     def reset(self) -> None:
         pr.set_mouse_cursor(pr.MouseCursor.MOUSE_CURSOR_ARROW)
         pr.hide_cursor()
@@ -5,19 +5,23 @@ import pyray as pr
 
 import taxi_driver_env.resources as res
 from taxi_driver_env.constants import GAMEPAD_AXIS_X, GAMEPAD_AXIS_Y, GAMEPAD_ID
-from taxi_driver_env.game.entities import world
+from taxi_driver_env.game.entities import world, world_chunks
 from taxi_driver_env.math import envelope
 from taxi_driver_env.math.geom import (
     Point,
     Segment,
     cast_ray_segments,
-    collision_circle_segment,
     distance,
     nearest_point_segment,
 )
 from taxi_driver_env.math.linalg import EPS, lst_2_vec, norm, normalize
-from taxi_driver_env.physic.constants import C_G
-from taxi_driver_env.physic.engine import euler_integrate
+from taxi_driver_env.math.spatial import SegmentGrid, SpatialHash
+from taxi_driver_env.physic.engine import (
+    EMPTY_RASTER,
+    PhysicStepper,
+    collide_circles_jit,
+    update_car_jit,
+)
 from taxi_driver_env.utils.bitbang import bit_set, bit_set_if, bit_unset, is_bit_set
 
 MAX_LIFE = 100
@@ -29,16 +33,23 @@ MAX_ENGINE_POWER = 200.0  # kN
 MAX_SPEED = 125.0  # km.h-1
 DRAG_ROAD = 0.9  # Concrete/Rubber
 DRAG_ROLLING = 0.01  # Concrete/Rubber
+RESTITUTION = 0.2  # Car/Car
 
 FLAG_DAMAGED = 0
 FLAG_OUT_OF_TRACK = 1
+FLAG_GHOST = 2
 
 RAY_MAX_LEN = 25  # m
 RAY_FOV = np.pi * 0.3
+RAY_SAMPLING = 16
+
+BORDER_RADIUS = 2 * RAY_MAX_LEN  # m
 
 START_OFFSET = world.ROAD_WIDTH / 4  # m
 MAX_VISITED_LOCATION = 10
 
+STATE_SIZE = 26 + 3 * MAX_VISITED_LOCATION + 2 * RAY_SAMPLING
+
 
 class Car:
     def __init__(
@@ -47,12 +58,24 @@ class Car:
         input_mode: str = "human",
         vin: int = 0,
         corridor: Optional[envelope.Envelope] = None,
+        stepper: Optional[PhysicStepper] = None,
     ) -> None:
         assert input_mode in ("human", "ai")
         self.vin = vin
         self.color = color
         self.input_mode = input_mode
         self.debug_mode = False
+        self.camera_mode = True
+        self.large_map = False
+        self.stepper = stepper if stepper is not None else PhysicStepper()
+
+        self.life: float = MAX_LIFE
+        self.camera: list[Segment] = []
+        self.proximity: Optional[Segment] = None
+        self.borders: Optional[SegmentGrid] = None
+        self.borders_center = np.zeros(2, dtype=np.float64)
+        self.current_location: envelope.Location
+        self.visited_location: list[envelope.Location]
 
         self.corridor: envelope.Envelope = corridor if corridor is not None else world.get_random_corridor()
         self.spawn_location: envelope.Location = (
@@ -65,9 +88,21 @@ class Car:
     def set_debug_mode(self, debug_mode: bool) -> None:
         self.debug_mode = debug_mode
 
+    def set_camera_mode(self, camera_mode: bool) -> None:
+        self.camera_mode = camera_mode
+
+    def set_large_map(self, large_map: bool) -> None:
+        # On a large map the car collides with the borders of the world chunks around it, instead of the ones of its
+        # corridor, and its rays see them.
+
+        self.large_map = large_map
+        self.borders = None
+        self.camera = self._cast_rays()
+
     def set_corridor(self, corridor: envelope.Envelope) -> None:
         assert self.current_location[0] == corridor.skeleton[0]
         self.corridor = corridor
+        self.current_location = (corridor.skeleton[0], self.current_location[1])
 
     def set_spawn_location(self, spawn_location: envelope.Location) -> None:
         self.spawn_location = spawn_location
@@ -85,6 +120,62 @@ class Car:
     def get_spawn_location(self) -> envelope.Location:
         return self.visited_location[-1 if len(self.visited_location) <= 1 else -2]
 
+    def get_state(self) -> np.ndarray:
+        visited = np.full((MAX_VISITED_LOCATION, 3), -1.0)
+        visited[: len(self.visited_location)] = [self.corridor.pack_location(x) for x in self.visited_location]
+        proximity = [1.0, *self.proximity.end.xy] if self.proximity is not None else [0.0, 0.0, 0.0]
+        return np.concatenate(
+            [
+                self.pos,
+                self.vel,
+                self.head,
+                self.prev_pos.xy,
+                self.curr_pos.xy,
+                [
+                    self.life,
+                    self.wheel,
+                    self.throttle,
+                    self.flags,
+                    self.total_distance,
+                    self.total_velocity,
+                    self.total_tick,
+                ],
+                self.corridor.pack_location(self.current_location),
+                self.corridor.pack_location(self.spawn_location),
+                proximity,
+                visited.ravel(),
+                np.ravel([x.end.xy for x in self.camera]),
+            ]
+        )
+
+    def set_state(self, state: np.ndarray) -> None:
+        assert state.shape == (STATE_SIZE,)
+        self.pos = state[0:2].copy()
+        self.vel = state[2:4].copy()
+        self.head = state[4:6].copy()
+        self.prev_pos = Point(state[6:8].copy())
+        self.curr_pos = Point(state[8:10].copy())
+        self.life = float(state[10])
+        self.wheel = float(state[11])
+        self.throttle = float(state[12])
+        self.flags = int(state[13])
+        self.total_distance = float(state[14])
+        self.total_velocity = float(state[15])
+        self.total_tick = int(state[16])
+        self.current_location = self.corridor.unpack_location(state[17:20])
+        self.spawn_location = self.corridor.unpack_location(state[20:23])
+
+        pos = Point(self.pos)
+        self.proximity = Segment(pos, Point(state[24:26].copy())) if state[23] > 0 else None
+
+        visited = state[26 : 26 + 3 * MAX_VISITED_LOCATION].reshape(-1, 3)
+        self.visited_location = [self.corridor.unpack_location(x) for x in visited if x[0] >= 0]
+
+        rays = state[26 + 3 * MAX_VISITED_LOCATION :].reshape(-1, 2)
+        self.camera = [Segment(pos, Point(x.copy())) for x in rays]
+        self.borders = None
+        self.stepper.reset()
+
     def turn_wheel(self, torque: float) -> None:
         self.wheel = float(np.interp(torque, [-1, 1], [-WHEEL_ANGLE_RATE, WHEEL_ANGLE_RATE]))
 
@@ -95,7 +186,7 @@ class Car:
         return self.life > 0
 
     def hit(self, damage: int) -> None:
-        self.life: float = max(0.0, self.life - damage)
+        self.life = max(0.0, self.life - damage)
 
     def reset(self) -> None:
         start_seg = self.spawn_location[0]
@@ -116,12 +207,14 @@ class Car:
         self.wheel = 0.0
         self.throttle = 0.0
         self.flags = 0
+        self.borders = None
+        self.stepper.reset()
 
         self.current_location = (start_seg, Point(start_pos))
         self.visited_location = [self.current_location]
 
-        self.camera: list[Segment] = self._cast_rays()
-        self.proximity: Optional[Segment] = None
+        self.camera = self._cast_rays()
+        self.proximity = None
 
         self.prev_pos = Point(self.pos.copy())
         self.curr_pos = self.prev_pos
@@ -133,7 +226,12 @@ class Car:
     def update(self, dt: float) -> None:
         if self.input_mode == "human":
             self._input_human()
-        self._update_physic(dt)
+        steps = self.stepper.advance(dt)
+        for _ in range(steps):
+            self._update_physic(self.stepper.dt)
+        if steps == 0:
+            # The car has not moved since the last frame, the markers must not see its last move again
+            self.prev_pos = self.curr_pos
 
     def draw(self, layer: int = 1) -> None:
         if layer != 1:
@@ -183,36 +281,17 @@ class Car:
             self.push_throttle(-0.25)
 
     def _update_physic(self, dt: float) -> None:
-        # Simple car modelisation (traction, drag road, drag rolling)
-
-        forces = np.zeros(2)
-
-        if self.wheel != 0:
-            circ_radius = LENGTH / (np.sin(self.wheel))
-            ang_vel = np.linalg.norm(self.vel) / circ_radius
-            c, s = np.cos(ang_vel), np.sin(ang_vel)
-            self.head = [[c, -s], [s, c]] @ self.head
-        tract = self.head * self.throttle
-        forces += tract
-
-        drag_rd = self.vel * -DRAG_ROAD * self.mass * C_G
-        forces += drag_rd
-
-        drag_rr = self.vel * -DRAG_ROLLING * self.mass * C_G
-        forces += drag_rr
-
-        euler_integrate(self, forces, dt)
-
-        # Collisions
-
-        match self._collision():
-            case None:
-                self.flags = bit_unset(self.flags, FLAG_DAMAGED)
-            case reaction:
-                self.vel = self.vel * 0.5 + reaction
-                self.pos += reaction
-                self.head = normalize(self.vel)
-                self.flags = bit_set(self.flags, FLAG_DAMAGED)
+        # Simple car modelisation (traction, drag road, drag rolling) and collisions, in one compiled kernel
+
+        stepper = self.stepper
+        physic = (self.wheel, self.throttle, self.mass, LENGTH, DRAG_ROAD, DRAG_ROLLING)
+        grid = self._get_border_grid()
+        distance_field = stepper.distance_field and not self.large_map
+        raster = self.corridor.distance_field.raster if distance_field else EMPTY_RASTER
+        borders = (WIDTH * 0.5, grid.array.coords, *grid.table, raster)
+        options = (dt, stepper.sub_steps, stepper.semi_implicit, stepper.continuous_collision, distance_field)
+        self.head, is_damaged = update_car_jit((self.pos, self.vel, self.head), physic, borders, options)
+        self.flags = bit_set_if(self.flags, FLAG_DAMAGED, is_damaged)
 
         self.prev_pos = self.curr_pos
         self.curr_pos = Point(self.pos.copy())
@@ -221,9 +300,14 @@ class Car:
 
         pos = Point(self.pos)
 
-        self.camera = self._cast_rays()
+        if self.camera_mode:
+            self.camera = self._cast_rays()
 
-        match nearest_point_segment(pos, self.visited_location[-1][0], True):
+        if stepper.distance_field:
+            nearest = self.corridor.get_track_nearest(pos)
+        else:
+            nearest = nearest_point_segment(pos, self.visited_location[-1][0], True)
+        match nearest:
             case None:
                 self.proximity = None
                 self.flags = bit_unset(self.flags, FLAG_OUT_OF_TRACK)
@@ -234,7 +318,7 @@ class Car:
         # Localisation
 
         is_new_location_added = False
-        self.current_location = self.corridor.get_nearest_location(pos)
+        self.current_location = self.corridor.get_nearest_location(pos, self.current_location[0])
         curr_loc_seg, curr_loc_pos = self.current_location
         if self.visited_location[-1][0] != curr_loc_seg:
             self.visited_location.append((curr_loc_seg, curr_loc_seg.closest_ep(curr_loc_pos)))
@@ -248,14 +332,28 @@ class Car:
         self.total_velocity += norm(self.vel)
         self.total_tick += 1
 
+    def _get_border_grid(self) -> SegmentGrid:
+        # The borders of the chunks are streamed in a grid around the car, built again once the car has moved half of
+        # its radius. The distance field only covers the corridor, the collisions stay exact on a large map.
+
+        if not self.large_map:
+            return self.corridor.grid
+        if self.borders is None or norm(self.pos - self.borders_center) > BORDER_RADIUS * 0.5:
+            self.borders_center = self.pos.copy()
+            self.borders = world_chunks.get_border_grid(Point(self.borders_center), BORDER_RADIUS)
+        return self.borders
+
     def _cast_rays(
         self,
         length: float = RAY_MAX_LEN,
         fov: float = RAY_FOV,
-        sampling: int = 16,
+        sampling: int = RAY_SAMPLING,
     ) -> list[Segment]:
         position = Point(self.pos)
-        nearest_segments = envelope.get_nearest_segments(self.corridor, position, length)
+        if self.large_map:
+            nearest_segments = world_chunks.get_nearest_segment_array(position, length)
+        else:
+            nearest_segments = envelope.get_nearest_segment_array(self.corridor, position, length)
         alpha = np.arctan2(self.head[1], self.head[0])
         rays = []
 
@@ -266,8 +364,34 @@ class Car:
 
         return rays
 
-    def _collision(self, radius: float = WIDTH * 0.5) -> Optional[np.ndarray]:
-        position = Point(self.pos)
-        nearest_segments = envelope.get_nearest_segments(self.corridor, position, radius)
-        collide = lambda x: collision_circle_segment(position, radius, x)
-        return next((x for x in map(collide, nearest_segments) if x is not None), None)
+
+def collide_cars(cars: list[Car]) -> None:
+    # Car to car collisions, the candidate pairs come from a spatial hash built again at each tick, so the cost stays
+    # linear in the number of cars. The cars bump without turning, and they are damaged as by a border. A ghost car,
+    # spawned on top of others, goes through them until it no longer touches any car.
+
+    if len(cars) <= 1:
+        return
+
+    positions = np.array([x.pos for x in cars])
+    pairs = SpatialHash(positions).query_pairs(WIDTH)
+
+    ghosts = np.array([is_bit_set(x.flags, FLAG_GHOST) for x in cars])
+    touching = np.zeros(len(cars), dtype=np.bool_)
+    touching[pairs.ravel()] = True
+    for i in np.flatnonzero(ghosts & ~touching):
+        cars[i].flags = bit_unset(cars[i].flags, FLAG_GHOST)
+
+    pairs = pairs[~ghosts[pairs].any(axis=1)]
+    if len(pairs) == 0:
+        return
+
+    velocities = np.array([x.vel for x in cars])
+    masses = lst_2_vec([x.mass for x in cars])
+    collided = collide_circles_jit(positions, velocities, masses, pairs, (WIDTH * 0.5, RESTITUTION))
+    for i in np.flatnonzero(collided):
+        acar = cars[i]
+        acar.pos[:] = positions[i]
+        acar.vel[:] = velocities[i]
+        acar.curr_pos = Point(acar.pos.copy())
+        acar.flags = bit_set(acar.flags, FLAG_DAMAGED)
@@ -7,7 +7,7 @@ import pyray as pr
 
 import taxi_driver_env.resources as res
 from taxi_driver_env.math.envelope import Location
-from taxi_driver_env.math.geom import Point, point_in_polygon
+from taxi_driver_env.math.geom import Point, PointArray, points_in_polygon
 from taxi_driver_env.math.linalg import normalize
 
 
@@ -43,7 +43,7 @@ class Marker:
             self.front = direction
         self.right = np.array([-self.front[1], self.front[0]])
 
-        self.polygon = self._get_polygon()
+        self.polygon = PointArray.from_points(self._get_polygon())
         self.listeners: list[MarkerListener] = []
 
     def add_listener(self, listener: MarkerListener) -> None:
@@ -62,8 +62,7 @@ class Marker:
         for listener in self.listeners:
             prev = listener.get_previous_pos()
             curr = listener.get_current_pos()
-            prev_in = point_in_polygon(prev, self.polygon, False)
-            curr_in = point_in_polygon(curr, self.polygon, False)
+            prev_in, curr_in = points_in_polygon(PointArray.from_points([prev, curr]), self.polygon, False)
             if not prev_in and curr_in:
                 listener.on_enter(self)
             if prev_in and not curr_in:
@@ -4,7 +4,7 @@ import pyray as pr
 
 from taxi_driver_env.game.entities import car, world
 from taxi_driver_env.game.entities.marker import Marker
-from taxi_driver_env.math import envelope
+from taxi_driver_env.math import envelope, graph
 from taxi_driver_env.math.geom import Point
 
 CAR_COLOR = pr.Color(255, 255, 255, 255)
@@ -24,12 +24,21 @@ class TaxiDriver:
     STATE_DROPOFF = 8
     STATE_DROPOFF_WAIT = 9
 
-    def __init__(self, input_mode: str, debug_mode: bool = False) -> None:
+    def __init__(
+        self,
+        input_mode: str,
+        debug_mode: bool = False,
+        wait_timer: float = WAIT_TIMER,
+        corridor: Optional[envelope.Envelope] = None,
+    ) -> None:
         self.state = TaxiDriver.STATE_INIT
-        self.car = car.Car(CAR_COLOR, input_mode)
+        self.wait_timer = wait_timer
+        self.timer = 0.0
+        self.car = car.Car(CAR_COLOR, input_mode, corridor=corridor)
         self.car.set_debug_mode(debug_mode)
         self.pickup: Optional[Marker] = None
         self.dropoff: Optional[Marker] = None
+        self.path_to_pickup: Optional[graph.SpatialGraph] = None
         self.money = 1000
 
     def get_previous_pos(self) -> Point:
@@ -47,10 +56,17 @@ class TaxiDriver:
     def on_leave(self, marker: Marker) -> None:
         pass
 
-    def accept_call(self, pickup: envelope.Location, dropoff: envelope.Location):
+    def accept_call(
+        self,
+        pickup: envelope.Location,
+        dropoff: envelope.Location,
+        path_to_pickup: Optional[graph.SpatialGraph] = None,
+    ):
         if self.state != TaxiDriver.STATE_WAITING_CALL:
             return
 
+        self.path_to_pickup = path_to_pickup
+
         self.pickup = Marker(pickup, world.ROAD_WIDTH * 0.5, 2)
         self.pickup.add_listener(self)
         self.dropoff = Marker(dropoff, world.ROAD_WIDTH * 0.5, 2)
@@ -64,6 +80,7 @@ class TaxiDriver:
         self.state = TaxiDriver.STATE_WAITING_CALL
         self.pickup = None
         self.dropoff = None
+        self.path_to_pickup = None
         self.money = 1000
         self.car.reset()
 
@@ -81,13 +98,16 @@ class TaxiDriver:
 
             case TaxiDriver.STATE_ACCEPTING_CALL:
                 self.timer += dt
-                if self.timer > WAIT_TIMER:
+                if self.timer > self.wait_timer:
                     self.state = TaxiDriver.STATE_ACCEPT_CALL
                 return
 
             case TaxiDriver.STATE_ACCEPT_CALL:
                 assert self.pickup is not None
-                self.car.set_corridor(world.get_corridor_from_a_to_b(self.car.current_location, self.pickup.location))
+                self.car.set_corridor(
+                    world.get_corridor_from_a_to_b(self.car.current_location, self.pickup.location, self.path_to_pickup)
+                )
+                self.path_to_pickup = None
                 self.state = TaxiDriver.STATE_GOING_TO_PICKUP
 
             case TaxiDriver.STATE_GOING_TO_PICKUP:
@@ -99,7 +119,7 @@ class TaxiDriver:
 
             case TaxiDriver.STATE_PICKUP_WAIT:
                 self.timer += dt
-                if self.timer > WAIT_TIMER:
+                if self.timer > self.wait_timer:
                     assert self.dropoff is not None
                     self.car.set_corridor(
                         world.get_corridor_from_a_to_b(self.car.current_location, self.dropoff.location)
@@ -116,7 +136,7 @@ class TaxiDriver:
 
             case TaxiDriver.STATE_DROPOFF_WAIT:
                 self.timer += dt
-                if self.timer > WAIT_TIMER:
+                if self.timer > self.wait_timer:
                     assert self.dropoff is not None
                     self.pickup = None
                     self.dropoff = None
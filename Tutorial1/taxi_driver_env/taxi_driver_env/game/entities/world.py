@@ -1,22 +1,35 @@
 from __future__ import annotations
 
+import hashlib
+import inspect
+import os
+import pickle
 import random
+import shutil
+import sys
+import tempfile
 from dataclasses import dataclass
-from functools import lru_cache
+from functools import lru_cache, partial
+from typing import Optional
 
 import numpy as np
 import pyray as pr
+from scipy.spatial import cKDTree
 
 import taxi_driver_env.resources as res
-from taxi_driver_env.math import envelope, graph
+from taxi_driver_env import constants
+from taxi_driver_env.constants import VIRTUAL_CELL, VIRTUAL_WIDTH
+from taxi_driver_env.math import envelope, geom, graph, linalg, spatial
 from taxi_driver_env.math.geom import (
     Point,
     Segment,
+    SegmentArray,
     distance,
     distance_point_segment,
     nearest_point_segment,
 )
-from taxi_driver_env.math.linalg import normalize
+from taxi_driver_env.math.linalg import lst_2_vec, normalize
+from taxi_driver_env.render.baked_layer import BakedLayer, Bounds
 
 GRASS_COLOR = pr.Color(157, 176, 84, 255)
 BASE_COLOR = pr.Color(111, 111, 111, 255)
@@ -48,6 +61,17 @@ TREE_SIZES = {
 TREE_TYPES = list(TREE_SIZES.keys())
 TREE_OFFSET = 5  # m
 
+CORRIDOR_CACHE_SIZE = 64
+
+USE_BAKED_LAYERS = False
+BAKE_MARGIN = 2 * TREE_DISTANCE  # m
+
+WORLD_CACHE_VERSION = 2
+WORLD_CACHE_SIZE = 4
+WORLD_CACHE_DIR = os.environ.get(
+    "TAXI_DRIVER_ENV_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "taxi_driver_env")
+)
+
 
 @dataclass
 class House:
@@ -56,6 +80,7 @@ class House:
     type: str
 
     def __post_init__(self):
+        self.anchor = self.position
         self.angle = self.segment.angle
         path_end = nearest_point_segment(self.position, self.segment)
         if path_end:
@@ -91,20 +116,45 @@ _progress_callback: list[envelope.ProgressCallBack] = []
 def get_singleton(name: str = "default") -> World:
     pr.trace_log(pr.TraceLogLevel.LOG_INFO, "WORLD: Initialize singleton")
 
+    # The world only depends on the random state and on the generation parameters, it is cached on disk under their
+    # hash with the random state reached at the end of the generation.
+
+    path = os.path.join(WORLD_CACHE_DIR, f"world-{_get_cache_key()}")
+    if os.path.isdir(path):
+        pr.trace_log(pr.TraceLogLevel.LOG_INFO, f"WORLD: Load cache {path}")
+        world = _load_world(path)
+        for progress_callback in _progress_callback:
+            progress_callback(1.0)
+    else:
+        world = _generate_world()
+        _save_world(path, world)
+    return world
+
+
+def _generate_world() -> World:
     roads = graph.generate_random()
 
     borders, anchors = envelope.generare_borders_from_spatial_graph(roads, ROAD_WIDTH, _progress_callback)
+    houses, trees = generate_decorations(borders, anchors)
+    return World(roads, borders, houses, trees)
+
+
+def generate_decorations(borders: envelope.Envelope, anchors: list[Point]) -> tuple[list[House], list[Tree]]:
+    # Only the border segments closer than TREE_DISTANCE matter to the placement, they are gathered for all the anchors
+    # at once from a KD-tree of points sampled along the borders.
 
-    houses: list[House] = []
-    for anchor in anchors:
+    neighbours = _get_neighbour_segments(anchors, borders, TREE_DISTANCE)
+
+    candidates: list[House] = []
+    for anchor, indices in zip(anchors, neighbours, strict=True):
         dist, seg = min(
-            ((distance_point_segment(anchor, seg), seg) for seg in borders.segments),
+            ((distance_point_segment(anchor, borders.segments[i]), borders.segments[i]) for i in indices),
             key=lambda x: x[0],
+            default=(np.inf, None),
         )
-        if HOUSE_DISTANCE <= dist <= TREE_DISTANCE and random.random() < HOUSE_DENSITY:
-            house = House(anchor, seg, random.choice(HOUSE_TYPES))
-            if not any(x.is_overlap(house) for x in houses):
-                houses.append(house)
+        if seg is not None and HOUSE_DISTANCE <= dist <= TREE_DISTANCE and random.random() < HOUSE_DENSITY:
+            candidates.append(House(anchor, seg, random.choice(HOUSE_TYPES)))
+    houses = _remove_overlapping_houses(candidates)
 
     trees = [
         Tree(
@@ -118,11 +168,155 @@ def get_singleton(name: str = "default") -> World:
             random.random() * np.pi / 2,
             random.choice(TREE_TYPES),
         )
-        for anchor in anchors
-        if min((distance_point_segment(anchor, x, True) for x in borders.segments)) > TREE_DISTANCE
+        for anchor, indices in zip(anchors, neighbours, strict=True)
+        if all(distance_point_segment(anchor, borders.segments[i], True) > TREE_DISTANCE for i in indices)
         and random.random() < TREE_DENSITY
     ]
 
+    return houses, trees
+
+
+def _get_neighbour_segments(anchors: list[Point], borders: envelope.Envelope, radius: float) -> list[list[int]]:
+    # Every point of a segment is at most half a spacing away from one of its samples, so a segment closer than the
+    # radius has a sample within the radius and half a spacing. The margin absorbs the rounding errors.
+
+    if not borders.segments:
+        return [[] for _ in anchors]
+
+    spacing = ROAD_WIDTH * 0.5
+    samples, owners = [], []
+    for i, seg in enumerate(borders.segments):
+        n = int(np.ceil(seg.length / spacing)) + 1
+        samples.append(np.linspace(seg.start.xy, seg.end.xy, n))
+        owners.append(np.full(n, i))
+    samples_owner = np.concatenate(owners)
+
+    tree = cKDTree(np.concatenate(samples))
+    points = np.array([x.xy for x in anchors]).reshape(-1, 2)
+    return [
+        sorted({int(samples_owner[j]) for j in x}) for x in tree.query_ball_point(points, radius + spacing * 0.5 + 1.0)
+    ]
+
+
+def _remove_overlapping_houses(candidates: list[House]) -> list[House]:
+    # Keep the houses in order, each one is only tested against the kept houses near it.
+
+    if not candidates:
+        return []
+
+    max_radius = max(x[4] for x in HOUSE_SIZES.values()) * HOUSE_REAL_ESTATE
+    tree = cKDTree(np.array([x.position.xy for x in candidates]))
+    neighbours = tree.query_ball_point(tree.data, 2 * max_radius)
+
+    kept = np.zeros(len(candidates), dtype=bool)
+    for i, house in enumerate(candidates):
+        kept[i] = not any(kept[j] and candidates[j].is_overlap(house) for j in neighbours[i] if j < i)
+    return [x for x, k in zip(candidates, kept, strict=True) if k]
+
+
+@lru_cache(1)
+def _get_generator_hash() -> str:
+    # The constants and the code of the generator live in the sources of these modules, editing any of them
+    # invalidates the cached worlds.
+
+    digest = hashlib.sha1()
+    for module in (graph, envelope, spatial, geom, linalg, constants, sys.modules[__name__]):
+        with open(inspect.getfile(module), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _get_cache_key() -> str:
+    parameters = (
+        WORLD_CACHE_VERSION,
+        _get_generator_hash(),
+        random.getstate(),
+        VIRTUAL_WIDTH,
+        VIRTUAL_CELL,
+        ROAD_WIDTH,
+        HOUSE_DENSITY,
+        HOUSE_DISTANCE,
+        HOUSE_SIZES,
+        HOUSE_REAL_ESTATE,
+        TREE_DENSITY,
+        TREE_DISTANCE,
+        TREE_SIZES,
+        TREE_OFFSET,
+    )
+    return hashlib.sha1(repr(parameters).encode()).hexdigest()
+
+
+def _save_world(path: str, world: World) -> None:
+    vertex_indices = {id(x): i for i, x in enumerate(world.roads.vertice)}
+    arrays = {
+        "vertice": np.array([x.point.xy for x in world.roads.vertice]).reshape(-1, 2),
+        "edges": np.array([[vertex_indices[id(x.start)], vertex_indices[id(x.end)]] for x in world.roads.edges]),
+        "segments": SegmentArray.from_segments(world.borders.segments).coords,
+        "skeleton": SegmentArray.from_segments(world.borders.skeleton).coords,
+        "houses": np.array(
+            [[*x.anchor.xy, *x.segment.start.xy, *x.segment.end.xy, HOUSE_TYPES.index(x.type)] for x in world.houses]
+        ).reshape(-1, 7),
+        "trees": np.array([[*x.position.xy, x.angle, TREE_TYPES.index(x.type)] for x in world.trees]).reshape(-1, 4),
+    }
+
+    # The cache is written aside then moved in place, another process saving the same world first wins the race and the
+    # leftover directory is removed.
+
+    tmp_path = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path))
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        with open(os.path.join(tmp_path, "random.pkl"), "wb") as f:
+            pickle.dump((random.getstate(), world.borders.width), f)
+        os.replace(tmp_path, path)
+        tmp_path = None
+    except OSError as e:
+        pr.trace_log(pr.TraceLogLevel.LOG_WARNING, f"WORLD: Unable to save cache {path}: {e}")
+    finally:
+        if tmp_path is not None:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    _prune_worlds(os.path.dirname(path))
+
+
+def _prune_worlds(cache_dir: str) -> None:
+    # Only the most recently saved worlds are kept, the ones of stale keys, left by edited parameters or generators,
+    # are removed.
+
+    try:
+        paths = [os.path.join(cache_dir, x) for x in os.listdir(cache_dir) if x.startswith("world-")]
+        paths.sort(key=os.path.getmtime, reverse=True)
+    except OSError as e:
+        pr.trace_log(pr.TraceLogLevel.LOG_WARNING, f"WORLD: Unable to prune cache {cache_dir}: {e}")
+        return
+    for path in paths[WORLD_CACHE_SIZE:]:
+        pr.trace_log(pr.TraceLogLevel.LOG_INFO, f"WORLD: Remove cache {path}")
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _load_world(path: str) -> World:
+    load = lambda x: np.asarray(np.load(os.path.join(path, f"{x}.npy"), mmap_mode="c"))
+
+    vertice = [graph.SpatialVertex(Point(x)) for x in load("vertice")]
+    edges = [graph.SpatialEdge(vertice[i], vertice[j]) for i, j in load("edges")]
+    roads = graph.SpatialGraph(vertice, edges)
+
+    with open(os.path.join(path, "random.pkl"), "rb") as f:
+        state, width = pickle.load(f)
+    borders = envelope.Envelope(
+        SegmentArray(load("segments")).to_segments(),
+        SegmentArray(load("skeleton")).to_segments(),
+        width,
+    )
+
+    houses = [
+        House(Point(x[0:2]), Segment(Point(x[2:4]), Point(x[4:6])), HOUSE_TYPES[int(x[6])]) for x in load("houses")
+    ]
+    trees = [Tree(Point(x[0:2]), float(x[2]), TREE_TYPES[int(x[3])]) for x in load("trees")]
+
+    random.setstate(state)
     return World(roads, borders, houses, trees)
 
 
@@ -137,24 +331,45 @@ def remove_progress_callback(progress_callback: envelope.ProgressCallBack):
 def get_random_corridor():
     roads = get_singleton().roads
     start = random.choice(roads.vertice)
-    stop = max(roads.vertice, key=lambda x: distance(start.point, x.point))
-    return envelope.generare_corridor_from_spatial_graph(roads.get_shortest_path(start, stop), ROAD_WIDTH, [])
+    stop = roads.routes.get_farthest_vertex(start)
+    return get_corridor(roads.routes.get_shortest_path(start, stop))
 
 
-def get_corridor_from_a_to_b(a: envelope.Location, b: envelope.Location) -> envelope.Envelope:
-    roads = get_singleton().roads
+def get_nearest_vertex(location: envelope.Location) -> graph.SpatialVertex:
+    return get_singleton().roads.get_nearest_vertex(location[0].closest_ep(location[1]))
+
+
+def get_corridor_from_a_to_b(
+    a: envelope.Location, b: envelope.Location, shortest_path: Optional[graph.SpatialGraph] = None
+) -> envelope.Envelope:
+    # The shortest path between the nearest vertice of both locations can be given, it is then extended to the
+    # locations in place of the one found in the routing table.
 
-    start = min(roads.vertice, key=lambda x: distance(a[0].closest_ep(a[1]), x.point))
-    stop = min(roads.vertice, key=lambda x: distance(b[0].closest_ep(b[1]), x.point))
-    shortest_path = roads.get_shortest_path(start, stop)
+    if shortest_path is None:
+        shortest_path = get_singleton().roads.routes.get_shortest_path(get_nearest_vertex(a), get_nearest_vertex(b))
 
-    if shortest_path.edges[0].segment != a[0]:
+    if not shortest_path.edges or shortest_path.edges[0].segment != a[0]:
         shortest_path.prepend_vertex(graph.SpatialVertex(a[0].farest_ep(a[1])))
 
     if shortest_path.edges[-1].segment != b[0]:
         shortest_path.append_vertex(graph.SpatialVertex(b[0].farest_ep(b[1])))
 
-    return envelope.generare_corridor_from_spatial_graph(shortest_path, ROAD_WIDTH, [])
+    return get_corridor(shortest_path)
+
+
+def get_corridor(path: graph.SpatialGraph) -> envelope.Envelope:
+    return _get_corridor_from_route(tuple((x.point.xy[0], x.point.xy[1]) for x in path.vertice))
+
+
+def get_corridor_cache_info():
+    return _get_corridor_from_route.cache_info()
+
+
+@lru_cache(CORRIDOR_CACHE_SIZE)
+def _get_corridor_from_route(route: tuple[tuple[float, float], ...]) -> envelope.Envelope:
+    vertice = [graph.SpatialVertex(Point(lst_2_vec(x))) for x in route]
+    edges = [graph.SpatialEdge(vertice[i], vertice[i + 1]) for i in range(len(vertice) - 1)]
+    return envelope.generare_corridor_from_spatial_graph(graph.SpatialGraph(vertice, edges), ROAD_WIDTH, [])
 
 
 def is_alive() -> bool:
@@ -174,10 +389,54 @@ def update(dt: float) -> None:
 
 
 def draw(layer: int = 1) -> None:
-    world = get_singleton()
+    if layer == 0:
+        pr.clear_background(GRASS_COLOR)
+    if USE_BAKED_LAYERS:
+        get_baked_layers()[layer].draw()
+    else:
+        draw_world(get_singleton(), layer)
+
 
+@lru_cache(1)
+def get_baked_layers(name: str = "default") -> list[BakedLayer]:
+    return bake_world(get_singleton())
+
+
+def bake_world(world: World) -> list[BakedLayer]:
+    # Nothing of a world moves, each of its layers is drawn once in render textures on its first draw.
+
+    bounds = get_world_bounds(world)
+    return [BakedLayer(bounds, partial(draw_world, world, layer)) for layer in range(2)]
+
+
+def unload_baked_layers() -> None:
+    # The render textures are released before the window closes, the layers are baked again on their next draw.
+
+    if get_baked_layers.cache_info().currsize > 0:
+        for baked_layer in get_baked_layers():
+            baked_layer.unload()
+    get_baked_layers.cache_clear()
+
+
+def get_world_bounds(world: World) -> Bounds:
+    # The bounds of the roads and of the decorations, grown by the widest stroke or sprite drawn around them.
+
+    points = np.concatenate(
+        [
+            world.borders.segment_array.coords.reshape(-1, 2),
+            np.array([x.position.xy for x in world.houses]).reshape(-1, 2),
+            np.array([x.position.xy for x in world.trees]).reshape(-1, 2),
+        ]
+    )
+    if len(points) == 0:
+        return (-BAKE_MARGIN, -BAKE_MARGIN, BAKE_MARGIN, BAKE_MARGIN)
+    x1, y1 = points.min(axis=0) - BAKE_MARGIN
+    x2, y2 = points.max(axis=0) + BAKE_MARGIN
+    return (float(x1), float(y1), float(x2), float(y2))
+
+
+def draw_world(world: World, layer: int = 1) -> None:
     def draw_bg():
-        pr.clear_background(GRASS_COLOR)
         for bone in world.borders.skeleton:
             bone.draw(world.borders.width + TREE_DISTANCE * 0.5, BASE_COLOR, None, True)
         for house in world.houses:
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import numpy as np
+import pyray as pr
+
+from taxi_driver_env.constants import GAME_SEED, VIRTUAL_WIDTH
+from taxi_driver_env.game.entities import world
+from taxi_driver_env.math import envelope, graph
+from taxi_driver_env.math.geom import Point, SegmentArray, distance, intersect_segments
+from taxi_driver_env.math.linalg import distance_point_segments_jit, lst_2_vec
+from taxi_driver_env.math.spatial import SegmentGrid
+from taxi_driver_env.render.baked_layer import BakedLayer
+
+CHUNK_SIZE = 2 * VIRTUAL_WIDTH  # m
+CHUNK_MARGIN = 2 * world.ROAD_WIDTH  # m
+CHUNK_VERTICE = 20
+CHUNK_EDGES = 25
+CHUNK_MIN_DISTANCE = 80  # m
+CHUNK_CACHE_SIZE = 16
+CHUNK_SEED = GAME_SEED
+
+ChunkKey = tuple[int, int]
+
+
+@dataclass
+class Context:
+    view_center: Point
+    view_radius: float
+    baked_layers: dict[ChunkKey, list[BakedLayer]] = field(default_factory=dict)
+
+
+@dataclass
+class Chunk:
+    key: ChunkKey
+    world: world.World
+
+    @property
+    def bounds(self) -> tuple[int, int, int, int]:
+        i, j = self.key
+        return i * CHUNK_SIZE, j * CHUNK_SIZE, (i + 1) * CHUNK_SIZE, (j + 1) * CHUNK_SIZE
+
+
+@lru_cache(1)
+def get_singleton(name: str = "default") -> Context:
+    return Context(Point(lst_2_vec([0, 0])), CHUNK_SIZE * 0.5)
+
+
+def get_chunk_key(position: Point) -> ChunkKey:
+    x, y = np.floor(position.xy / CHUNK_SIZE).astype(np.int64)
+    return int(x), int(y)
+
+
+def get_chunk_keys(position: Point, radius: float) -> list[ChunkKey]:
+    x1, y1 = get_chunk_key(Point(position.xy - radius))
+    x2, y2 = get_chunk_key(Point(position.xy + radius))
+    return [(i, j) for i in range(x1, x2 + 1) for j in range(y1, y2 + 1)]
+
+
+def get_chunks(position: Point, radius: float) -> list[Chunk]:
+    return [get_chunk(*x) for x in get_chunk_keys(position, radius)]
+
+
+def get_chunk_cache_info():
+    return get_chunk.cache_info()
+
+
+@lru_cache(CHUNK_CACHE_SIZE)
+def get_chunk(i: int, j: int) -> Chunk:
+    # Each chunk is generated from its own seed, the global random state is left untouched.
+
+    state = random.getstate()
+    try:
+        random.seed(hash((CHUNK_SEED, i, j)))
+        return _generate_chunk(i, j)
+    finally:
+        random.setstate(state)
+
+
+def get_nearest_segment_array(position: Point, radius: float) -> SegmentArray:
+    arrays = [x.world.borders.grid.query_array(position, radius).coords for x in get_chunks(position, radius)]
+    coords = np.concatenate(arrays) if arrays else np.zeros((0, 4))
+    order = np.argsort(distance_point_segments_jit(position.xy, coords), kind="stable")
+    return SegmentArray(coords[order])
+
+
+def get_border_grid(position: Point, radius: float) -> SegmentGrid:
+    # The borders of all the chunks around the position in a single grid, the ones of both sides of a seam together.
+
+    return SegmentGrid(get_nearest_segment_array(position, radius).to_segments())
+
+
+def get_roads(keys: list[ChunkKey]) -> graph.SpatialGraph:
+    # The chunks share the vertice of their portals, they are merged by position.
+
+    vertice: dict[tuple[float, float], graph.SpatialVertex] = {}
+    edges: dict[tuple[tuple[float, float], tuple[float, float]], graph.SpatialEdge] = {}
+    get_vertex = lambda x: vertice.setdefault((x.point.xy[0], x.point.xy[1]), x)
+    for key in keys:
+        for e in get_chunk(*key).world.roads.edges:
+            start, end = get_vertex(e.start), get_vertex(e.end)
+            a, b = (start.point.xy[0], start.point.xy[1]), (end.point.xy[0], end.point.xy[1])
+            edges.setdefault((min(a, b), max(a, b)), graph.SpatialEdge(start, end))
+    return graph.SpatialGraph(list(vertice.values()), list(edges.values()))
+
+
+def get_corridor_from_a_to_b(a: Point, b: Point) -> envelope.Envelope:
+    # The route is searched in the chunks of the box of both ends, grown by one chunk.
+
+    (i1, j1), (i2, j2) = get_chunk_key(a), get_chunk_key(b)
+    keys = [(i, j) for i in range(min(i1, i2) - 1, max(i1, i2) + 2) for j in range(min(j1, j2) - 1, max(j1, j2) + 2)]
+    roads = get_roads(keys)
+    start = min(roads.vertice, key=lambda x: distance(a, x.point))
+    stop = min(roads.vertice, key=lambda x: distance(b, x.point))
+    return world.get_corridor(roads.get_shortest_path(start, stop, True))
+
+
+def get_random_corridor(position: Point) -> envelope.Envelope:
+    # A route from the chunk of the position to a random vertex of one of its neighbours, it crosses at least a seam.
+
+    i, j = get_chunk_key(position)
+    di, dj = random.choice([(-1, 0), (1, 0), (0, -1), (0, 1)])
+    return get_corridor_from_a_to_b(position, random.choice(get_chunk(i + di, j + dj).world.roads.vertice).point)
+
+
+def set_view(center: Point, radius: float) -> None:
+    ctx = get_singleton()
+    ctx.view_center = center
+    ctx.view_radius = radius
+
+
+def is_alive() -> bool:
+    return True
+
+
+def hit(damage: int) -> None:
+    pass
+
+
+def reset() -> None:
+    get_chunk.cache_clear()
+
+
+def update(dt: float) -> None:
+    pass
+
+
+def draw(layer: int = 1) -> None:
+    ctx = get_singleton()
+    if layer == 0:
+        pr.clear_background(world.GRASS_COLOR)
+    chunks = get_chunks(ctx.view_center, ctx.view_radius)
+    if world.USE_BAKED_LAYERS:
+        for layers in _get_baked_layers(ctx, chunks):
+            layers[layer].draw()
+    else:
+        for chunk in chunks:
+            world.draw_world(chunk.world, layer)
+
+
+def _get_baked_layers(ctx: Context, chunks: list[Chunk]) -> list[list[BakedLayer]]:
+    # Only the chunks in view keep their render textures, the ones of a chunk leaving the view are released.
+
+    keys = {x.key for x in chunks}
+    for key in [x for x in ctx.baked_layers if x not in keys]:
+        for baked_layer in ctx.baked_layers.pop(key):
+            baked_layer.unload()
+    for chunk in chunks:
+        if chunk.key not in ctx.baked_layers:
+            ctx.baked_layers[chunk.key] = world.bake_world(chunk.world)
+    return [ctx.baked_layers[x.key] for x in chunks]
+
+
+def unload_baked_layers() -> None:
+    ctx = get_singleton()
+    for layers in ctx.baked_layers.values():
+        for baked_layer in layers:
+            baked_layer.unload()
+    ctx.baked_layers.clear()
+
+
+def _generate_chunk(i: int, j: int) -> Chunk:
+    x1, y1 = i * CHUNK_SIZE, j * CHUNK_SIZE
+    x2, y2 = x1 + CHUNK_SIZE, y1 + CHUNK_SIZE
+    center = lst_2_vec([x1 + x2, y1 + y2]) * 0.5
+
+    # The inner roads keep a margin to the sides of the chunk, only the portal roads cross it. A portal road runs
+    # straight across a side, between two stubs, so both chunks generate the same road.
+
+    inner = graph.generate_city(CHUNK_VERTICE, CHUNK_EDGES, CHUNK_MIN_DISTANCE, CHUNK_SIZE * 0.5 - CHUNK_MARGIN)
+    vertice = [graph.SpatialVertex(Point(x.point.xy + center)) for x in inner.vertice]
+    indices = {id(x): k for k, x in enumerate(inner.vertice)}
+    edges = [graph.SpatialEdge(vertice[indices[id(x.start)]], vertice[indices[id(x.end)]]) for x in inner.edges]
+    inner_edges = SegmentArray.from_segments([x.segment for x in edges])
+
+    for portal, normal in _get_portals(i, j):
+        stub = graph.SpatialVertex(Point(portal - normal * CHUNK_MARGIN))
+        middle = graph.SpatialVertex(Point(portal))
+        outer = graph.SpatialVertex(Point(portal + normal * CHUNK_MARGIN))
+        for v in sorted(vertice[: len(inner.vertice)], key=lambda x: distance(stub.point, x.point)):
+            road = SegmentArray(lst_2_vec([[*stub.point.xy, *v.point.xy]]))
+            if len(inner_edges) == 0 or not intersect_segments(road, inner_edges)[3].any():
+                edges.append(graph.SpatialEdge(stub, v))
+                break
+        edges.extend([graph.SpatialEdge(stub, middle), graph.SpatialEdge(middle, outer)])
+        vertice.extend([stub, middle, outer])
+    roads = graph.SpatialGraph(vertice, edges)
+
+    # The chunk keeps the borders and the bones lying in it, the ones beyond belong to its neighbours. The decorations
+    # are placed against all the borders generated around the chunk.
+
+    bounds = (x1, y1, x2 - 1, y2 - 1)
+    borders, anchors = envelope.generare_borders_from_spatial_graph(roads, world.ROAD_WIDTH, [], bounds)
+    houses, trees = world.generate_decorations(borders, anchors)
+    is_inside = lambda x: x1 <= x.middle.xy[0] < x2 and y1 <= x.middle.xy[1] < y2
+    borders = envelope.Envelope(
+        [x for x in borders.segments if is_inside(x)], [x for x in borders.skeleton if is_inside(x)], borders.width
+    )
+    return Chunk((i, j), world.World(roads, borders, houses, trees))
+
+
+def _get_portals(i: int, j: int) -> list[tuple[np.ndarray, np.ndarray]]:
+    # A portal only depends on the side it lies on, the side is identified by its axis and its lower corner.
+
+    get_offset = lambda *x: random.Random(hash((CHUNK_SEED, *x))).uniform(-0.5, 0.5) * (CHUNK_SIZE - 4 * CHUNK_MARGIN)
+    portal = lambda axis, a, b: (
+        lst_2_vec([a * CHUNK_SIZE, (b + 0.5) * CHUNK_SIZE + get_offset(axis, a, b)])
+        if axis == 0
+        else lst_2_vec([(a + 0.5) * CHUNK_SIZE + get_offset(axis, a, b), b * CHUNK_SIZE])
+    )
+    return [
+        (portal(0, i, j), lst_2_vec([-1, 0])),
+        (portal(0, i + 1, j), lst_2_vec([1, 0])),
+        (portal(1, i, j), lst_2_vec([0, -1])),
+        (portal(1, i, j + 1), lst_2_vec([0, 1])),
+    ]
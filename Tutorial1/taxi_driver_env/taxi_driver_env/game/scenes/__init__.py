@@ -1,7 +1,7 @@
-from taxi_driver_env.game.scenes import gameplay, loading, title, trainer
+from taxi_driver_env.game.scenes import dispatch, gameplay, loading, title, trainer
 from taxi_driver_env.render.types import Scene
 
-SCENES = {"title": title, "loading": loading, "gameplay": gameplay, "trainer": trainer}
+SCENES = {"title": title, "loading": loading, "gameplay": gameplay, "trainer": trainer, "dispatch": dispatch}
 
 
 def first_scene(next: str) -> Scene:
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+import pyray as pr
+
+import taxi_driver_env.render.pyrayex as prx
+from taxi_driver_env.game.cameras.camera_free import CameraFree
+from taxi_driver_env.game.entities import car, world
+from taxi_driver_env.game.entities.marker import Marker
+from taxi_driver_env.game.entities.taxi_driver import TaxiDriver
+from taxi_driver_env.math import envelope, graph
+from taxi_driver_env.math.geom import Point
+from taxi_driver_env.math.linalg import EPS, lst_2_vec, norm, normalize
+from taxi_driver_env.physic.constants import C_G
+
+TAXI_COUNT = 200
+REQUEST_RATE = 3600  # h-1
+CRUISE_SPEED = 50.0  # km.h-1
+MIN_SPEED_COEF = 0.25
+LOOK_AHEAD = 8.0  # m
+LANE_OFFSET = world.ROAD_WIDTH / 4  # m
+APPROACH_DISTANCE = 2 * LOOK_AHEAD  # m
+STEERING_COEF = 0.2
+DRAG_COEF = (car.DRAG_ROAD + car.DRAG_ROLLING) * car.MASS * C_G
+
+Request = tuple[envelope.Location, envelope.Location]
+
+
+@dataclass
+class Context:
+    taxis: list[TaxiDriver]
+    requests: list[Request] = field(default_factory=list)
+    camera: Optional[CameraFree] = None
+    request_rate: float = REQUEST_RATE
+    next_request: float = 0.0
+    elapsed: float = 0.0
+    steps: int = 0
+    dispatched: int = 0
+    trips: int = 0
+    car_collision: bool = False
+
+
+@lru_cache(1)
+def get_singleton(name: str = "default"):
+    return Context([])
+
+
+def spawn_taxis(taxi_count: int) -> None:
+    # The taxis are driven by the dispatcher, they do not need their camera. The customers never keep a taxi waiting.
+
+    ctx = get_singleton()
+    ctx.taxis = [TaxiDriver("ai", wait_timer=0.0) for _ in range(taxi_count)]
+    for taxi in ctx.taxis:
+        taxi.car.set_camera_mode(False)
+
+
+def set_request_rate(request_rate: float) -> None:
+    get_singleton().request_rate = request_rate
+
+
+def set_car_collision(car_collision: bool) -> None:
+    get_singleton().car_collision = car_collision
+
+
+def get_trips_per_hour() -> float:
+    ctx = get_singleton()
+    return ctx.trips * 3600 / (ctx.elapsed + EPS)
+
+
+def reset() -> None:
+    ctx = get_singleton()
+
+    if not ctx.taxis:
+        spawn_taxis(TAXI_COUNT)
+    for taxi in ctx.taxis:
+        taxi.reset()
+
+    ctx.requests = []
+    ctx.next_request = random.expovariate(ctx.request_rate / 3600)
+    ctx.elapsed = 0.0
+    ctx.steps = 0
+    ctx.dispatched = 0
+    ctx.trips = 0
+
+    if ctx.camera is not None:
+        ctx.camera.reset()
+
+
+def update(dt: float) -> str:
+    ctx = get_singleton()
+
+    # The calls arrive as a Poisson process, they queue until a taxi is free.
+
+    ctx.elapsed += dt
+    ctx.steps += 1
+    while ctx.next_request <= ctx.elapsed:
+        borders = world.get_singleton().borders
+        ctx.requests.append((borders.get_random_location(), borders.get_random_location()))
+        ctx.next_request += random.expovariate(ctx.request_rate / 3600)
+
+    _dispatch_requests(ctx)
+
+    for taxi in ctx.taxis:
+        state = taxi.state
+        _drive(taxi)
+        taxi.update(dt)
+        if taxi.state == TaxiDriver.STATE_DROPOFF_WAIT and state != TaxiDriver.STATE_DROPOFF_WAIT:
+            ctx.trips += 1
+    if ctx.car_collision:
+        car.collide_cars([x.car for x in ctx.taxis])
+
+    if ctx.camera is not None:
+        ctx.camera.update(dt)
+
+    return "dispatch"
+
+
+def _dispatch_requests(ctx: Context) -> None:
+    # All the calls of a tick are answered by a single search from the free taxis, each call goes to the taxi nearest
+    # to its pickup by road. A call whose nearest taxis are already taken waits for the next tick.
+
+    if not ctx.requests:
+        return
+
+    taxis: dict[graph.SpatialVertex, list[TaxiDriver]] = {}
+    free_taxis = 0
+    for taxi in ctx.taxis:
+        if taxi.state == TaxiDriver.STATE_WAITING_CALL:
+            taxis.setdefault(world.get_nearest_vertex(taxi.car.current_location), []).append(taxi)
+            free_taxis += 1
+    if not taxis:
+        return
+
+    roads = world.get_singleton().roads
+    prev, origins = roads.search_nearest(taxis.keys())
+
+    requests = []
+    for k, (pickup, dropoff) in enumerate(ctx.requests):
+        if free_taxis == 0:
+            requests.extend(ctx.requests[k:])
+            break
+        stop = world.get_nearest_vertex(pickup)
+        start = origins.get(stop)
+        if start is None or not taxis[start]:
+            requests.append((pickup, dropoff))
+            continue
+        taxi = taxis[start].pop()
+        taxi.accept_call(pickup, dropoff, roads.get_path(start, stop, prev))
+        ctx.dispatched += 1
+        free_taxis -= 1
+    ctx.requests = requests
+
+
+def _drive(taxi: TaxiDriver) -> None:
+    match taxi.state:
+        case TaxiDriver.STATE_GOING_TO_PICKUP:
+            _drive_along_corridor(taxi.car, taxi.pickup)
+        case TaxiDriver.STATE_GOING_TO_DROPOFF:
+            _drive_along_corridor(taxi.car, taxi.dropoff)
+        case _:
+            taxi.car.push_throttle(0.0)
+            taxi.car.turn_wheel(0.0)
+
+
+def _drive_along_corridor(acar: car.Car, marker: Optional[Marker]) -> None:
+    # A pure pursuit of the point LOOK_AHEAD ahead on the right lane of the corridor. The center of the marker is
+    # pursued instead once it is close, so the taxi pulls in the marker whatever its lane. The wheel turns the heading
+    # toward this point by a fraction of the angle per tick, and the throttle balances the drag at the target speed,
+    # slowed down in the turns, at the end of the corridor and at the marker.
+
+    skeleton = acar.corridor.skeleton
+    i = acar.corridor.bone_indices[id(acar.current_location[0])]
+    position, ahead, remaining = acar.current_location[1].xy, LOOK_AHEAD, 0.0
+    target = position
+    for j in range(i, len(skeleton)):
+        end = skeleton[j].end.xy
+        direction = normalize(end - skeleton[j].start.xy)
+        length = norm(end - position)
+        if ahead > 0:
+            offset = lst_2_vec([-direction[1], direction[0]]) * LANE_OFFSET
+            target = position + direction * min(ahead, length) + offset
+            ahead -= length
+        remaining += length
+        position = end
+
+    if marker is not None:
+        center = marker.location[1].xy + marker.right * marker.width * 0.5
+        if norm(center - acar.pos) < APPROACH_DISTANCE:
+            target = center
+            remaining = min(remaining, norm(center - acar.pos) + marker.height)
+
+    to_target = target - acar.pos
+    error = np.arctan2(acar.head[0] * to_target[1] - acar.head[1] * to_target[0], np.dot(acar.head, to_target))
+    speed = norm(acar.vel)
+    wheel = np.arcsin(np.clip(error * STEERING_COEF * car.LENGTH / (speed + EPS), -1, 1))
+    acar.turn_wheel(wheel / car.WHEEL_ANGLE_RATE)
+
+    target_speed = min(CRUISE_SPEED / 3.6 * max(MIN_SPEED_COEF, np.cos(error)), remaining)
+    acar.push_throttle(min(1.0, target_speed * DRAG_COEF / (car.MAX_ENGINE_POWER * 1000)))
+
+
+def draw() -> None:
+    ctx = get_singleton()
+
+    if ctx.camera is None:
+        ctx.camera = CameraFree(Point(lst_2_vec([0, 0])))
+        ctx.camera.reset()
+
+    pr.begin_mode_2d(ctx.camera.camera)
+    for layer in range(2):
+        world.draw(layer)
+        for taxi in ctx.taxis:
+            taxi.draw(layer)
+    pr.end_mode_2d()
+
+    prx.draw_text(f"Taxis: {len(ctx.taxis)}", pr.Vector2(2, 2), 20, pr.WHITE, shadow=True)  # type: ignore
+    prx.draw_text(f"Calls waiting: {len(ctx.requests)}", pr.Vector2(2, 24), 20, pr.WHITE, shadow=True)  # type: ignore
+    prx.draw_text(f"Trips: {ctx.trips}", pr.Vector2(2, 46), 20, pr.WHITE, shadow=True)  # type: ignore
+    prx.draw_text(f"Trips per hour: {get_trips_per_hour():.0f}", pr.Vector2(2, 68), 20, pr.WHITE, shadow=True)  # type: ignore
+    prx.draw_text(f"{pr.get_fps()}fps", pr.Vector2(2, 2), 20, pr.WHITE, align="right", shadow=True)  # type: ignore
@@ -10,12 +10,14 @@ import pyray as pr
 import taxi_driver_env.render.pyrayex as prx
 import taxi_driver_env.resources as res
 from taxi_driver_env.game.cameras.camera_follower import CameraFollower
-from taxi_driver_env.game.entities import car, world
+from taxi_driver_env.game.entities import car, world, world_chunks
 from taxi_driver_env.game.entities.explosion import Explosion
 from taxi_driver_env.game.entities.floating import Floating
 from taxi_driver_env.game.entities.taxi_driver import WAIT_TIMER, TaxiDriver
 from taxi_driver_env.game.widgets.meter import Meter
 from taxi_driver_env.game.widgets.minimap import Minimap
+from taxi_driver_env.math.geom import Point
+from taxi_driver_env.math.linalg import lst_2_vec
 from taxi_driver_env.physic.types import Entity
 from taxi_driver_env.render.effects.fade_scr import FadeScr
 from taxi_driver_env.render.effects.open_vertical import OpenVertical
@@ -27,6 +29,7 @@ CAR_COLOR = pr.Color(255, 255, 255, 255)
 CORRIDOR_COLOR = pr.Color(255, 255, 0, 64)
 ZOOM_DEFAULT = 20
 ZOOM_ACCELERATION_COEF = 0.1
+USE_LARGE_MAP = False
 
 
 @dataclass
@@ -45,12 +48,19 @@ class Context:
 
 @lru_cache(1)
 def get_singleton(name: str = "default"):
-    player = TaxiDriver("human")
+    # On a large map the world is streamed in chunks around the camera, the player starts on a route across a seam.
+
+    if USE_LARGE_MAP:
+        start = Point(lst_2_vec([world_chunks.CHUNK_SIZE * 0.5, world_chunks.CHUNK_SIZE * 0.5]))
+        player = TaxiDriver("human", corridor=world_chunks.get_random_corridor(start))
+        player.car.set_large_map(True)
+    else:
+        player = TaxiDriver("human")
     camera = CameraFollower(player.car)
     minimap = Minimap(player)
     meter = Meter(player)
     fade_in = FadeScr(1)
-    entities: list[Entity] = [world, player]
+    entities: list[Entity] = [world_chunks if USE_LARGE_MAP else world, player]
     floatings: list[Entity] = []
     widgets: list[Widget] = [minimap, meter]
     return Context(0, player, camera, minimap, entities, floatings, widgets, fade_in, None)
@@ -67,6 +77,8 @@ def reset() -> None:
     for x in ctx.widgets:
         x.reset()
     ctx.camera.reset()
+    if USE_LARGE_MAP:
+        world_chunks.set_view(*ctx.camera.get_view())
     ctx.fade_in.reset()
 
 
@@ -85,7 +97,8 @@ def update(dt: float) -> str:  # noqa: PLR0915
                 ctx.player.car.set_debug_mode(not ctx.player.car.debug_mode)
             if pr.is_key_pressed(pr.KeyboardKey.KEY_F2):
                 ctx.widgets_visible = not ctx.widgets_visible
-            if pr.is_key_pressed(pr.KeyboardKey.KEY_A):
+            if pr.is_key_pressed(pr.KeyboardKey.KEY_A) and not USE_LARGE_MAP:
+                # The calls are routed in the whole world, a large map has none
                 ctx.player.accept_call(
                     world.get_singleton().borders.get_random_location(),
                     world.get_singleton().borders.get_random_location(),
@@ -167,6 +180,8 @@ def update(dt: float) -> str:  # noqa: PLR0915
         ctx.message_box.update(dt)
 
     ctx.camera.update(dt)
+    if USE_LARGE_MAP:
+        world_chunks.set_view(*ctx.camera.get_view())
 
     if (
         is_bit_set(ctx.player.car.flags, car.FLAG_DAMAGED)
@@ -1,8 +1,7 @@
 from __future__ import annotations
 
 import datetime
-import random
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from functools import lru_cache
 from typing import Optional
 
@@ -15,11 +14,12 @@ from taxi_driver_env.game.cameras.camera_free import CameraFree
 from taxi_driver_env.game.entities import car, world
 from taxi_driver_env.game.entities.explosion import Explosion
 from taxi_driver_env.game.entities.marker import Marker
-from taxi_driver_env.math import envelope
-from taxi_driver_env.math.geom import Point, distance
+from taxi_driver_env.math import envelope, graph
+from taxi_driver_env.math.geom import Point
 from taxi_driver_env.math.linalg import lst_2_vec
+from taxi_driver_env.physic.engine import PhysicStepper
 from taxi_driver_env.physic.types import Entity
-from taxi_driver_env.utils.bitbang import is_bit_set
+from taxi_driver_env.utils.bitbang import bit_set, is_bit_set
 
 CAR_BEST_COLOR = pr.Color(255, 255, 255, 255)
 CAR_COLOR = pr.Color(255, 255, 255, 64)
@@ -40,6 +40,13 @@ class Context:
     spawn_location_changed: bool = False
     timestep: int = 0
     lap: int = 0
+    active_agents: list[car.Car] = field(default_factory=list)
+    observations: list[dict[str, np.ndarray]] = field(default_factory=list)
+    scores: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    rewards: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    best_score: float = -np.inf
+    stepper: PhysicStepper = field(default_factory=PhysicStepper)
+    car_collision: bool = False
 
     def get_previous_pos(self) -> Point:
         return self.best_agent.prev_pos if self.best_agent is not None else Point(np.zeros(2))
@@ -61,25 +68,120 @@ def get_singleton(name: str = "default"):
 
 def reset_corridor():
     ctx = get_singleton()
-    roads = world.get_singleton().roads
-    start = random.choice(roads.vertice)
-    stop = max(roads.vertice, key=lambda x: distance(start.point, x.point))
-    ctx.corridor, _ = envelope.generare_borders_from_spatial_graph(
-        roads.get_shortest_path(start, stop), world.ROAD_WIDTH, []
+    ctx.corridor = world.get_random_corridor()
+
+
+def set_physic_stepper(stepper: PhysicStepper) -> None:
+    # The agents spawned afterward integrate at the rate of this stepper, each one with its own accumulator.
+
+    get_singleton().stepper = stepper
+
+
+def set_car_collision(car_collision: bool) -> None:
+    get_singleton().car_collision = car_collision
+
+
+def get_state() -> dict[str, np.ndarray]:
+    ctx = get_singleton()
+    assert ctx.corridor is not None
+
+    markers = [x for x in ctx.entities if isinstance(x, Marker)]
+    explosions = [x for x in ctx.entities if isinstance(x, Explosion)]
+    last_spawn_location = (
+        ctx.corridor.pack_location(ctx.last_spawn_location) if ctx.last_spawn_location is not None else [-1, 0, 0]
     )
 
+    return {
+        "corridor": _get_skeleton_state(ctx.corridor),
+        "agents": np.array([x.get_state() for x in ctx.agents]).reshape(-1, car.STATE_SIZE),
+        "active_agents": np.array([x.vin for x in ctx.active_agents], dtype=np.int64),
+        "scores": ctx.scores.copy(),
+        "rewards": ctx.rewards.copy(),
+        "markers": np.array([[*ctx.corridor.pack_location(x.location), *x.front] for x in markers]).reshape(-1, 5),
+        "explosions": np.array([[*x.pos.xy, x.life] for x in explosions]).reshape(-1, 3),
+        "last_spawn_location": lst_2_vec(last_spawn_location),
+        "counters": np.array(
+            [
+                ctx.best_agent.vin if ctx.best_agent is not None else -1,
+                ctx.spawn_location_changed,
+                ctx.timestep,
+                ctx.lap,
+            ],
+            dtype=np.int64,
+        ),
+        "best_score": lst_2_vec([ctx.best_score]),
+    }
+
+
+def set_state(state: dict[str, np.ndarray]) -> None:
+    ctx = get_singleton()
+
+    skeleton = state["corridor"]
+    if ctx.corridor is None or not np.array_equal(skeleton, _get_skeleton_state(ctx.corridor)):
+        vertice = [graph.SpatialVertex(Point(x.copy())) for x in [*skeleton[:, :2], skeleton[-1, 2:]]]
+        edges = [graph.SpatialEdge(vertice[i], vertice[i + 1]) for i in range(len(vertice) - 1)]
+        ctx.corridor = world.get_corridor(graph.SpatialGraph(vertice, edges))
+
+    if len(ctx.agents) != len(state["agents"]):
+        spawn_agents(len(state["agents"]))
+
+    for agent, agent_state in zip(ctx.agents, state["agents"], strict=True):
+        agent.corridor = ctx.corridor
+        agent.set_state(agent_state)
+
+    ctx.active_agents = [ctx.agents[i] for i in state["active_agents"]]
+    ctx.observations = [get_masked_obs() for _ in ctx.agents]
+    for agent in ctx.active_agents:
+        ctx.observations[agent.vin] = get_agent_obs(agent)
+    ctx.scores = state["scores"].copy()
+    ctx.rewards = state["rewards"].copy()
+
+    ctx.entities = [world]
+    for x in state["markers"]:
+        marker = Marker(ctx.corridor.unpack_location(x[:3]), world.ROAD_WIDTH * 0.5, 2, x[3:5].copy())
+        marker.add_listener(ctx)
+        ctx.entities.append(marker)
+    for x in state["explosions"]:
+        explosion = Explosion(Point(x[:2].copy()))
+        explosion.life = int(x[2])
+        ctx.entities.append(explosion)
+
+    last_spawn_location = state["last_spawn_location"]
+    ctx.last_spawn_location = ctx.corridor.unpack_location(last_spawn_location) if last_spawn_location[0] >= 0 else None
+
+    best_agent_vin, spawn_location_changed, ctx.timestep, ctx.lap = (int(x) for x in state["counters"])
+    ctx.best_agent = ctx.agents[best_agent_vin] if best_agent_vin >= 0 else None
+    ctx.best_score = float(state["best_score"][0])
+    ctx.spawn_location_changed = bool(spawn_location_changed)
+
+    if ctx.camera is None:
+        ctx.camera = CameraFollower(ctx.best_agent or ctx.agents[0])
+    elif isinstance(ctx.camera, CameraFollower):
+        ctx.camera.set_target(ctx.best_agent or ctx.agents[0])
+
+
+def _get_skeleton_state(corridor: envelope.Envelope) -> np.ndarray:
+    return np.array([[*x.start.xy, *x.end.xy] for x in corridor.skeleton])
+
 
 def get_agents() -> list[car.Car]:
     return get_singleton().agents
 
 
+def get_active_agents() -> list[car.Car]:
+    return get_singleton().active_agents
+
+
 def spawn_agents(agent_count: int) -> None:
     ctx = get_singleton()
 
     if ctx.corridor is None:
         reset_corridor()
 
-    ctx.agents = [car.Car(CAR_COLOR, input_mode="ai", vin=i, corridor=ctx.corridor) for i in range(agent_count)]
+    ctx.agents = [
+        car.Car(CAR_COLOR, input_mode="ai", vin=i, corridor=ctx.corridor, stepper=replace(ctx.stepper))
+        for i in range(agent_count)
+    ]
 
 
 def reset_agents() -> None:
@@ -94,6 +196,25 @@ def get_best_agent():
     return context.best_agent
 
 
+def get_agent_scores() -> np.ndarray:
+    return get_singleton().scores
+
+
+def get_agent_rewards() -> np.ndarray:
+    return get_singleton().rewards
+
+
+def get_agent_observations() -> list[dict[str, np.ndarray]]:
+    return get_singleton().observations
+
+
+def get_agent_mask() -> np.ndarray:
+    ctx = get_singleton()
+    mask = np.zeros(len(ctx.agents), dtype=np.bool_)
+    mask[[x.vin for x in ctx.active_agents]] = True
+    return mask
+
+
 def get_agent_obs(agent: car.Car) -> dict[str, np.ndarray]:
     return {
         "agent_vel": lst_2_vec([agent.get_speed_in_kmh() / car.MAX_SPEED]),
@@ -101,6 +222,13 @@ def get_agent_obs(agent: car.Car) -> dict[str, np.ndarray]:
     }
 
 
+def get_masked_obs() -> dict[str, np.ndarray]:
+    return {
+        "agent_vel": np.zeros(1),
+        "agent_cam": np.zeros(car.RAY_SAMPLING),
+    }
+
+
 def get_agent_score(agent: car.Car) -> float:
     score = int(agent.get_total_distance_in_km() * 1000)  # farest in meter
     score += int(agent.get_average_speed_in_kmh() * 10 / car.MAX_SPEED)  # fatest in meter per second
@@ -131,13 +259,24 @@ def reset() -> None:
     reset_agents()
     default_agent = ctx.agents[0]
 
-    ctx.entities = [world, *ctx.agents]
+    ctx.entities = [world]
+    ctx.active_agents = list(ctx.agents)
     ctx.camera = CameraFollower(default_agent)
     ctx.best_agent = None
+    ctx.best_score = -np.inf
     ctx.timestep += 1
 
     for entity in ctx.entities:
         entity.reset()
+    for agent in ctx.active_agents:
+        agent.reset()
+        if ctx.car_collision:
+            # The agents spawn on top of each other, they do not collide until they separate
+            agent.flags = bit_set(agent.flags, car.FLAG_GHOST)
+
+    ctx.observations = [get_agent_obs(x) for x in ctx.agents]
+    ctx.scores = lst_2_vec([get_agent_score(x) for x in ctx.agents])
+    ctx.rewards = np.zeros(len(ctx.agents))
 
     marker = Marker(
         default_agent.get_spawn_location(),
@@ -167,16 +306,17 @@ def update(dt: float) -> str:
                 ctx.camera = CameraFollower(acar)
                 ctx.camera.reset()
 
+    for agent in ctx.active_agents:
+        agent.update(dt)
+    if ctx.car_collision:
+        car.collide_cars(ctx.active_agents)
+
     for entity in ctx.entities:
         entity.update(dt)
     ctx.entities = [entity for entity in ctx.entities if entity.is_alive()]
 
-    for agent in ctx.agents:
-        if agent.is_alive() and not is_agent_alive(agent):
-            agent.hit(car.MAX_LIFE)
-            ctx.entities.append(Explosion(Point(agent.pos)))
+    _update_active_agents(ctx)
 
-    ctx.best_agent = max((x for x in ctx.agents if x.is_alive()), key=get_agent_score, default=None)
     if ctx.best_agent is not None:
         last_spawn_location = ctx.best_agent.get_spawn_location()
         ctx.spawn_location_changed = ctx.last_spawn_location != last_spawn_location
@@ -189,12 +329,44 @@ def update(dt: float) -> str:
     return "trainer"
 
 
+def _update_active_agents(ctx: Context) -> None:
+    # Only the active agents can see their observation and score change, the destroyed agents are masked, their
+    # scores are frozen and their rewards are null. The active set is compacted in the same pass.
+
+    ctx.rewards.fill(0.0)
+    ctx.best_agent = None
+    ctx.best_score = -np.inf
+
+    active_agents = []
+    for agent in ctx.active_agents:
+        if not is_agent_alive(agent):
+            agent.hit(car.MAX_LIFE)
+            ctx.entities.append(Explosion(Point(agent.pos)))
+
+        score = get_agent_score(agent)
+        ctx.rewards[agent.vin] = score - ctx.scores[agent.vin]
+        ctx.scores[agent.vin] = score
+
+        if not agent.is_alive():
+            ctx.observations[agent.vin] = get_masked_obs()
+            continue
+
+        ctx.observations[agent.vin] = get_agent_obs(agent)
+        active_agents.append(agent)
+
+        if score > ctx.best_score:
+            ctx.best_agent = agent
+            ctx.best_score = score
+
+    ctx.active_agents = active_agents
+
+
 def draw() -> None:
     ctx = get_singleton()
     assert ctx.corridor is not None
     assert ctx.camera is not None
 
-    for agent in ctx.agents:
+    for agent in ctx.active_agents:
         agent.set_debug_mode(agent is ctx.best_agent)
 
     pr.begin_mode_2d(ctx.camera.camera)
@@ -211,6 +383,9 @@ def draw() -> None:
     for entity in ctx.entities:
         entity.draw(1)
 
+    for agent in ctx.active_agents:
+        agent.draw(1)
+
     pr.end_mode_2d()
 
     match ctx.best_agent:
@@ -3,8 +3,9 @@ import pyray as pr
 import taxi_driver_env.resources as res
 from taxi_driver_env.constants import WINDOW_HEIGHT, WINDOW_WIDTH
 from taxi_driver_env.game.cameras.camera_zoomer import CameraZoomer
-from taxi_driver_env.game.entities import world
+from taxi_driver_env.game.entities import world, world_chunks
 from taxi_driver_env.game.entities.taxi_driver import TaxiDriver
+from taxi_driver_env.math.geom import Segment
 
 BORDER = 0.01 * WINDOW_WIDTH
 BOUND_WIDTH = 0.128 * WINDOW_WIDTH
@@ -41,6 +42,12 @@ class Minimap:
         y2 = int(max((p.xy[1] for p in self.player.car.corridor.points)))
         return pr.Rectangle(x1, y1, x2 - x1, y2 - y1)
 
+    def get_skeleton(self) -> list[Segment]:
+        if not self.player.car.large_map:
+            return world.get_singleton().borders.skeleton
+        chunks = world_chunks.get_chunks(self.player.car.curr_pos, world_chunks.CHUNK_SIZE * 0.5)
+        return [x for chunk in chunks for x in chunk.world.borders.skeleton]
+
     def reset(self) -> None:
         self.frame_buffer = pr.load_render_texture(int(WINDOW_WIDTH * MAP_RATIO), WINDOW_HEIGHT)
         self.camera = CameraZoomer(
@@ -59,7 +66,7 @@ class Minimap:
         pr.clear_background(pr.WHITE)
         pr.begin_mode_2d(self.camera.camera)
 
-        for bone in world.get_singleton().borders.skeleton:
+        for bone in self.get_skeleton():
             bone.draw(5, pr.GRAY)
 
         for bone in self.player.car.corridor.skeleton:
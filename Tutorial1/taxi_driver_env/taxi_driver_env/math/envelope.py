@@ -1,24 +1,28 @@
 import random
 from dataclasses import dataclass
-from functools import lru_cache, reduce
-from typing import Any, Callable, Iterable
+from functools import cached_property
+from typing import Any, Callable, Optional
 
 import numpy as np
-from tqdm import tqdm, trange
+from tqdm import tqdm
 
 from taxi_driver_env.constants import VIRTUAL_WIDTH
 from taxi_driver_env.math import graph
 from taxi_driver_env.math.geom import (
     Point,
+    PointArray,
     Segment,
-    break_segment,
+    SegmentArray,
     distance,
-    distance_point_segment,
+    intersect_segments,
     nearest_point_segment,
-    point_in_polygon,
-    polygon_to_segments,
+    points_in_polygon,
+    points_in_polygons,
+    polygon_to_segment_array,
+    split_segment,
 )
-from taxi_driver_env.math.linalg import lst_2_vec, normalize
+from taxi_driver_env.math.linalg import EPS, lst_2_vec, normalize
+from taxi_driver_env.math.spatial import BoxGrid, DistanceField, SegmentGrid
 
 Location = tuple[Segment, Point]
 ProgressCallBack = Callable[[float], None]
@@ -34,6 +38,45 @@ class Envelope:
     def points(self) -> list[Point]:
         return [s.start for s in self.segments]
 
+    @cached_property
+    def polygon(self) -> PointArray:
+        return PointArray.from_points(self.points)
+
+    @cached_property
+    def segment_array(self) -> SegmentArray:
+        return self.grid.array
+
+    @cached_property
+    def grid(self) -> SegmentGrid:
+        return SegmentGrid(self.segments)
+
+    @cached_property
+    def distance_field(self) -> DistanceField:
+        return DistanceField(self.segment_array, band=self.width)
+
+    @cached_property
+    def skeleton_grid(self) -> SegmentGrid:
+        return SegmentGrid(self.skeleton)
+
+    @cached_property
+    def skeleton_field(self) -> DistanceField:
+        return DistanceField(self.skeleton_grid.array, band=self.width, signed=False)
+
+    @cached_property
+    def bone_indices(self) -> dict[int, int]:
+        return {id(x): i for i, x in enumerate(self.skeleton)}
+
+    @cached_property
+    def bone_neighbours(self) -> list[list[int]]:
+        bones_at: dict[tuple[float, float], set[int]] = {}
+        for i, x in enumerate(self.skeleton):
+            for p in (x.start, x.end):
+                bones_at.setdefault((p.xy[0], p.xy[1]), set()).add(i)
+        return [
+            sorted(bones_at[(x.start.xy[0], x.start.xy[1])] | bones_at[(x.end.xy[0], x.end.xy[1])])
+            for x in self.skeleton
+        ]
+
     def __eq__(self, other: Any) -> bool:
         if not isinstance(other, Envelope):
             return NotImplemented
@@ -42,30 +85,56 @@ class Envelope:
     def __hash__(self) -> int:
         return id(self)
 
-    def get_nearest_location(self, position: Point) -> Location:
+    def get_nearest_location(self, position: Point, hint: Optional[Segment] = None) -> Location:
         nearest_location = lambda x: (x, nearest_point_segment(position, x, True))
         closest_distance = lambda x: distance(position, x[1])
-        location = min(map(nearest_location, self.skeleton), key=closest_distance)
+
+        # The bones adjacent to the hint bound the distance to the nearest bone, only the bones within this bound are
+        # then fetched from the spatial index. The scan in skeleton order keeps the ties as a full scan would.
+
+        indices = None
+        i = self.bone_indices.get(id(hint))
+        if i is not None:
+            local = min(
+                map(nearest_location, (self.skeleton[j] for j in self.bone_neighbours[i])), key=closest_distance
+            )
+            indices = self.skeleton_grid.query_indices(position, closest_distance(local) + EPS)
+        if indices is None or len(indices) == 0:
+            indices = self.skeleton_grid.query_nearest_indices(position)
+
+        location = min(map(nearest_location, (self.skeleton[j] for j in np.sort(indices))), key=closest_distance)
         return location  # type: ignore
 
+    def get_track_nearest(self, position: Point) -> Optional[Point]:
+        return self.skeleton_field.query_nearest(position)
+
+    def pack_location(self, location: Location) -> list[float]:
+        seg, pos = location
+        i = next((i for i, x in enumerate(self.skeleton) if x is seg), None)
+        return [i if i is not None else self.skeleton.index(seg), *pos.xy]
+
+    def unpack_location(self, state: np.ndarray) -> Location:
+        return self.skeleton[int(state[0])], Point(state[1:3].copy())
+
     def get_random_location(self) -> Location:
         s = random.choice(self.skeleton)
         t = random.random()
         return s, Point(s.start.xy * (1 - t) + s.end.xy * t)
 
 
-@lru_cache(256)
-def get_nearest_segments(envelope: Envelope, position: Point, radius: int) -> list[Segment]:
-    radius = max(radius, VIRTUAL_WIDTH)
-    nearest_distance = lambda x: distance_point_segment(position, x, True)
-    return sorted(
-        (x for x in envelope.segments if nearest_distance(x) < radius),
-        key=nearest_distance,
-    )
+def get_nearest_segments(envelope: Envelope, position: Point, radius: float) -> list[Segment]:
+    return envelope.grid.query(position, radius)
+
+
+def get_nearest_segment_array(envelope: Envelope, position: Point, radius: float) -> SegmentArray:
+    return envelope.grid.query_array(position, radius)
 
 
 def generare_borders_from_spatial_graph(
-    agraph: graph.SpatialGraph, width: int, progress_callbacks: list[ProgressCallBack]
+    agraph: graph.SpatialGraph,
+    width: int,
+    progress_callbacks: list[ProgressCallBack],
+    bounds: Optional[tuple[int, int, int, int]] = None,
 ) -> tuple[Envelope, list[Point]]:
     with tqdm(
         total=4,
@@ -75,7 +144,7 @@ def generare_borders_from_spatial_graph(
     ) as pbar:
         envelopes = [_generate_envelope(e, width) for e in agraph.edges]
         _pbar_update_and_call(pbar, progress_callbacks)
-        anchors = _generate_anchors(envelopes)
+        anchors = _generate_anchors(envelopes, bounds=bounds)
         _pbar_update_and_call(pbar, progress_callbacks)
         envelopes = _break_envelopes(envelopes)
         _pbar_update_and_call(pbar, progress_callbacks)
@@ -108,60 +177,73 @@ def _generate_envelope(edge: graph.SpatialEdge, width: int, slices: int = 10) ->
     vx, vy = normalize(lst_2_vec([x2 - x1, y2 - y1]))
 
     points = []
-    points.append(Point(lst_2_vec([x1 - vy * width * 0.5, y1 + vx * width * 0.5])))
-    points.append(Point(lst_2_vec([x2 - vy * width * 0.5, y2 + vx * width * 0.5])))
+    points.append(lst_2_vec([x1 - vy * width * 0.5, y1 + vx * width * 0.5]))
+    points.append(lst_2_vec([x2 - vy * width * 0.5, y2 + vx * width * 0.5]))
 
     b = np.arctan2(vx, -vy)
     for i in range(slices):
         a = b - np.pi * i / slices
         c, s = np.cos(a), np.sin(a)
-        points.append(Point(lst_2_vec([x2 + c * width * 0.5, y2 + s * width * 0.5])))
+        points.append(lst_2_vec([x2 + c * width * 0.5, y2 + s * width * 0.5]))
 
-    points.append(Point(lst_2_vec([x2 + vy * width * 0.5, y2 - vx * width * 0.5])))
-    points.append(Point(lst_2_vec([x1 + vy * width * 0.5, y1 - vx * width * 0.5])))
+    points.append(lst_2_vec([x2 + vy * width * 0.5, y2 - vx * width * 0.5]))
+    points.append(lst_2_vec([x1 + vy * width * 0.5, y1 - vx * width * 0.5]))
 
     b = np.arctan2(-vx, vy)
     for i in range(slices):
         a = b - np.pi * i / slices
         c, s = np.cos(a), np.sin(a)
-        points.append(Point(lst_2_vec([x1 + c * width * 0.5, y1 + s * width * 0.5])))
+        points.append(lst_2_vec([x1 + c * width * 0.5, y1 + s * width * 0.5]))
 
-    segments = polygon_to_segments(points)
+    segments = polygon_to_segment_array(PointArray(np.array(points))).to_segments()
 
     return Envelope(segments, [edge.segment], width)
 
 
-def _generate_anchors(envelopes: list[Envelope], step: int = 20):
-    def anchors() -> Iterable[Point]:
-        for i in range(-VIRTUAL_WIDTH, VIRTUAL_WIDTH + 1, step):
-            for j in range(-VIRTUAL_WIDTH, VIRTUAL_WIDTH + 1, step):
-                yield Point(lst_2_vec([j, i]))
-
-    anchor_in_polygon = lambda x, y: point_in_polygon(x, y.points)
-    anchor_in_polygons = lambda x: not any((anchor_in_polygon(x, y) for y in envelopes))
-    return [x for x in anchors() if anchor_in_polygons(x)]
+def _generate_anchors(
+    envelopes: list[Envelope], step: int = 20, bounds: Optional[tuple[int, int, int, int]] = None
+) -> list[Point]:
+    x1, y1, x2, y2 = bounds if bounds is not None else (-VIRTUAL_WIDTH, -VIRTUAL_WIDTH, VIRTUAL_WIDTH, VIRTUAL_WIDTH)
+    i, j = np.meshgrid(
+        np.arange(y1, y2 + 1, step),
+        np.arange(x1, x2 + 1, step),
+        indexing="ij",
+    )
+    anchors = PointArray(np.stack([j.ravel(), i.ravel()], axis=1).astype(np.float64))
+    inside = points_in_polygons(anchors, [x.polygon for x in envelopes]).any(axis=1)
+    return [Point(x.copy()) for x in anchors.xy[~inside]]
 
 
 def _break_envelopes(envelopes: list[Envelope]) -> list[Envelope]:
-    def break_envelope(e: Envelope, s: Segment) -> Envelope:
-        segments: list[Segment] = reduce(lambda a, x: [*a, *x], (break_segment(s, x) for x in e.segments), [])
-        return Envelope(segments, e.skeleton, e.width)
-
-    def break_two_envelopes(e1: Envelope, e2: Envelope) -> tuple[Envelope, Envelope]:
-        return (
-            reduce(break_envelope, e2.segments, e1),
-            reduce(break_envelope, e1.segments, e2),
-        )
-
-    result = envelopes
-    n = len(envelopes)
-
-    for i in trange(n, desc="Break", ncols=80, bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt}"):
-        head, acc = result[i], []
-        for j in range(i + 1, n):
-            head, tail = break_two_envelopes(head, result[j])
-            acc.append(tail)
-        result = [*result[:i], head, *acc]
+    # All the border segments are bucketed in a grid, only the segments of different envelopes sharing a cell are
+    # intersected. Each segment is then split once at all its intersections, sorted along it.
+
+    segments = [s for e in envelopes for s in e.segments]
+    owners = np.repeat(np.arange(len(envelopes)), [len(e.segments) for e in envelopes])
+    grid = SegmentGrid(segments)
+
+    points: dict[tuple[int, int], np.ndarray] = {}
+    for cell in grid.cells.values():
+        cell_segments = grid.array.take(cell)
+        _, _, cell_points, hits = intersect_segments(cell_segments, cell_segments, False)
+        a, b = np.meshgrid(cell, cell, indexing="ij")
+        mask = hits & (a < b) & (owners[a] != owners[b])
+        points.update(zip(zip(a[mask].tolist(), b[mask].tolist(), strict=True), cell_points[mask], strict=True))
+
+    cuts: dict[int, list[Point]] = {}
+    for (i, j), xy in sorted(points.items(), key=lambda x: x[0]):
+        p = Point(xy)
+        cuts.setdefault(i, []).append(p)
+        cuts.setdefault(j, []).append(p)
+
+    result = []
+    offset = 0
+    for e in tqdm(envelopes, desc="Break", ncols=80, bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt}"):
+        pieces: list[Segment] = []
+        for i, s in enumerate(e.segments, offset):
+            pieces.extend(split_segment(s, cuts.get(i, [])))
+        result.append(Envelope(pieces, e.skeleton, e.width))
+        offset += len(e.segments)
     return result
 
 
@@ -170,27 +252,49 @@ def _union_envelopes(envelopes: list[Envelope]) -> Envelope:
     skeleton = [e.skeleton[0] for e in envelopes]
     width = envelopes[0].width
 
-    segment_in_polygon = lambda y: lambda x: point_in_polygon(y.middle, x.points)
-
-    for e in tqdm(
-        envelopes,
-        desc="Union",
-        ncols=80,
-        bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt}",
+    # The middle of a segment is only tested against the envelopes whose bounds contain it, and the kept segments
+    # are hashed by their quantized end points to find the near duplicates.
+
+    polygons = [x.polygon for x in envelopes]
+    bounds = BoxGrid(np.array([[*x.xy.min(axis=0), *x.xy.max(axis=0)] for x in polygons]).reshape(-1, 4))
+    kept_at: dict[tuple[int, int], list[Segment]] = {}
+
+    def is_kept(s: Segment) -> bool:
+        i, j = _quantize(s.start)
+        candidates = (x for di in (-1, 0, 1) for dj in (-1, 0, 1) for x in kept_at.get((i + di, j + dj), []))
+        return any(x.almost(s) for x in candidates)
+
+    def keep(s: Segment) -> None:
+        segments_to_keep.append(s)
+        for p in {_quantize(s.start), _quantize(s.end)}:
+            kept_at.setdefault(p, []).append(s)
+
+    for k, e in enumerate(
+        tqdm(
+            envelopes,
+            desc="Union",
+            ncols=80,
+            bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt}",
+        )
     ):
-        for s in e.segments:
-            inside = any(
-                map(
-                    segment_in_polygon(s),
-                    filter(lambda x: x != e, envelopes),
-                )
-            )
-            if not (inside or s.start.almost(s.end) or any((x.almost(s) for x in segments_to_keep))):
-                segments_to_keep.append(s)
+        middles = PointArray.from_points(s.middle for s in e.segments)
+        insides = np.zeros(len(middles), dtype=np.bool_)
+        point_indices, polygon_indices = bounds.query_points(middles.xy)
+        for j in np.unique(polygon_indices[polygon_indices != k]):
+            selected = point_indices[polygon_indices == j]
+            insides[selected] |= points_in_polygon(PointArray(middles.xy[selected]), polygons[j])
+        for s, inside in zip(e.segments, insides, strict=True):
+            if not (inside or s.start.almost(s.end) or is_kept(s)):
+                keep(s)
 
     return Envelope(segments_to_keep, skeleton, width)
 
 
+def _quantize(p: Point, eps: float = 0.0001) -> tuple[int, int]:
+    i, j = np.floor(p.xy / eps)
+    return int(i), int(j)
+
+
 def _pbar_update_and_call(pbar: tqdm, progress_callbacks: list[ProgressCallBack]):
     pbar.update(1)
     for progress_callback in progress_callbacks:
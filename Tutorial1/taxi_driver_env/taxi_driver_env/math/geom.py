@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Any, Iterable, Optional
+from typing import Any, Iterable, Iterator, Optional
 
 import numpy as np
 import numpy.typing as npt
@@ -90,6 +90,81 @@ class Segment:
         )
 
 
+@dataclass
+class PointArray:
+    xy: npt.NDArray[np.float64]
+
+    @staticmethod
+    def from_points(points: Iterable[Point]) -> PointArray:
+        return PointArray(np.array([p.xy for p in points], dtype=np.float64).reshape(-1, 2))
+
+    def to_points(self) -> list[Point]:
+        return list(self)
+
+    def __len__(self) -> int:
+        return len(self.xy)
+
+    def __getitem__(self, i: int) -> Point:
+        return Point(self.xy[i])
+
+    def __iter__(self) -> Iterator[Point]:
+        return (Point(x) for x in self.xy)
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, PointArray):
+            return NotImplemented
+        return np.array_equal(self.xy, other.xy)
+
+    __hash__ = None  # type: ignore
+
+
+@dataclass
+class SegmentArray:
+    coords: npt.NDArray[np.float64]
+
+    @staticmethod
+    def from_segments(segments: Iterable[Segment]) -> SegmentArray:
+        return SegmentArray(np.array([[*s.start.xy, *s.end.xy] for s in segments], dtype=np.float64).reshape(-1, 4))
+
+    def to_segments(self) -> list[Segment]:
+        return list(self)
+
+    @property
+    def starts(self) -> PointArray:
+        return PointArray(self.coords[:, :2])
+
+    @property
+    def ends(self) -> PointArray:
+        return PointArray(self.coords[:, 2:])
+
+    @property
+    def lengths(self) -> npt.NDArray[np.float64]:
+        return np.linalg.norm(self.coords[:, 2:] - self.coords[:, :2], axis=1)
+
+    @property
+    def middles(self) -> PointArray:
+        return PointArray((self.coords[:, :2] + self.coords[:, 2:]) * 0.5)
+
+    def take(self, indices: npt.NDArray[np.intp] | list[int]) -> SegmentArray:
+        return SegmentArray(self.coords[indices])
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    def __getitem__(self, i: int) -> Segment:
+        return Segment(Point(self.coords[i, :2]), Point(self.coords[i, 2:]))
+
+    def __iter__(self) -> Iterator[Segment]:
+        return (Segment(Point(x[:2]), Point(x[2:])) for x in self.coords)
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, SegmentArray):
+            return NotImplemented
+        return np.array_equal(self.coords, other.coords)
+
+    __hash__ = None  # type: ignore
+
+
 def distance(p1: Point, p2: Point) -> float:
     return la.norm(p2.xy - p1.xy)
 
@@ -105,29 +180,36 @@ def point_on_segment(p: Point, seg: Segment) -> bool:
     return (ex - sx) * (py - sy) == (ey - sy) * (px - sx)
 
 
-def point_in_polygon(point: Point, polygon: list[Point], strict: bool = True) -> bool:
-    x, y = point.xy
-    n = len(polygon)
-    inside = False
+def point_in_polygon(point: Point, polygon: list[Point] | PointArray, strict: bool = True) -> bool:
+    return la.point_in_polygon_jit(point.xy, _to_polygon_array(polygon), strict)
 
-    p1, (p1x, p1y) = polygon[0], polygon[0].xy
-    for i in range(1, n + 1):
-        p2, (p2x, p2y) = polygon[i % n], polygon[i % n].xy
 
-        if point_on_segment(point, Segment(p1, p2)):
-            inside = not strict
-            break
+def points_in_polygon(points: PointArray, polygon: list[Point] | PointArray, strict: bool = True) -> np.ndarray:
+    return points_in_polygons(points, [polygon], strict)[:, 0]
 
-        if min(p1y, p2y) < y <= max(p1y, p2y) and x <= max(p1x, p2x):
-            xinters = np.interp((y - p1y) / (p2y - p1y), [0, 1], [p1x, p2x])
-            if p1x == p2x or x < xinters:
-                inside = not inside
-        p1, (p1x, p1y) = p2, (p2x, p2y)
 
-    return inside
+def points_in_polygons(
+    points: PointArray, polygons: list[list[Point] | PointArray], strict: bool = True
+) -> npt.NDArray[np.bool_]:
+    vertice = [_to_polygon_array(x) for x in polygons]
+    offsets = np.cumsum([0, *(len(x) for x in vertice)], dtype=np.int64)
+    return la.points_in_polygons_jit(
+        np.ascontiguousarray(points.xy, dtype=np.float64),
+        np.concatenate(vertice) if vertice else np.zeros((0, 2)),
+        offsets,
+        strict,
+    )
 
 
-def polygon_to_segments(polygon: list[Point], closed: bool = True) -> list[Segment]:
+def _to_polygon_array(polygon: list[Point] | PointArray) -> npt.NDArray[np.float64]:
+    if isinstance(polygon, PointArray):
+        return np.ascontiguousarray(polygon.xy, dtype=np.float64)
+    return PointArray.from_points(polygon).xy
+
+
+def polygon_to_segments(polygon: list[Point] | PointArray, closed: bool = True) -> list[Segment]:
+    if isinstance(polygon, PointArray):
+        return polygon_to_segment_array(polygon, closed).to_segments()
     segments = []
     n = len(polygon)
     p1 = polygon[0]
@@ -138,11 +220,23 @@ def polygon_to_segments(polygon: list[Point], closed: bool = True) -> list[Segme
     return segments
 
 
+def polygon_to_segment_array(polygon: PointArray, closed: bool = True) -> SegmentArray:
+    starts = polygon.xy if closed else polygon.xy[:-1]
+    ends = np.roll(polygon.xy, -1, axis=0) if closed else polygon.xy[1:]
+    return SegmentArray(np.hstack([starts, ends]))
+
+
 def intersect(seg1: Segment, seg2: Segment, strict: bool = True) -> Optional[Point]:
     x = la.intersect_jit(seg1.start.xy, seg1.end.xy, seg2.start.xy, seg2.end.xy, strict)
     return Point(x) if x is not None else None
 
 
+def intersect_segments(
+    segments1: SegmentArray, segments2: SegmentArray, strict: bool = True
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64], npt.NDArray[np.float64], npt.NDArray[np.bool_]]:
+    return la.intersect_segments_jit(segments1.coords, segments2.coords, strict)
+
+
 def distance_point_segment(p: Point, seg: Segment, closest: bool = False) -> float:
     return la.distance_point_segment_jit(p.xy, seg.start.xy, seg.end.xy, closest)
 
@@ -156,14 +250,29 @@ def collision_circle_segment(center: Point, radius: float, seg: Segment) -> Opti
     return la.collision_circle_segment_jit(center.xy, radius, seg.start.xy, seg.end.xy)
 
 
+def collision_circle_segments(
+    center: Point, radius: float, segments: SegmentArray
+) -> Optional[npt.NDArray[np.float64]]:
+    return la.collision_circle_segments_jit(center.xy, radius, segments.coords)
+
+
+def sweep_circle_segments(
+    start: Point, end: Point, radius: float, segments: SegmentArray
+) -> Optional[tuple[float, npt.NDArray[np.float64]]]:
+    toi, normal = la.sweep_circle_segments_jit(start.xy, end.xy, radius, segments.coords)
+    return (toi, normal) if toi <= 1 else None
+
+
 def cast_ray_segments(
     position: Point,
     direction: npt.NDArray[np.float64],
     length: float,
-    segments: Iterable[Segment],
+    segments: Iterable[Segment] | SegmentArray,
     ordered: bool = True,
 ) -> Segment:
     target = Point(length * direction + position.xy)
+    if isinstance(segments, SegmentArray):
+        return Segment(position, Point(la.cast_ray_segments_jit(position.xy, target.xy, segments.coords, ordered)))
     ray = Segment(position, target)
     intersect_with_ray = lambda x: intersect(ray, x, False)
     if ordered:
@@ -178,6 +287,19 @@ def cast_ray_segments(
     return Segment(position, point)
 
 
+def split_segment(seg: Segment, points: list[Point]) -> list[Segment]:
+    u = seg.end.xy - seg.start.xy
+    along = lambda x: float(np.dot(x.xy - seg.start.xy, u))
+    pieces = []
+    start = seg.start
+    for p in sorted(points, key=along):
+        if not start.almost(p) and not seg.end.almost(p):
+            pieces.append(Segment(start, p))
+            start = p
+    pieces.append(Segment(start, seg.end))
+    return pieces
+
+
 def break_segment(seg1: Segment, seg2: Segment) -> list[Segment]:
     p = intersect(seg1, seg2, False)
     if p is not None and not seg2.start.almost(p) and not seg2.end.almost(p):
@@ -1,25 +1,32 @@
 from __future__ import annotations
 
 import heapq
+import math
 import random
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import cached_property
 from random import choice
-from typing import Iterable
+from typing import Iterable, Optional
 
 import numpy as np
+import numpy.typing as npt
 import pyray as pr
+from scipy.spatial import cKDTree
 
 from taxi_driver_env.constants import VIRTUAL_WIDTH
 from taxi_driver_env.math.geom import (
     Point,
     Segment,
+    SegmentArray,
     distance,
-    intersect,
+    intersect_segments,
 )
 from taxi_driver_env.math.linalg import lst_2_vec
 
 EDGE_COLOR = pr.Color(0, 0, 0, 128)
 VERTEX_COLOR = pr.Color(0, 0, 255, 128)
+ROUTING_CACHE_SIZE = 64
 
 
 @dataclass
@@ -30,7 +37,7 @@ class SpatialVertex:
         self.point.draw(5.0, color)
 
     def __lt__(self, other):
-        return distance(self.point, other.point) < 0
+        return tuple(self.point.xy) < tuple(other.point.xy)
 
     def __hash__(self) -> int:
         return self.point.__hash__()
@@ -54,28 +61,98 @@ class SpatialGraph:
     vertice: list[SpatialVertex]
     edges: list[SpatialEdge]
 
-    def get_edges_from_vextex(self, v: SpatialVertex) -> Iterable[tuple[SpatialEdge, SpatialVertex]]:
-        is_neighboor = lambda x: v in (x.start, x.end)
-        other_vertex = lambda x: (x, x.end if x.start == v else x.start)
-        return map(other_vertex, filter(is_neighboor, self.edges))
+    @cached_property
+    def adjacency(self) -> dict[SpatialVertex, list[tuple[SpatialEdge, SpatialVertex, float]]]:
+        adjacency: dict[SpatialVertex, list[tuple[SpatialEdge, SpatialVertex, float]]] = {}
+        for e in self.edges:
+            weight = e.segment.length
+            adjacency.setdefault(e.start, []).append((e, e.end, weight))
+            if e.end != e.start:
+                adjacency.setdefault(e.end, []).append((e, e.start, weight))
+        return adjacency
 
-    def get_shortest_path(self, start: SpatialVertex, stop: SpatialVertex) -> SpatialGraph:
-        weight = lambda x: x[0]
-        distances = {x: 0.0 if x == start else np.inf for x in self.vertice}
-        unvisited = sorted(((distances[x], x) for x in self.vertice), key=weight)
-        prev = {}
+    def get_edges_from_vextex(self, v: SpatialVertex) -> Iterable[tuple[SpatialEdge, SpatialVertex]]:
+        return ((e, x) for e, x, _ in self.adjacency.get(v, []))
+
+    @cached_property
+    def routes(self) -> RoutingTable:
+        return RoutingTable(self)
+
+    @cached_property
+    def tree(self) -> cKDTree:
+        return cKDTree(np.array([x.point.xy for x in self.vertice]).reshape(-1, 2))
+
+    def get_nearest_vertex(self, point: Point) -> SpatialVertex:
+        _, i = self.tree.query(point.xy)
+        return self.vertice[i]
+
+    def get_shortest_path(self, start: SpatialVertex, stop: SpatialVertex, heuristic: bool = False) -> SpatialGraph:
+        return self.get_path(start, stop, self.search(start, stop, heuristic))
+
+    def search(
+        self, start: SpatialVertex, stop: Optional[SpatialVertex] = None, heuristic: bool = False
+    ) -> dict[SpatialVertex, SpatialVertex]:
+        # Dijkstra, or A* with the straight line distance to the stop which never overestimates a road distance. Without
+        # a stop, the predecessors of all the reachable vertice are returned.
+
+        if heuristic and stop is not None:
+            gx, gy = stop.point.xy
+            estimate = lambda x: math.hypot(x.point.xy[0] - gx, x.point.xy[1] - gy)
+        else:
+            estimate = lambda x: 0.0
+        distances = dict.fromkeys(self.vertice, np.inf)
+        distances[start] = 0.0
+        unvisited = [(estimate(start), 0.0, start)]
+        prev: dict[SpatialVertex, SpatialVertex] = {}
 
         while unvisited:
-            dist_u, u = heapq.heappop(unvisited)
+            _, dist_u, u = heapq.heappop(unvisited)
             if u == stop:
                 break
-            for e, v in self.get_edges_from_vextex(u):
-                alt = dist_u + e.segment.length
+            if dist_u > distances[u]:
+                continue
+            for _, v, weight in self.adjacency.get(u, []):
+                alt = dist_u + weight
+                if alt < distances[v]:
+                    prev[v] = u
+                    distances[v] = alt
+                    heapq.heappush(unvisited, (alt + estimate(v), alt, v))
+
+        return prev
+
+    def search_nearest(
+        self, starts: Iterable[SpatialVertex]
+    ) -> tuple[dict[SpatialVertex, SpatialVertex], dict[SpatialVertex, SpatialVertex]]:
+        # A multi-source Dijkstra, all the starts are pushed at a null distance so every vertex is reached from its
+        # nearest start. The origins map the reachable vertice to this start, the predecessors lead back to it.
+
+        distances = dict.fromkeys(self.vertice, np.inf)
+        origins: dict[SpatialVertex, SpatialVertex] = {}
+        unvisited = []
+        for x in starts:
+            distances[x] = 0.0
+            origins[x] = x
+            unvisited.append((0.0, x))
+        heapq.heapify(unvisited)
+        prev: dict[SpatialVertex, SpatialVertex] = {}
+
+        while unvisited:
+            dist_u, u = heapq.heappop(unvisited)
+            if dist_u > distances[u]:
+                continue
+            for _, v, weight in self.adjacency.get(u, []):
+                alt = dist_u + weight
                 if alt < distances[v]:
                     prev[v] = u
+                    origins[v] = origins[u]
                     distances[v] = alt
                     heapq.heappush(unvisited, (alt, v))
 
+        return prev, origins
+
+    def get_path(
+        self, start: SpatialVertex, stop: SpatialVertex, prev: dict[SpatialVertex, SpatialVertex]
+    ) -> SpatialGraph:
         vertice: list[SpatialVertex] = []
         u = stop
         while prev.get(u) and u != start:
@@ -93,11 +170,18 @@ class SpatialGraph:
         new_edge = SpatialEdge(v, self.vertice[0])
         self.vertice.insert(0, v)
         self.edges.insert(0, new_edge)
+        self._invalidate()
 
     def append_vertex(self, v: SpatialVertex):
         new_edge = SpatialEdge(self.vertice[-1], v)
         self.vertice.append(v)
         self.edges.append(new_edge)
+        self._invalidate()
+
+    def _invalidate(self):
+        self.__dict__.pop("adjacency", None)
+        self.__dict__.pop("routes", None)
+        self.__dict__.pop("tree", None)
 
     def draw(self):
         for seg in self.edges:
@@ -106,7 +190,57 @@ class SpatialGraph:
             vertex.draw()
 
 
-def generate_random():
+@dataclass
+class RoutingTable:
+    graph: SpatialGraph
+    cache_size: int = ROUTING_CACHE_SIZE
+    indices: dict[SpatialVertex, int] = field(init=False, repr=False)
+    points: npt.NDArray[np.float64] = field(init=False, repr=False)
+    predecessors: OrderedDict[int, npt.NDArray[np.int64]] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        # The predecessors on the shortest paths from a vertex are searched on its first route, a route is then walked
+        # back from its stop. Only the rows of the most recently used starts are kept, so the memory stays linear in
+        # the number of vertice whatever the size of the graph.
+
+        vertice = self.graph.vertice
+        self.indices = {x: i for i, x in enumerate(vertice)}
+        self.points = np.array([x.point.xy for x in vertice]).reshape(-1, 2)
+        self.predecessors = OrderedDict()
+
+    def get_predecessors(self, start: SpatialVertex) -> npt.NDArray[np.int64]:
+        i = self.indices[start]
+        predecessors = self.predecessors.get(i)
+        if predecessors is not None:
+            self.predecessors.move_to_end(i)
+            return predecessors
+
+        predecessors = np.full(len(self.graph.vertice), -1, dtype=np.int64)
+        for v, u in self.graph.search(start).items():
+            predecessors[self.indices[v]] = self.indices[u]
+        self.predecessors[i] = predecessors
+        if len(self.predecessors) > self.cache_size:
+            self.predecessors.popitem(last=False)
+        return predecessors
+
+    def get_shortest_path(self, start: SpatialVertex, stop: SpatialVertex) -> SpatialGraph:
+        predecessors = self.get_predecessors(start)
+        prev = {}
+        u = self.indices[stop]
+        while predecessors[u] >= 0 and u not in prev:
+            prev[u] = int(predecessors[u])
+            u = prev[u]
+        vertice = self.graph.vertice
+        return self.graph.get_path(start, stop, {vertice[v]: vertice[u] for v, u in prev.items()})
+
+    def get_farthest_vertex(self, v: SpatialVertex) -> SpatialVertex:
+        # The first vertex at the largest straight line distance, as a scan in vertice order
+
+        distances = np.sqrt(np.sum((self.points[self.indices[v]] - self.points) ** 2, axis=1))
+        return self.graph.vertice[int(np.argmax(distances))]
+
+
+def generate_random(num_vertice: int = 20, num_edges: int = 25, min_distance: int = 100, k: int = 3):
     def generate_vertice(num: int, min: int) -> list[SpatialVertex]:
         rand = lambda: random.randrange(-VIRTUAL_WIDTH, VIRTUAL_WIDTH)
         vertice: list[SpatialVertex] = []
@@ -125,11 +259,16 @@ def generate_random():
         edges: list[SpatialEdge] = []
         n = 0
 
-        is_valid = lambda x, y: x.segment != y.segment and not intersect(x.segment, y.segment)
+        def is_valid(e: SpatialEdge) -> bool:
+            if not edges:
+                return True
+            others = SegmentArray.from_segments([x.segment for x in edges])
+            _, _, _, hits = intersect_segments(SegmentArray.from_segments([e.segment]), others)
+            return not hits.any() and all(e.segment != x.segment for x in edges)
 
         while n < num:
             e = generate_edge(vertice, k)
-            if all((is_valid(e, x) for x in edges)):
+            if is_valid(e):
                 edges.append(e)
                 n += 1
         return edges
@@ -141,6 +280,84 @@ def generate_random():
         end = choice(choices[:k])
         return SpatialEdge(start, end)
 
-    vertice = generate_vertice(20, 100)
-    edges = generate_edges(vertice, 25, 3)
+    vertice = generate_vertice(num_vertice, min_distance)
+    edges = generate_edges(vertice, num_edges, k)
+    return SpatialGraph(vertice, edges)
+
+
+def generate_city(
+    num_vertice: int, num_edges: int, min_distance: float = 100, width: Optional[float] = None, k: int = 3
+) -> SpatialGraph:
+    # A Poisson disk sampling fits the vertice in a square large enough to hold them all. The edges are then drawn
+    # among the k nearest neighbours, each one is only tested against the accepted edges sharing its grid cells.
+
+    if width is None:
+        width = 0.75 * min_distance * np.sqrt(num_vertice)
+    points = _poisson_disk_sampling(num_vertice, min_distance, width)
+    vertice = [SpatialVertex(Point(x)) for x in points]
+    if len(vertice) <= 1:
+        return SpatialGraph(vertice, [])
+
+    _, neighbours = cKDTree(points).query(points, min(k + 1, len(points)))
+    candidates = sorted({(min(i, j), max(i, j)) for i, row in enumerate(neighbours) for j in row[1:]})
+    random.shuffle(candidates)
+
+    cell_size = 2 * min_distance
+    cells: dict[tuple[int, int], list[int]] = {}
+    coords = np.zeros((num_edges, 4))
+    edges: list[SpatialEdge] = []
+    for i, j in candidates:
+        if len(edges) >= num_edges:
+            break
+        segment = np.array([[*points[i], *points[j]]])
+        lower = np.floor(np.minimum(points[i], points[j]) / cell_size).astype(np.int64)
+        upper = np.floor(np.maximum(points[i], points[j]) / cell_size).astype(np.int64)
+        keys = [(a, b) for a in range(lower[0], upper[0] + 1) for b in range(lower[1], upper[1] + 1)]
+        others = sorted({x for key in keys for x in cells.get(key, [])})
+        if others and intersect_segments(SegmentArray(segment), SegmentArray(coords[others]))[3].any():
+            continue
+        for key in keys:
+            cells.setdefault(key, []).append(len(edges))
+        coords[len(edges)] = segment[0]
+        edges.append(SpatialEdge(vertice[i], vertice[j]))
     return SpatialGraph(vertice, edges)
+
+
+def _poisson_disk_sampling(num: int, min_distance: float, width: float, tries: int = 30) -> npt.NDArray[np.float64]:
+    # Bridson, the grid cells are small enough to hold at most one point, so only the 5x5 cells around a candidate
+    # may hold a point too close to it.
+
+    cell_size = min_distance / math.sqrt(2)
+    size = math.ceil(2 * width / cell_size)
+    grid = [[-1] * size for _ in range(size)]
+    get_cell = lambda x, y: (int((x + width) / cell_size), int((y + width) / cell_size))
+
+    def is_valid(x: float, y: float) -> bool:
+        ci, cj = get_cell(x, y)
+        for i in range(max(ci - 2, 0), min(ci + 3, size)):
+            for j in range(max(cj - 2, 0), min(cj + 3, size)):
+                k = grid[i][j]
+                if k >= 0 and (points[k][0] - x) ** 2 + (points[k][1] - y) ** 2 < min_distance**2:
+                    return False
+        return True
+
+    points = [(random.uniform(-width, width), random.uniform(-width, width))]
+    ci, cj = get_cell(*points[0])
+    grid[ci][cj] = 0
+    active = [0]
+    while active and len(points) < num:
+        i = random.randrange(len(active))
+        px, py = points[active[i]]
+        for _ in range(tries):
+            a, r = random.uniform(0, 2 * math.pi), random.uniform(min_distance, 2 * min_distance)
+            x, y = px + math.cos(a) * r, py + math.sin(a) * r
+            if -width <= x < width and -width <= y < width and is_valid(x, y):
+                ci, cj = get_cell(x, y)
+                grid[ci][cj] = len(points)
+                active.append(len(points))
+                points.append((x, y))
+                break
+        else:
+            active[i] = active[-1]
+            active.pop()
+    return np.array(points, dtype=np.float64).reshape(-1, 2)
@@ -15,22 +15,22 @@ def clamp(n: float, minn: float, maxn: float) -> float:
     return max(min(maxn, n), minn)
 
 
-@njit
+@njit(cache=True)
 def det(a: npt.ArrayLike) -> float:
     return np.linalg.det(np.array(a))
 
 
-@njit
+@njit("float64(float64[:])", cache=True)
 def norm(v: npt.NDArray[np.float64]) -> float:
     return np.sqrt(np.sum(v**2))
 
 
-@njit
+@njit("float64[:](float64[:])", cache=True)
 def normalize(v: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
     return v / (norm(v) + EPS)
 
 
-@njit(cache=True)
+@njit("optional(float64[:])(float64[:], float64[:], float64[:], float64[:], boolean)", cache=True)
 def intersect_jit(
     a: npt.NDArray[np.float64],
     b: npt.NDArray[np.float64],
@@ -58,7 +58,39 @@ def intersect_jit(
     return None
 
 
-@njit
+@njit(
+    "Tuple((float64[:, :], float64[:, :], float64[:, :, :], boolean[:, :]))(float64[:, :], float64[:, :], boolean)",
+    cache=True,
+)
+def intersect_segments_jit(
+    segments1: npt.NDArray[np.float64],
+    segments2: npt.NDArray[np.float64],
+    strict: bool = True,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64], npt.NDArray[np.float64], npt.NDArray[np.bool_]]:
+    n, m = len(segments1), len(segments2)
+    t = np.full((n, m), np.nan)
+    u = np.full((n, m), np.nan)
+    points = np.full((n, m, 2), np.nan)
+    hits = np.zeros((n, m), dtype=np.bool_)
+    atol = -EPS if strict else 0.0
+    for i in range(n):
+        x1, y1, x2, y2 = segments1[i]
+        for j in range(m):
+            x3, y3, x4, y4 = segments2[j]
+            dd = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
+            if dd == 0:
+                continue
+            tt = ((x1 - x3) * (y3 - y4) - (y1 - y3) * (x3 - x4)) / dd
+            uu = -((x1 - x2) * (y1 - y3) - (y1 - y2) * (x1 - x3)) / dd
+            t[i, j], u[i, j] = tt, uu
+            if abs(uu - 0.5) <= (atol + 0.5) and abs(tt - 0.5) <= (atol + 0.5):
+                hits[i, j] = True
+                points[i, j, 0] = x2 if tt == 1 else (x2 - x1) * tt + x1
+                points[i, j, 1] = y2 if tt == 1 else (y2 - y1) * tt + y1
+    return t, u, points, hits
+
+
+@njit("float64(float64[:], float64[:], float64[:], boolean)", cache=True)
 def distance_point_segment_jit(
     p: npt.NDArray[np.float64],
     a: npt.NDArray[np.float64],
@@ -78,7 +110,27 @@ def distance_point_segment_jit(
         return norm(a + v * x - p)
 
 
-@njit
+@njit("float64[:](float64[:], float64[:, :])", cache=True)
+def distance_point_segments_jit(
+    p: npt.NDArray[np.float64], segments: npt.NDArray[np.float64]
+) -> npt.NDArray[np.float64]:
+    result = np.empty(len(segments))
+    for i in range(len(segments)):
+        ax, ay, bx, by = segments[i]
+        vx, vy = bx - ax, by - ay
+        v_l = np.sqrt(vx * vx + vy * vy)
+        x = ((p[0] - ax) * vx + (p[1] - ay) * vy) / (v_l + EPS)
+        if x < 0:
+            result[i] = np.sqrt((ax - p[0]) ** 2 + (ay - p[1]) ** 2)
+        elif x > v_l:
+            result[i] = np.sqrt((bx - p[0]) ** 2 + (by - p[1]) ** 2)
+        else:
+            t = x / (v_l + EPS)
+            result[i] = np.sqrt((ax + vx * t - p[0]) ** 2 + (ay + vy * t - p[1]) ** 2)
+    return result
+
+
+@njit("optional(float64[:])(float64[:], float64[:], float64[:], boolean)", cache=True)
 def nearest_point_segment_jit(
     p: npt.NDArray[np.float64],
     a: npt.NDArray[np.float64],
@@ -98,7 +150,7 @@ def nearest_point_segment_jit(
         return a + v * x
 
 
-@njit
+@njit("optional(float64[:])(float64[:], float64, float64[:], float64[:])", cache=True)
 def collision_circle_segment_jit(
     center: npt.NDArray[np.float64],
     radius: float,
@@ -114,10 +166,363 @@ def collision_circle_segment_jit(
     return None
 
 
-def compile_all_jits():
-    normalize(np.zeros(2))
-    intersect_jit(np.zeros(2), np.zeros(2), np.zeros(2), np.zeros(2), False)
-    collision_circle_segment_jit(np.zeros(2), 0.0, np.zeros(2), np.zeros(2))
+@njit("optional(float64[:])(float64[:], float64, float64[:, :])", cache=True)
+def collision_circle_segments_jit(
+    center: npt.NDArray[np.float64],
+    radius: float,
+    segments: npt.NDArray[np.float64],
+) -> Optional[npt.NDArray[np.float64]]:
+    for i in range(len(segments)):
+        x = collision_circle_segment_jit(center, radius, segments[i, :2], segments[i, 2:])
+        if x is not None:
+            return x
+    return None
+
+
+@njit("Tuple((float64, float64[:]))(float64[:], float64[:], float64, float64[:], float64[:])", cache=True)
+def sweep_circle_segment_jit(
+    p0: npt.NDArray[np.float64],
+    p1: npt.NDArray[np.float64],
+    radius: float,
+    a: npt.NDArray[np.float64],
+    b: npt.NDArray[np.float64],
+) -> tuple[float, npt.NDArray[np.float64]]:
+    # The time of impact in [0, 1] of a circle moving from p0 to p1 against a segment, and the contact normal toward the
+    # circle, or inf when they do not meet. Only a circle moving closer hits, so a circle in contact can move away.
+
+    d = p1 - p0
+    toi, normal = np.inf, np.zeros(2)
+
+    # The side of the segment, its line is pushed toward the circle by the radius
+
+    v = b - a
+    v_l = norm(v)
+    if v_l > EPS:
+        n = np.array([-v[1], v[0]]) / v_l
+        d0 = np.dot(p0 - a, n)
+        if d0 < 0:
+            n, d0 = -n, -d0
+        dn = np.dot(d, n)
+        if dn < 0 and d0 + dn <= radius:
+            t = max(0.0, (d0 - radius) / -dn)
+            x = np.dot(p0 + d * t - a, v) / v_l
+            if 0 <= x <= v_l:
+                toi, normal = t, n
+
+    # The end points of the segment
+
+    for e in (a, b):
+        w = p0 - e
+        dd, wd, ww = np.dot(d, d), np.dot(w, d), np.dot(w, w) - radius * radius
+        if wd >= 0:
+            continue
+        if ww <= 0:
+            t = 0.0
+        else:
+            disc = wd * wd - dd * ww
+            if disc < 0:
+                continue
+            t = (-wd - np.sqrt(disc)) / dd
+        if t <= 1 and t < toi:
+            toi, normal = t, normalize(p0 + d * t - e)
 
+    return toi, normal
+
+
+@njit("Tuple((float64, float64[:]))(float64[:], float64[:], float64, float64[:, :])", cache=True)
+def sweep_circle_segments_jit(
+    p0: npt.NDArray[np.float64],
+    p1: npt.NDArray[np.float64],
+    radius: float,
+    segments: npt.NDArray[np.float64],
+) -> tuple[float, npt.NDArray[np.float64]]:
+    toi, normal = np.inf, np.zeros(2)
+    for i in range(len(segments)):
+        t, n = sweep_circle_segment_jit(p0, p1, radius, segments[i, :2], segments[i, 2:])
+        if t < toi:
+            toi, normal = t, n
+    return toi, normal
 
-compile_all_jits()
+
+@njit("float64[:](float64[:], float64[:], float64[:, :], boolean)", cache=True)
+def cast_ray_segments_jit(
+    a: npt.NDArray[np.float64],
+    b: npt.NDArray[np.float64],
+    segments: npt.NDArray[np.float64],
+    ordered: bool = True,
+) -> npt.NDArray[np.float64]:
+    # The ray is intersected with one segment at a time in the closed form of intersect_segments_jit, the first hit
+    # ends the cast when the segments are ordered.
+
+    x1, y1 = a
+    x2, y2 = b
+    atol = 0.0
+    result = b
+    closest = np.inf
+    for i in range(len(segments)):
+        x3, y3, x4, y4 = segments[i]
+        dd = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
+        if dd == 0:
+            continue
+        t = ((x1 - x3) * (y3 - y4) - (y1 - y3) * (x3 - x4)) / dd
+        u = -((x1 - x2) * (y1 - y3) - (y1 - y2) * (x1 - x3)) / dd
+        if abs(u - 0.5) <= (atol + 0.5) and abs(t - 0.5) <= (atol + 0.5):
+            x = np.array([x2 if t == 1 else (x2 - x1) * t + x1, y2 if t == 1 else (y2 - y1) * t + y1])
+            if ordered:
+                return x
+            d = norm(x - a)
+            if d < closest:
+                closest = d
+                result = x
+    return result
+
+
+@njit("boolean(float64[:], float64[:, :], boolean)", cache=True)
+def point_in_polygon_jit(p: npt.NDArray[np.float64], polygon: npt.NDArray[np.float64], strict: bool = True) -> bool:
+    x, y = p
+    n = len(polygon)
+    inside = False
+
+    p1x, p1y = polygon[0]
+    for i in range(1, n + 1):
+        p2x, p2y = polygon[i % n]
+
+        if min(p1x, p2x) <= x <= max(p1x, p2x) and min(p1y, p2y) <= y <= max(p1y, p2y):
+            if (p2x - p1x) * (y - p1y) == (p2y - p1y) * (x - p1x):
+                return not strict
+
+        if min(p1y, p2y) < y <= max(p1y, p2y) and x <= max(p1x, p2x):
+            t = (y - p1y) / (p2y - p1y)
+            xinters = p2x if t >= 1.0 else (p2x - p1x) * t + p1x
+            if p1x == p2x or x < xinters:
+                inside = not inside
+        p1x, p1y = p2x, p2y
+
+    return inside
+
+
+@njit("boolean[:, :](float64[:, :], float64[:, :], int64[:], boolean)", cache=True)
+def points_in_polygons_jit(
+    points: npt.NDArray[np.float64],
+    vertice: npt.NDArray[np.float64],
+    offsets: npt.NDArray[np.int64],
+    strict: bool = True,
+) -> npt.NDArray[np.bool_]:
+    result = np.zeros((len(points), len(offsets) - 1), dtype=np.bool_)
+    for j in range(len(offsets) - 1):
+        polygon = vertice[offsets[j] : offsets[j + 1]]
+        for i in range(len(points)):
+            result[i, j] = point_in_polygon_jit(points[i], polygon, strict)
+    return result
+
+
+@njit("int64(int64, int64, int64)", cache=True)
+def hash_cell_jit(i: int, j: int, table_size: int) -> int:
+    return ((i * 73856093) ^ (j * 19349663)) & (table_size - 1)
+
+
+@njit("Tuple((int64[:], int64[:]))(float64[:, :], float64, int64)", cache=True)
+def spatial_hash_jit(
+    points: npt.NDArray[np.float64], cell_size: float, table_size: int
+) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    # Each point is chained in the bucket of its cell, the heads start the chains of the buckets and the nexts link the
+    # points, -1 ends a chain. The table size is a power of two.
+
+    heads = np.full(table_size, -1, dtype=np.int64)
+    nexts = np.full(len(points), -1, dtype=np.int64)
+    for k in range(len(points)):
+        i, j = int(np.floor(points[k, 0] / cell_size)), int(np.floor(points[k, 1] / cell_size))
+        h = hash_cell_jit(i, j, table_size)
+        nexts[k] = heads[h]
+        heads[h] = k
+    return heads, nexts
+
+
+@njit("int64[:, :](float64[:, :], float64, int64[:], int64[:], float64)", cache=True)
+def spatial_hash_pairs_jit(
+    points: npt.NDArray[np.float64],
+    cell_size: float,
+    heads: npt.NDArray[np.int64],
+    nexts: npt.NDArray[np.int64],
+    max_distance: float,
+) -> npt.NDArray[np.int64]:
+    # The pairs of points closer than max_distance, each one once with the lower index first. The 3x3 cells around a
+    # point are looked up, so the cell size must be at least max_distance. Different cells may share a bucket, a point
+    # is only taken from the bucket of its own cell.
+
+    cells = np.floor(points / cell_size).astype(np.int64)
+    pairs = np.empty((max(16, len(points) * 4), 2), dtype=np.int64)
+    n = 0
+    for k in range(len(points)):
+        for di in range(-1, 2):
+            for dj in range(-1, 2):
+                i, j = cells[k, 0] + di, cells[k, 1] + dj
+                m = heads[hash_cell_jit(i, j, len(heads))]
+                while m >= 0:
+                    if m > k and cells[m, 0] == i and cells[m, 1] == j:
+                        dx, dy = points[m, 0] - points[k, 0], points[m, 1] - points[k, 1]
+                        if dx * dx + dy * dy <= max_distance * max_distance:
+                            if n == len(pairs):
+                                pairs = np.concatenate((pairs, np.empty_like(pairs)))
+                            pairs[n, 0], pairs[n, 1] = k, m
+                            n += 1
+                    m = nexts[m]
+    return pairs[:n]
+
+
+@njit("Tuple((int64[:], int64[:, :]))(int64[:, :], int64)", cache=True)
+def cell_table_jit(
+    cells: npt.NDArray[np.int64], table_size: int
+) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    # The (i, j, index) rows of the cells are sorted by bucket, the rows of a bucket start at its start and end at the
+    # start of the next one. The table size is a power of two.
+
+    buckets = np.empty(len(cells), dtype=np.int64)
+    starts = np.zeros(table_size + 1, dtype=np.int64)
+    for k in range(len(cells)):
+        buckets[k] = hash_cell_jit(cells[k, 0], cells[k, 1], table_size)
+        starts[buckets[k] + 1] += 1
+    starts = np.cumsum(starts)
+
+    rows = np.empty_like(cells)
+    filled = starts[:-1].copy()
+    for k in range(len(cells)):
+        rows[filled[buckets[k]]] = cells[k]
+        filled[buckets[k]] += 1
+    return starts, rows
+
+
+@njit("int64[:](float64, int64[:], int64[:, :], float64[:], float64)", cache=True)
+def query_cell_table_jit(
+    cell_size: float,
+    starts: npt.NDArray[np.int64],
+    rows: npt.NDArray[np.int64],
+    center: npt.NDArray[np.float64],
+    radius: float,
+) -> npt.NDArray[np.int64]:
+    # The sorted indices registered in the cells overlapping the box of the circle, different cells may share a bucket,
+    # a row is only taken from the bucket of its own cell.
+
+    i1, j1 = int(np.floor((center[0] - radius) / cell_size)), int(np.floor((center[1] - radius) / cell_size))
+    i2, j2 = int(np.floor((center[0] + radius) / cell_size)), int(np.floor((center[1] + radius) / cell_size))
+    indices = np.empty(16, dtype=np.int64)
+    n = 0
+    for i in range(i1, i2 + 1):
+        for j in range(j1, j2 + 1):
+            h = hash_cell_jit(i, j, len(starts) - 1)
+            for k in range(starts[h], starts[h + 1]):
+                if rows[k, 0] == i and rows[k, 1] == j:
+                    if n == len(indices):
+                        indices = np.concatenate((indices, np.empty_like(indices)))
+                    indices[n] = rows[k, 2]
+                    n += 1
+    return np.unique(indices[:n])
+
+
+@njit(cache=True)
+def distance_field_jit(
+    segments: npt.NDArray[np.float64],
+    origin: npt.NDArray[np.float64],
+    cell_size: float,
+    shape: tuple[int, int],
+    band: float,
+) -> npt.NDArray[np.float32]:
+    nx, ny = shape
+    field = np.full((nx, ny), band, dtype=np.float32)
+
+    # Unsigned distance, each segment only updates the nodes of its bounding box grown by the band
+
+    for k in range(len(segments)):
+        ax, ay, bx, by = segments[k]
+        vx, vy = bx - ax, by - ay
+        vv = vx * vx + vy * vy
+        i1 = max(int(np.floor((min(ax, bx) - band - origin[0]) / cell_size)), 0)
+        i2 = min(int(np.ceil((max(ax, bx) + band - origin[0]) / cell_size)), nx - 1)
+        j1 = max(int(np.floor((min(ay, by) - band - origin[1]) / cell_size)), 0)
+        j2 = min(int(np.ceil((max(ay, by) + band - origin[1]) / cell_size)), ny - 1)
+        for i in range(i1, i2 + 1):
+            x = origin[0] + i * cell_size
+            for j in range(j1, j2 + 1):
+                y = origin[1] + j * cell_size
+                t = ((x - ax) * vx + (y - ay) * vy) / vv if vv > 0 else 0.0
+                t = min(max(t, 0.0), 1.0)
+                d = np.sqrt((ax + vx * t - x) ** 2 + (ay + vy * t - y) ** 2)
+                field[i, j] = min(field[i, j], d)
+    return field
+
+
+@njit(cache=True)
+def sign_field_jit(
+    field: npt.NDArray[np.float32],
+    segments: npt.NDArray[np.float64],
+    origin: npt.NDArray[np.float64],
+    cell_size: float,
+) -> None:
+    # Sign in place, a node is inside if an odd number of segments cross the row on its left
+
+    nx, ny = field.shape
+    crossings = np.empty(len(segments))
+    for j in range(ny):
+        y = origin[1] + j * cell_size
+        n = 0
+        for k in range(len(segments)):
+            ax, ay, bx, by = segments[k]
+            if (ay <= y) != (by <= y):
+                crossings[n] = ax + (y - ay) * (bx - ax) / (by - ay)
+                n += 1
+        xs = np.sort(crossings[:n])
+        m = 0
+        for i in range(nx):
+            x = origin[0] + i * cell_size
+            while m < n and xs[m] < x:
+                m += 1
+            if m % 2 == 1:
+                field[i, j] = -field[i, j]
+
+
+@njit(cache=True)
+def sample_field_jit(
+    field: npt.NDArray[np.float32],
+    origin: npt.NDArray[np.float64],
+    cell_size: float,
+    p: npt.NDArray[np.float64],
+    band: float,
+) -> tuple[float, npt.NDArray[np.float64]]:
+    u = (p[0] - origin[0]) / cell_size
+    v = (p[1] - origin[1]) / cell_size
+    i = int(np.floor(u))
+    j = int(np.floor(v))
+    if i < 0 or j < 0 or i >= field.shape[0] - 1 or j >= field.shape[1] - 1:
+        return band, np.zeros(2)
+
+    fx, fy = u - i, v - j
+    d00, d10, d01, d11 = field[i, j], field[i + 1, j], field[i, j + 1], field[i + 1, j + 1]
+    d = (1 - fx) * (1 - fy) * d00 + fx * (1 - fy) * d10 + (1 - fx) * fy * d01 + fx * fy * d11
+    gx = ((1 - fy) * (d10 - d00) + fy * (d11 - d01)) / cell_size
+    gy = ((1 - fx) * (d01 - d00) + fx * (d11 - d10)) / cell_size
+    return float(d), np.array([gx, gy], dtype=np.float64)
+
+
+@njit(cache=True)
+def collision_circle_field_jit(
+    center: npt.NDArray[np.float64],
+    radius: float,
+    raster: tuple[npt.NDArray[np.float32], npt.NDArray[np.float64], float, float],
+) -> Optional[npt.NDArray[np.float64]]:
+    # The reaction pushes the circle out along the gradient of the field, the raster is (values, origin, cell_size,
+    # band).
+
+    values, origin, cell_size, band = raster
+    d, gradient = sample_field_jit(values, origin, cell_size, center, band)
+    if abs(d) > radius:
+        return None
+    u = gradient / (np.sqrt(np.dot(gradient, gradient)) + EPS)
+    return u * (radius - abs(d) + EPS) * (1.0 if d >= 0 else -1.0)
+
+
+# The kernels of the simulation have explicit signatures, they are compiled at import or loaded from the on-disk cache.
+# The kernels without signatures compile on their first call, warming them up ahead keeps this cost out of a run.
+def compile_all_jits():
+    values = distance_field_jit(np.zeros((1, 4)), np.zeros(2), 1.0, (2, 2), 1.0)
+    sign_field_jit(values, np.zeros((1, 4)), np.zeros(2), 1.0)
+    collision_circle_field_jit(np.zeros(2), 1.0, (values, np.zeros(2), 1.0, 1.0))
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+
+from taxi_driver_env.constants import VIRTUAL_CELL
+from taxi_driver_env.math.geom import Point, Segment, SegmentArray
+from taxi_driver_env.math.linalg import (
+    EPS,
+    cell_table_jit,
+    collision_circle_field_jit,
+    distance_field_jit,
+    distance_point_segments_jit,
+    query_cell_table_jit,
+    sample_field_jit,
+    sign_field_jit,
+    spatial_hash_jit,
+    spatial_hash_pairs_jit,
+)
+
+DISTANCE_FIELD_CELL = 0.5  # m
+
+
+@dataclass
+class SegmentGrid:
+    segments: list[Segment]
+    cell_size: float = VIRTUAL_CELL
+    cells: dict[tuple[int, int], npt.NDArray[np.int64]] = field(init=False, repr=False)
+    center: npt.NDArray[np.float64] = field(init=False, repr=False)
+    extent: float = field(init=False, repr=False)
+    array: SegmentArray = field(init=False, repr=False)
+    table_starts: npt.NDArray[np.int64] = field(init=False, repr=False)
+    table_rows: npt.NDArray[np.int64] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.array = SegmentArray.from_segments(self.segments)
+
+        # Register each segment in every cell it crosses, a cell is crossed if its center is closer to the segment
+        # than its half diagonal.
+
+        half_diagonal = self.cell_size * np.sqrt(2) * 0.5
+        cells: dict[tuple[int, int], list[int]] = {}
+        for i, (x1, y1, x2, y2) in enumerate(self.array.coords):
+            i1, j1 = self._get_cell(min(x1, x2), min(y1, y2))
+            i2, j2 = self._get_cell(max(x1, x2), max(y1, y2))
+            ii, jj = np.meshgrid(np.arange(i1, i2 + 1), np.arange(j1, j2 + 1), indexing="ij")
+            centers = (np.stack([ii.ravel(), jj.ravel()], axis=1).astype(np.float64) + 0.5) * self.cell_size
+            for k in np.flatnonzero(_distance_points_segment(centers, self.array.coords[i]) <= half_diagonal):
+                cells.setdefault((int(ii.flat[k]), int(jj.flat[k])), []).append(i)
+
+        self.cells = {k: np.array(v, dtype=np.int64) for k, v in cells.items()}
+
+        # The cells are also hashed in a table for the compiled queries, at least twice as large as the number of cells
+
+        rows = np.array([(i, j, k) for (i, j), v in cells.items() for k in v], dtype=np.int64).reshape(-1, 3)
+        table_size = 1 << max(1, 2 * len(cells) - 1).bit_length()
+        self.table_starts, self.table_rows = cell_table_jit(rows, table_size)
+
+        points = self.array.coords.reshape(-1, 2)
+        self.center = (points.min(axis=0) + points.max(axis=0)) * 0.5 if len(points) > 0 else np.zeros(2)
+        self.extent = float(np.linalg.norm(points - self.center, axis=1).max()) if len(points) > 0 else 0.0
+
+    def query_indices(self, position: Point, radius: float) -> npt.NDArray[np.int64]:
+        x, y = position.xy
+        i1, j1 = self._get_cell(x - radius, y - radius)
+        i2, j2 = self._get_cell(x + radius, y + radius)
+        candidates = [self.cells[(i, j)] for i in range(i1, i2 + 1) for j in range(j1, j2 + 1) if (i, j) in self.cells]
+        if not candidates:
+            return np.zeros(0, dtype=np.int64)
+
+        indices = np.unique(np.concatenate(candidates))
+        distances = distance_point_segments_jit(position.xy, self.array.coords[indices])
+        mask = distances <= radius
+        return indices[mask][np.argsort(distances[mask], kind="stable")]
+
+    @property
+    def table(self) -> tuple[float, npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+        return self.cell_size, self.table_starts, self.table_rows
+
+    def query_candidate_indices(self, position: Point, radius: float) -> npt.NDArray[np.int64]:
+        # The broadphase of query_indices, the segments of the cells around the position in their order. They are a
+        # superset of the segments within the radius.
+
+        return query_cell_table_jit(self.cell_size, self.table_starts, self.table_rows, position.xy, radius)
+
+    def query_nearest_indices(self, position: Point) -> npt.NDArray[np.int64]:
+        # Grow the query radius until a segment is found, all the segments closer than the nearest one are then in the
+        # result. Far from the grid, it is cheaper to sort all the segments.
+
+        radius = self.cell_size
+        while len(self.segments) > 0:
+            if radius > self.extent + np.linalg.norm(position.xy - self.center):
+                distances = distance_point_segments_jit(position.xy, self.array.coords)
+                return np.argsort(distances, kind="stable")
+            indices = self.query_indices(position, radius)
+            if len(indices) > 0:
+                return indices
+            radius *= 2
+        return np.zeros(0, dtype=np.int64)
+
+    def query(self, position: Point, radius: float) -> list[Segment]:
+        return [self.segments[i] for i in self.query_indices(position, radius)]
+
+    def query_array(self, position: Point, radius: float) -> SegmentArray:
+        return self.array.take(self.query_indices(position, radius))
+
+    def _get_cell(self, x: float, y: float) -> tuple[int, int]:
+        return int(np.floor(x / self.cell_size)), int(np.floor(y / self.cell_size))
+
+
+def _distance_points_segment(points: npt.NDArray[np.float64], segment: npt.NDArray[np.float64]) -> np.ndarray:
+    a, b = segment[:2], segment[2:]
+    v = b - a
+    t = np.clip((points - a) @ v / max(float(v @ v), 1e-12), 0.0, 1.0)
+    return np.linalg.norm(a + t[:, None] * v - points, axis=1)
+
+
+@dataclass
+class BoxGrid:
+    boxes: npt.NDArray[np.float64]
+    cell_size: float = VIRTUAL_CELL
+    cells: dict[tuple[int, int], list[int]] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.cells = {}
+        for k, (x1, y1, x2, y2) in enumerate(self.boxes):
+            i1, j1 = self._get_cell(x1, y1)
+            i2, j2 = self._get_cell(x2, y2)
+            for i in range(i1, i2 + 1):
+                for j in range(j1, j2 + 1):
+                    self.cells.setdefault((i, j), []).append(k)
+
+    def query_points(self, points: npt.NDArray[np.float64]) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+        point_indices, box_indices = [], []
+        for i, (x, y) in enumerate(points):
+            for k in self.cells.get(self._get_cell(x, y), []):
+                x1, y1, x2, y2 = self.boxes[k]
+                if x1 <= x <= x2 and y1 <= y <= y2:
+                    point_indices.append(i)
+                    box_indices.append(k)
+        return np.array(point_indices, dtype=np.int64), np.array(box_indices, dtype=np.int64)
+
+    def _get_cell(self, x: float, y: float) -> tuple[int, int]:
+        return int(np.floor(x / self.cell_size)), int(np.floor(y / self.cell_size))
+
+
+@dataclass
+class SpatialHash:
+    points: npt.NDArray[np.float64]
+    cell_size: float = VIRTUAL_CELL
+    heads: npt.NDArray[np.int64] = field(init=False, repr=False)
+    nexts: npt.NDArray[np.int64] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        # A uniform grid hashed in a table at least twice as large as the number of points, it is cheap enough to be
+        # built again, in O(N), each time the points move.
+
+        table_size = 1 << max(1, 2 * len(self.points) - 1).bit_length()
+        self.heads, self.nexts = spatial_hash_jit(self.points, self.cell_size, table_size)
+
+    def query_pairs(self, max_distance: float) -> npt.NDArray[np.int64]:
+        assert max_distance <= self.cell_size
+        return spatial_hash_pairs_jit(self.points, self.cell_size, self.heads, self.nexts, max_distance)
+
+
+@dataclass
+class DistanceField:
+    segments: SegmentArray
+    cell_size: float = DISTANCE_FIELD_CELL
+    band: float = VIRTUAL_CELL
+    signed: bool = True
+    origin: npt.NDArray[np.float64] = field(init=False, repr=False)
+    values: npt.NDArray[np.float32] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        # Distance to the segments sampled on the nodes of a grid, negative inside the closed loops when signed. The
+        # distances are clamped to the band, beyond the grid the field is the band.
+
+        points = self.segments.coords.reshape(-1, 2)
+        lower = points.min(axis=0) if len(points) > 0 else np.zeros(2)
+        upper = points.max(axis=0) if len(points) > 0 else np.zeros(2)
+        self.origin = lower - self.band
+        nx, ny = (np.ceil((upper - lower + 2 * self.band) / self.cell_size).astype(np.int64) + 1).tolist()
+        self.values = distance_field_jit(self.segments.coords, self.origin, self.cell_size, (nx, ny), self.band)
+        if self.signed:
+            sign_field_jit(self.values, self.segments.coords, self.origin, self.cell_size)
+
+    @property
+    def raster(self) -> tuple[npt.NDArray[np.float32], npt.NDArray[np.float64], float, float]:
+        return self.values, self.origin, self.cell_size, self.band
+
+    def query(self, position: Point) -> tuple[float, npt.NDArray[np.float64]]:
+        return sample_field_jit(self.values, self.origin, self.cell_size, position.xy, self.band)
+
+    def query_nearest(self, position: Point) -> Optional[Point]:
+        # The nearest point of the segments, down the gradient, None beyond the band
+
+        d, gradient = self.query(position)
+        if abs(d) >= self.band:
+            return None
+        return Point(position.xy - gradient / (np.linalg.norm(gradient) + EPS) * d)
+
+    def collision_circle(self, center: Point, radius: float) -> Optional[npt.NDArray[np.float64]]:
+        return collision_circle_field_jit(center.xy, radius, self.raster)
@@ -1 +1,3 @@
 C_G = 9.81  # m.s-2
+PHYSIC_RATE = 60  # Hz
+PHYSIC_MAX_STEPS = 8
@@ -1,14 +1,241 @@
+from dataclasses import dataclass
+from typing import Optional
+
 import numpy as np
+import numpy.typing as npt
+from numba import njit
 
+from taxi_driver_env.math.linalg import (
+    EPS,
+    collision_circle_field_jit,
+    collision_circle_segment_jit,
+    distance_point_segments_jit,
+    normalize,
+    query_cell_table_jit,
+    sweep_circle_segments_jit,
+)
+from taxi_driver_env.physic.constants import C_G, PHYSIC_MAX_STEPS, PHYSIC_RATE
 from taxi_driver_env.physic.types import Integrable
 
+# The raster of the borders when the distance field is off, the kernels never sample it
+EMPTY_RASTER = (np.zeros((1, 1), dtype=np.float32), np.zeros(2), 1.0, 0.0)
+
+
+@dataclass
+class PhysicStepper:
+    # A fixed timestep accumulator, the frame time is consumed in steps of 1 / rate whatever the rendering rate, each
+    # step being integrated in sub_steps. A long frame is clamped to max_steps so the simulation does not spiral. The
+    # continuous collisions keep the cars from tunneling through the borders at a coarse rate. The distance field
+    # trades the exact distances to the borders and to the track for lookups in precomputed rasters.
+
+    rate: float = PHYSIC_RATE
+    sub_steps: int = 1
+    semi_implicit: bool = True
+    continuous_collision: bool = False
+    distance_field: bool = False
+    max_steps: int = PHYSIC_MAX_STEPS
+    accumulator: float = 0.0
+
+    @property
+    def dt(self) -> float:
+        return 1 / self.rate
 
-def euler_integrate(object: Integrable, forces: np.ndarray, dt: float):
+    def reset(self) -> None:
+        self.accumulator = 0.0
+
+    def advance(self, dt: float) -> int:
+        self.accumulator += dt
+        steps = 0
+        while self.accumulator >= self.dt and steps < self.max_steps:
+            self.accumulator -= self.dt
+            steps += 1
+        if steps == self.max_steps:
+            self.accumulator = min(self.accumulator, self.dt)
+        return steps
+
+
+def euler_integrate(object: Integrable, forces: np.ndarray, dt: float, semi_implicit: bool = True):
     # Second Newton law
 
     acc = forces / object.mass
 
-    # Simple Euler integration
+    # Euler integration, semi-implicit (symplectic) by default: the position moves with the new velocity
+
+    if semi_implicit:
+        object.vel += acc * dt
+        object.pos += object.vel * dt
+    else:
+        object.pos += object.vel * dt
+        object.vel += acc * dt
+
+
+@njit("float64[:](UniTuple(float64[::1], 3), UniTuple(float64, 6), float64, boolean)", cache=True)
+def integrate_car_jit(
+    body: tuple[npt.NDArray[np.float64], npt.NDArray[np.float64], npt.NDArray[np.float64]],
+    physic: tuple[float, float, float, float, float, float],
+    dt: float,
+    semi_implicit: bool,
+) -> npt.NDArray[np.float64]:
+    # Simple car modelisation (traction, drag road, drag rolling), the position and the velocity of the body (pos, vel,
+    # head) are integrated in place and the new heading is returned. The physic is (wheel, throttle, mass, length,
+    # drag_road, drag_rolling). The norm and the rotation go through np.dot as their numpy counterparts do, so the
+    # trajectories are the same to the bit. The wheel turns the heading by |v| / R per tick of PHYSIC_RATE, scaled by
+    # dt so that the car turns the same whatever the rate.
+
+    pos, vel, head = body
+    wheel, throttle, mass, length, drag_road, drag_rolling = physic
+
+    if wheel != 0:
+        circ_radius = length / np.sin(wheel)
+        ang_vel = np.sqrt(np.dot(vel, vel)) / circ_radius * (dt * PHYSIC_RATE)
+        c, s = np.cos(ang_vel), np.sin(ang_vel)
+        head = np.dot(np.array([[c, -s], [s, c]]), head)
+
+    forces = np.zeros(2)
+    forces += head * throttle
+    forces += vel * -drag_road * mass * C_G
+    forces += vel * -drag_rolling * mass * C_G
+
+    if semi_implicit:
+        vel += forces / mass * dt
+        pos += vel * dt
+    else:
+        pos += vel * dt
+        vel += forces / mass * dt
+    return head
+
+
+@njit("optional(float64[:])(float64[::1], float64, float64[:, ::1])", cache=True)
+def collision_circle_nearest_segments_jit(
+    center: npt.NDArray[np.float64],
+    radius: float,
+    segments: npt.NDArray[np.float64],
+) -> Optional[npt.NDArray[np.float64]]:
+    # The segments within the radius are tried from the nearest one, ties in index order, as a query of the segment
+    # grid returns them.
+
+    distances = distance_point_segments_jit(center, segments)
+    indices = np.flatnonzero(distances <= radius)
+    for i in indices[np.argsort(distances[indices], kind="mergesort")]:
+        x = collision_circle_segment_jit(center, radius, segments[i, :2], segments[i, 2:])
+        if x is not None:
+            return x
+    return None
+
+
+@njit("optional(float64[:])(float64[::1], float64[::1], float64, float64[:, ::1])", cache=True)
+def collision_swept_circle_jit(
+    prev: npt.NDArray[np.float64],
+    pos: npt.NDArray[np.float64],
+    radius: float,
+    segments: npt.NDArray[np.float64],
+) -> Optional[npt.NDArray[np.float64]]:
+    # The circle is swept from its previous position and the reaction brings it back to the first contact. A circle
+    # already in contact is left to the collision of its final position.
+
+    toi, normal = sweep_circle_segments_jit(prev, pos, radius, segments)
+    if toi <= 0 or toi > 1:
+        return None
+    return prev + (pos - prev) * toi - pos + normal * EPS
+
+
+@njit("float64[:](float64[::1], float64[::1], float64[:])", cache=True)
+def respond_collision_jit(
+    pos: npt.NDArray[np.float64],
+    vel: npt.NDArray[np.float64],
+    reaction: npt.NDArray[np.float64],
+) -> npt.NDArray[np.float64]:
+    # The car is pushed out of the obstacle and loses half of its speed, it then heads along its velocity.
+
+    vel[:] = vel * 0.5 + reaction
+    pos += reaction
+    return normalize(vel)
+
+
+@njit("boolean[:](float64[:, ::1], float64[:, ::1], float64[::1], int64[:, :], UniTuple(float64, 2))", cache=True)
+def collide_circles_jit(
+    positions: npt.NDArray[np.float64],
+    velocities: npt.NDArray[np.float64],
+    masses: npt.NDArray[np.float64],
+    pairs: npt.NDArray[np.int64],
+    contact: tuple[float, float],
+) -> npt.NDArray[np.bool_]:
+    # The narrowphase of the candidate pairs, the overlapping circles are pushed apart in proportion to their inverse
+    # masses and exchange an impulse along their normal of contact when they move closer. The positions and the
+    # velocities are updated in place, the circles that collided are returned. The contact is (radius, restitution).
+
+    radius, restitution = contact
+    collided = np.zeros(len(positions), dtype=np.bool_)
+    for k in range(len(pairs)):
+        i, j = pairs[k]
+        n = positions[j] - positions[i]
+        d = np.sqrt(np.dot(n, n))
+        if d > 2 * radius:
+            continue
+        n = n / d if d > EPS else np.array([1.0, 0.0])
+
+        wi, wj = 1 / masses[i], 1 / masses[j]
+        push = (2 * radius - d) / (wi + wj)
+        positions[i] -= n * push * wi
+        positions[j] += n * push * wj
+
+        vn = np.dot(velocities[j] - velocities[i], n)
+        if vn < 0:
+            impulse = -(1 + restitution) * vn / (wi + wj)
+            velocities[i] -= n * impulse * wi
+            velocities[j] += n * impulse * wj
+
+        collided[i] = collided[j] = True
+    return collided
+
+
+@njit(
+    "Tuple((float64[:], boolean))(UniTuple(float64[::1], 3), UniTuple(float64, 6), "
+    "Tuple((float64, float64[:, ::1], float64, int64[:], int64[:, :], "
+    "Tuple((float32[:, ::1], float64[::1], float64, float64)))), Tuple((float64, int64, boolean, boolean, boolean)))",
+    cache=True,
+)
+def update_car_jit(
+    body: tuple[npt.NDArray[np.float64], npt.NDArray[np.float64], npt.NDArray[np.float64]],
+    physic: tuple[float, float, float, float, float, float],
+    borders: tuple[
+        float,
+        npt.NDArray[np.float64],
+        float,
+        npt.NDArray[np.int64],
+        npt.NDArray[np.int64],
+        tuple[npt.NDArray[np.float32], npt.NDArray[np.float64], float, float],
+    ],
+    options: tuple[float, int, bool, bool, bool],
+) -> tuple[npt.NDArray[np.float64], bool]:
+    # The step is split in sub_steps, each one integrated and collided, the car is damaged if any of them collides.
+    # The continuous collisions sweep the car along its move before testing its final position. The borders are the
+    # radius of the car, the segments and the cell table of their grid, only the segments of the cells around the
+    # move are collided, in their order, and the raster of their distance field. The options are (dt, sub_steps,
+    # semi_implicit, continuous_collision, distance_field), the final position is tested against the distance field
+    # instead of the segments when it is set.
+
+    pos, vel, head = body
+    radius, segments, cell_size, table_starts, table_rows, raster = borders
+    dt, sub_steps, semi_implicit, continuous_collision, distance_field = options
 
-    object.vel += acc * dt
-    object.pos += object.vel * dt
+    h = dt / sub_steps
+    is_damaged = False
+    for _ in range(sub_steps):
+        prev = pos.copy()
+        head = integrate_car_jit((pos, vel, np.ascontiguousarray(head)), physic, h, semi_implicit)
+        reaction = None
+        if continuous_collision or not distance_field:
+            reach = radius + np.sqrt(np.dot(pos - prev, pos - prev)) * 0.5
+            indices = query_cell_table_jit(cell_size, table_starts, table_rows, (prev + pos) * 0.5, reach)
+            candidates = np.ascontiguousarray(segments[indices])
+            if continuous_collision:
+                reaction = collision_swept_circle_jit(prev, pos, radius, candidates)
+            if reaction is None and not distance_field:
+                reaction = collision_circle_nearest_segments_jit(pos, radius, candidates)
+        if reaction is None and distance_field:
+            reaction = collision_circle_field_jit(pos, radius, raster)
+        if reaction is not None:
+            head = respond_collision_jit(pos, vel, reaction)
+            is_damaged = True
+    return head, is_damaged
@@ -0,0 +1,89 @@
+from typing import Callable
+
+import numpy as np
+import pyray as pr
+
+BAKE_RESOLUTION = 8  # px.m-1
+BAKE_TILE_SIZE = 1024  # px
+
+Bounds = tuple[float, float, float, float]
+
+
+class BakedLayer:
+    def __init__(
+        self,
+        bounds: Bounds,
+        draw_fn: Callable[[], None],
+        resolution: float = BAKE_RESOLUTION,
+        tile_size: int = BAKE_TILE_SIZE,
+    ) -> None:
+        self.bounds = bounds
+        self.draw_fn = draw_fn
+        self.resolution = resolution
+        self.tile_size = tile_size
+        self.tiles: list[tuple[pr.Rectangle, pr.RenderTexture]] = []
+
+    def get_tile_bounds(self) -> list[Bounds]:
+        # The bounds are covered by square tiles of tile_size pixels at the resolution of the layer.
+
+        x1, y1, x2, y2 = self.bounds
+        extent = self.tile_size / self.resolution
+        nx = max(1, int(np.ceil((x2 - x1) / extent)))
+        ny = max(1, int(np.ceil((y2 - y1) / extent)))
+        return [
+            (x1 + i * extent, y1 + j * extent, x1 + (i + 1) * extent, y1 + (j + 1) * extent)
+            for i in range(nx)
+            for j in range(ny)
+        ]
+
+    def is_baked(self) -> bool:
+        return len(self.tiles) > 0
+
+    def bake(self) -> None:
+        # Each tile is drawn once in its own render texture, through a camera mapping the tile onto the texture. The
+        # alpha is accumulated apart from the colors, the texture is then premultiplied and composes as if the layer
+        # had been drawn directly. The render textures reset the transform, the one of the caller is restored.
+
+        self.unload()
+        modelview = pr.rl_get_matrix_modelview()
+        for x1, y1, x2, y2 in self.get_tile_bounds():
+            target = pr.load_render_texture(self.tile_size, self.tile_size)
+            pr.set_texture_filter(target.texture, pr.TextureFilter.TEXTURE_FILTER_BILINEAR)
+
+            pr.begin_texture_mode(target)
+            pr.clear_background(pr.BLANK)  # type: ignore
+            pr.begin_mode_2d(pr.Camera2D(pr.Vector2(0, 0), pr.Vector2(x1, y1), 0, self.resolution))
+            pr.rl_set_blend_factors_separate(
+                pr.RL_SRC_ALPHA,  # type: ignore
+                pr.RL_ONE_MINUS_SRC_ALPHA,  # type: ignore
+                pr.RL_ONE,  # type: ignore
+                pr.RL_ONE_MINUS_SRC_ALPHA,  # type: ignore
+                pr.RL_FUNC_ADD,  # type: ignore
+                pr.RL_FUNC_ADD,  # type: ignore
+            )
+            pr.begin_blend_mode(pr.BlendMode.BLEND_CUSTOM_SEPARATE)
+            self.draw_fn()
+            pr.end_blend_mode()
+            pr.end_mode_2d()
+            pr.end_texture_mode()
+
+            self.tiles.append((pr.Rectangle(x1, y1, x2 - x1, y2 - y1), target))
+        pr.rl_set_matrix_modelview(modelview)
+
+    def unload(self) -> None:
+        for _, target in self.tiles:
+            pr.unload_render_texture(target)
+        self.tiles = []
+
+    def draw(self) -> None:
+        # The layer is baked on its first draw, the tiles are then blitted in world coordinates under the camera of the
+        # caller. The render textures are upside down.
+
+        if not self.is_baked():
+            self.bake()
+
+        pr.begin_blend_mode(pr.BlendMode.BLEND_ALPHA_PREMULTIPLY)
+        for bound, target in self.tiles:
+            tex = target.texture
+            pr.draw_texture_pro(tex, pr.Rectangle(0, 0, tex.width, -tex.height), bound, pr.Vector2(0, 0), 0, pr.WHITE)  # type: ignore
+        pr.end_blend_mode()
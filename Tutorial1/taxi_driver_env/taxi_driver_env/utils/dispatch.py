@@ -0,0 +1,50 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from taxi_driver_env.constants import FRAME_RATE, GAME_SEED
+from taxi_driver_env.game.scenes import dispatch
+
+
+def main(
+    taxi_count: int = dispatch.TAXI_COUNT,
+    duration: float = 120,
+    request_rate: float = dispatch.REQUEST_RATE,
+    car_collision: bool = False,
+):
+    # A headless run of the dispatch scene for a simulated duration, one step per frame as in the game.
+
+    random.seed(GAME_SEED)
+    np.random.seed(GAME_SEED)
+
+    dispatch.spawn_taxis(taxi_count)
+    dispatch.set_request_rate(request_rate)
+    dispatch.set_car_collision(car_collision)
+    dispatch.reset()
+
+    steps = int(duration * FRAME_RATE)
+    start = time.perf_counter()
+    for _ in range(steps):
+        dispatch.update(1 / FRAME_RATE)
+    elapsed = time.perf_counter() - start
+
+    ctx = dispatch.get_singleton()
+    print(f"{'taxis':<24}{taxi_count:>12}")
+    print(f"{'simulated time (s)':<24}{ctx.elapsed:>12.1f}")
+    print(f"{'calls':<24}{ctx.dispatched + len(ctx.requests):>12}")
+    print(f"{'calls dispatched':<24}{ctx.dispatched:>12}")
+    print(f"{'trips':<24}{ctx.trips:>12}")
+    print(f"{'trips per hour':<24}{dispatch.get_trips_per_hour():>12.1f}")
+    print(f"{'steps per second':<24}{steps / elapsed:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fleet of taxis serving random calls, without rendering.")
+    parser.add_argument("--taxis", type=int, default=dispatch.TAXI_COUNT, help="number of taxis")
+    parser.add_argument("--duration", type=float, default=120, help="simulated duration in seconds")
+    parser.add_argument("--rate", type=float, default=dispatch.REQUEST_RATE, help="calls per simulated hour")
+    parser.add_argument("--collisions", action="store_true", help="let the taxis collide with each other")
+    args = parser.parse_args()
+    main(args.taxis, args.duration, args.rate, args.collisions)
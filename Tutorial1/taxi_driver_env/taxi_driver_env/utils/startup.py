@@ -0,0 +1,51 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+STARTUP_SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+import numpy as np
+import taxi_driver_env.math.geom as geom
+import taxi_driver_env.math.linalg as la
+t1 = time.perf_counter()
+a, b = geom.Point(np.array([0.0, 0.0])), geom.Point(np.array([1.0, 1.0]))
+s = geom.Segment(geom.Point(np.array([0.0, 1.0])), geom.Point(np.array([1.0, 0.0])))
+geom.intersect(geom.Segment(a, b), s)
+geom.nearest_point_segment(a, s, True)
+geom.collision_circle_segments(a, 1.0, geom.SegmentArray.from_segments([s]))
+geom.cast_ray_segments(a, np.array([1.0, 0.0]), 10.0, geom.SegmentArray.from_segments([s]))
+t2 = time.perf_counter()
+la.compile_all_jits()
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "first_call": t2 - t1, "warmup": t3 - t2}))
+"""
+
+
+def measure(cache_dir: str) -> dict[str, float]:
+    env = dict(os.environ, NUMBA_CACHE_DIR=cache_dir)
+    result = subprocess.run(
+        [sys.executable, "-c", STARTUP_SNIPPET], env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main(repeat: int = 3) -> None:
+    # A cold start compiles the kernels into an empty numba cache, the warm starts then load them from this cache. The
+    # warmup compiles the lazy kernels, which are not compiled at import.
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        runs = [("cold", measure(cache_dir))] + [("warm", measure(cache_dir)) for _ in range(repeat)]
+
+    print(f"{'start':<8}{'import (s)':>12}{'first call (s)':>16}{'warmup (s)':>12}{'total (s)':>12}")
+    for name, timings in runs:
+        total = timings["import"] + timings["first_call"] + timings["warmup"]
+        print(
+            f"{name:<8}{timings['import']:>12.3f}{timings['first_call']:>16.3f}{timings['warmup']:>12.3f}{total:>12.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
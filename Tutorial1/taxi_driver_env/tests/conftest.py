@@ -0,0 +1,12 @@
+import pytest
+
+from taxi_driver_env.game.entities import world
+
+
+@pytest.fixture(autouse=True, scope="session")
+def world_cache_dir(tmp_path_factory):
+    # The worlds generated by the tests are cached aside, not in the cache of the user
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(world, "WORLD_CACHE_DIR", str(tmp_path_factory.mktemp("cache")))
+        yield world.WORLD_CACHE_DIR
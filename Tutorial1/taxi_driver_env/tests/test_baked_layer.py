@@ -0,0 +1,15 @@
+from taxi_driver_env.render.baked_layer import BakedLayer
+
+
+def test_baked_layer_tiles_cover_bounds():
+    bounds = (-300.0, -250.0, 310.0, 0.0)
+    layer = BakedLayer(bounds, lambda: None, resolution=4, tile_size=256)
+    tiles = layer.get_tile_bounds()
+    extent = 256 / 4
+    assert len(tiles) == 10 * 4
+    assert all(x2 - x1 == extent and y2 - y1 == extent for x1, y1, x2, y2 in tiles)
+    assert min(x[0] for x in tiles) == bounds[0]
+    assert min(x[1] for x in tiles) == bounds[1]
+    assert max(x[2] for x in tiles) >= bounds[2]
+    assert max(x[3] for x in tiles) >= bounds[3]
+    assert not layer.is_baked()
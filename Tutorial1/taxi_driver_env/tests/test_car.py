@@ -0,0 +1,88 @@
+import numpy as np
+import pyray as pr
+
+from taxi_driver_env.game.entities.car import FLAG_DAMAGED, FLAG_OUT_OF_TRACK, Car
+from taxi_driver_env.game.entities.marker import Marker
+from taxi_driver_env.math.envelope import Envelope
+from taxi_driver_env.math.geom import Point, Segment
+from taxi_driver_env.math.linalg import lst_2_vec
+from taxi_driver_env.physic.engine import PhysicStepper
+from taxi_driver_env.utils.bitbang import is_bit_set
+
+STEP_COUNT = 240
+
+
+class Listener:
+    def __init__(self, car: Car) -> None:
+        self.car = car
+        self.entered = 0
+
+    def get_previous_pos(self) -> Point:
+        return self.car.prev_pos
+
+    def get_current_pos(self) -> Point:
+        return self.car.curr_pos
+
+    def on_enter(self, marker: Marker) -> None:
+        self.entered += 1
+
+    def on_leave(self, marker: Marker) -> None:
+        pass
+
+
+def straight_corridor() -> Envelope:
+    segment = lambda *x: Segment(Point(lst_2_vec(x[:2])), Point(lst_2_vec(x[2:])))
+    return Envelope([segment(0, -5, 100, -5), segment(0, 5, 100, 5)], [segment(0, 0, 100, 0)], 10)
+
+
+def marker_right(corridor: Envelope) -> np.ndarray:
+    front = corridor.skeleton[0].end.xy - corridor.skeleton[0].start.xy
+    front = front / np.linalg.norm(front)
+    return lst_2_vec([-front[1], front[0]])
+
+
+def test_marker_entered_once_without_physic_step():
+    corridor = straight_corridor()
+    car = Car(pr.RED, "ai", corridor=corridor)
+    car.set_camera_mode(False)
+    car.vel = lst_2_vec([20, 0])
+    car.update(car.stepper.dt)
+
+    # The car stands in the middle of the marker, it came from outside
+    width = 1.0
+    marker = Marker((corridor.skeleton[0], Point(car.curr_pos.xy - marker_right(corridor) * width * 0.5)), width)
+    listener = Listener(car)
+    marker.add_listener(listener)
+    marker.update(car.stepper.dt)
+    assert listener.entered == 1
+
+    # A frame shorter than the physic step does not move the car, nor enter the marker again
+    pos = car.pos.copy()
+    car.update(car.stepper.dt * 0.25)
+    marker.update(car.stepper.dt * 0.25)
+    assert np.array_equal(car.pos, pos)
+    assert listener.entered == 1
+
+
+def test_distance_field_follows_the_exact_trajectory():
+    # The borders and the skeleton of the corridor lie on the nodes of the fields, the lookups are then exact
+
+    corridor = straight_corridor()
+    cars = [Car(pr.RED, "ai", corridor=corridor, stepper=PhysicStepper(distance_field=x)) for x in (False, True)]
+    for acar in cars:
+        acar.set_camera_mode(False)
+
+    collisions, out_of_tracks = 0, 0
+    for i in range(STEP_COUNT):
+        for acar in cars:
+            acar.push_throttle(1.0)
+            acar.turn_wheel(0.5 if (i // 60) % 2 == 0 else -0.5)
+            acar.update(acar.stepper.dt)
+        exact, field = cars
+        assert np.allclose(field.pos, exact.pos, atol=1e-6)
+        assert np.allclose(field.vel, exact.vel, atol=1e-6)
+        assert field.flags == exact.flags
+        collisions += is_bit_set(exact.flags, FLAG_DAMAGED)
+        out_of_tracks += is_bit_set(exact.flags, FLAG_OUT_OF_TRACK)
+    assert collisions > 0
+    assert out_of_tracks > 0
@@ -0,0 +1,41 @@
+import random
+
+import numpy as np
+
+from taxi_driver_env.game.entities import world
+from taxi_driver_env.game.entities.taxi_driver import TaxiDriver
+from taxi_driver_env.game.scenes import dispatch
+
+TAXI_COUNT = 5
+REQUEST_RATE = 36000  # h-1
+MAX_STEPS = 6000
+
+
+def test_dispatch_completes_a_trip():
+    random.seed(5)
+    np.random.seed(5)
+    world.get_singleton()
+    dispatch.spawn_taxis(TAXI_COUNT)
+    dispatch.set_request_rate(REQUEST_RATE)
+    dispatch.reset()
+
+    ctx = dispatch.get_singleton()
+    while ctx.trips == 0 and ctx.steps < MAX_STEPS:
+        dispatch.update(1 / 60)
+    assert ctx.trips > 0
+    assert ctx.dispatched >= ctx.trips
+    assert dispatch.get_trips_per_hour() > 0
+
+    dispatch.set_request_rate(dispatch.REQUEST_RATE)
+
+
+def test_taxi_driver_skips_its_waits():
+    world.get_singleton()
+    taxi = TaxiDriver("ai", wait_timer=0.0)
+    taxi.car.set_camera_mode(False)
+    taxi.reset()
+    borders = world.get_singleton().borders
+    taxi.accept_call(borders.get_random_location(), borders.get_random_location())
+    assert taxi.state == TaxiDriver.STATE_ACCEPTING_CALL
+    taxi.update(1 / 60)
+    assert taxi.state == TaxiDriver.STATE_ACCEPT_CALL
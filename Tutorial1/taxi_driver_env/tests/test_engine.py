@@ -0,0 +1,195 @@
+import random
+
+import numpy as np
+
+from taxi_driver_env.math.geom import (
+    Point,
+    Segment,
+    SegmentArray,
+    collision_circle_segments,
+)
+from taxi_driver_env.math.linalg import lst_2_vec, normalize
+from taxi_driver_env.math.spatial import SegmentGrid
+from taxi_driver_env.physic.constants import C_G
+from taxi_driver_env.physic.engine import (
+    EMPTY_RASTER,
+    PhysicStepper,
+    collide_circles_jit,
+    collision_circle_nearest_segments_jit,
+    integrate_car_jit,
+    update_car_jit,
+)
+
+MASS, LENGTH, DRAG_ROAD, DRAG_ROLLING, DT = 650.0, 5.0, 0.9, 0.01, 1 / 60
+
+
+def reference_update(pos, vel, head, wheel, throttle, *, grid, radius):
+    # The numpy model of the car, as a reference for the kernels
+
+    forces = np.zeros(2)
+    if wheel != 0:
+        circ_radius = LENGTH / (np.sin(wheel))
+        ang_vel = np.linalg.norm(vel) / circ_radius
+        c, s = np.cos(ang_vel), np.sin(ang_vel)
+        head = [[c, -s], [s, c]] @ head
+    forces += head * throttle
+    forces += vel * -DRAG_ROAD * MASS * C_G
+    forces += vel * -DRAG_ROLLING * MASS * C_G
+    vel = vel + forces / MASS * DT
+    pos = pos + vel * DT
+
+    reaction = collision_circle_segments(Point(pos), radius, grid.query_array(Point(pos), radius))
+    if reaction is not None:
+        vel = vel * 0.5 + reaction
+        pos = pos + reaction
+        head = normalize(vel)
+    return pos, vel, head, reaction is not None
+
+
+def segment_grid(coords: list[list[float]]) -> SegmentGrid:
+    return SegmentGrid(SegmentArray(lst_2_vec(coords).reshape(-1, 4)).to_segments())
+
+
+def random_car() -> tuple[np.ndarray, np.ndarray, np.ndarray, float, float]:
+    pos = lst_2_vec([random.uniform(-50, 50), random.uniform(-50, 50)])
+    vel = lst_2_vec([random.uniform(-20, 20), random.uniform(-20, 20)])
+    head = normalize(lst_2_vec([random.uniform(-1, 1), random.uniform(-1, 1)]))
+    wheel = random.choice([0.0, random.uniform(-np.pi / 100, np.pi / 100)])
+    return pos, vel, head, wheel, random.uniform(-50000, 200000)
+
+
+def test_integrate_car_matches_reference():
+    random.seed(1)
+    grid = SegmentGrid([])
+    for _ in range(200):
+        pos, vel, head, wheel, throttle = random_car()
+        expected = reference_update(pos, vel, head, wheel, throttle, grid=grid, radius=1.0)
+        pos, vel = pos.copy(), vel.copy()
+        head = integrate_car_jit((pos, vel, head), (wheel, throttle, MASS, LENGTH, DRAG_ROAD, DRAG_ROLLING), DT, True)
+        assert np.array_equal(pos, expected[0])
+        assert np.array_equal(vel, expected[1])
+        assert np.array_equal(head, expected[2])
+
+
+def test_update_car_matches_reference():
+    random.seed(2)
+    segments = []
+    for _ in range(100):
+        a = lst_2_vec([random.uniform(-50, 50), random.uniform(-50, 50)])
+        segments.append(Segment(Point(a), Point(a + lst_2_vec([random.uniform(-10, 10), random.uniform(-10, 10)]))))
+    grid = SegmentGrid(segments)
+    borders = (2.0, grid.array.coords, *grid.table, EMPTY_RASTER)
+
+    collisions = 0
+    for _ in range(500):
+        pos, vel, head, wheel, throttle = random_car()
+        expected = reference_update(pos, vel, head, wheel, throttle, grid=grid, radius=2.0)
+        pos, vel = pos.copy(), vel.copy()
+        physic = (wheel, throttle, MASS, LENGTH, DRAG_ROAD, DRAG_ROLLING)
+        head, is_damaged = update_car_jit((pos, vel, head), physic, borders, (DT, 1, True, False, False))
+        assert np.array_equal(pos, expected[0])
+        assert np.array_equal(vel, expected[1])
+        assert np.array_equal(head, expected[2])
+        assert is_damaged == expected[3]
+        collisions += is_damaged
+    assert collisions > 0
+
+
+def test_collision_circle_nearest_segments():
+    coords = lst_2_vec([[-10, 2, 10, 2], [-10, 1, 10, 1], [-10, -5, 10, -5]])
+    reaction = collision_circle_nearest_segments_jit(lst_2_vec([0, 0]), 1.5, coords)
+    assert reaction is not None
+    assert np.allclose(reaction, [0, -0.5], atol=1e-6)
+    assert collision_circle_nearest_segments_jit(lst_2_vec([0, -2]), 1.5, coords) is None
+
+
+def test_update_car_sub_steps():
+    random.seed(3)
+    grid = segment_grid([[-100, 10, 100, 10], [-100, -10, 100, -10]])
+    borders = (1.0, grid.array.coords, *grid.table, EMPTY_RASTER)
+    sub_steps = 4
+    for _ in range(100):
+        pos, vel, head, wheel, throttle = random_car()
+        pos[1] = random.uniform(-9, 9)
+        physic = (wheel, throttle, MASS, LENGTH, DRAG_ROAD, DRAG_ROLLING)
+        expected_pos, expected_vel, expected_head, expected_damaged = pos.copy(), vel.copy(), head, False
+        for _ in range(sub_steps):
+            expected_head, is_damaged = update_car_jit(
+                (expected_pos, expected_vel, expected_head), physic, borders, (DT / sub_steps, 1, True, False, False)
+            )
+            expected_damaged |= is_damaged
+        head, is_damaged = update_car_jit((pos, vel, head), physic, borders, (DT, sub_steps, True, False, False))
+        assert np.array_equal(pos, expected_pos)
+        assert np.array_equal(vel, expected_vel)
+        assert np.array_equal(head, expected_head)
+        assert is_damaged == expected_damaged
+
+
+def test_integrate_car_rate_independent():
+    grid = segment_grid([])
+    physic = (np.pi / 200, 100000.0, MASS, LENGTH, DRAG_ROAD, DRAG_ROLLING)
+    borders = (1.0, grid.array.coords, *grid.table, EMPTY_RASTER)
+
+    def drive(rate: int) -> np.ndarray:
+        pos, vel, head = lst_2_vec([0, 0]), lst_2_vec([10, 0]), lst_2_vec([1, 0])
+        for _ in range(rate):
+            head, _ = update_car_jit((pos, vel, head), physic, borders, (1 / rate, 1, True, False, False))
+        return pos
+
+    # The heading turns by the same angle per second whatever the rate, the trajectories converge as the rate rises
+
+    tolerance = 1.0
+    assert np.linalg.norm(drive(60) - drive(240)) < tolerance
+    assert np.linalg.norm(drive(240) - drive(960)) < np.linalg.norm(drive(60) - drive(960))
+
+
+def test_integrate_car_explicit():
+    speed = 10.0
+    pos, vel, head = lst_2_vec([0, 0]), lst_2_vec([speed, 0]), lst_2_vec([1, 0])
+    integrate_car_jit((pos, vel, head), (0.0, 0.0, MASS, LENGTH, DRAG_ROAD, DRAG_ROLLING), DT, False)
+    assert np.array_equal(pos, [speed * DT, 0])
+    assert vel[0] < speed
+
+
+def test_physic_stepper():
+    stepper = PhysicStepper(rate=60, max_steps=4)
+    assert stepper.advance(1 / 60) == 1
+    assert stepper.advance(1 / 120) == 0
+    assert stepper.advance(1 / 120) == 1
+    assert stepper.advance(1.0) == stepper.max_steps
+    assert stepper.accumulator <= stepper.dt
+    stepper.reset()
+    assert stepper.accumulator == 0
+
+
+def test_update_car_continuous_collision():
+    # A fast car without drag at a coarse rate goes through a thin border, unless its move is swept
+
+    grid = segment_grid([[-10, 0, 10, 0]])
+    args = ((0.0, 0.0, MASS, LENGTH, 0.0, 0.0), (1.0, grid.array.coords, *grid.table, EMPTY_RASTER))
+
+    pos, vel, head = lst_2_vec([0, 3]), lst_2_vec([0, -60]), lst_2_vec([0, -1])
+    _, is_damaged = update_car_jit((pos, vel, head), *args, (1 / 10, 1, True, False, False))
+    assert not is_damaged
+    assert pos[1] < 0
+
+    pos, vel, head = lst_2_vec([0, 3]), lst_2_vec([0, -60]), lst_2_vec([0, -1])
+    _, is_damaged = update_car_jit((pos, vel, head), *args, (1 / 10, 1, True, True, False))
+    assert is_damaged
+    assert np.isclose(pos[1], 1.0)
+    assert vel[1] < 0
+
+
+def test_collide_circles():
+    positions = lst_2_vec([[0, 0], [1.5, 0], [10, 0]])
+    velocities = lst_2_vec([[10, 0], [-10, 0], [0, 0]])
+    masses = lst_2_vec([MASS, MASS, MASS])
+    pairs = np.array([[0, 1], [1, 2]], dtype=np.int64)
+    momentum = (velocities * masses[:, None]).sum(axis=0)
+
+    collided = collide_circles_jit(positions, velocities, masses, pairs, (1.0, 0.0))
+    assert collided.tolist() == [True, True, False]
+    assert np.isclose(np.linalg.norm(positions[1] - positions[0]), 2.0)
+    assert np.allclose(velocities[:2], 0)
+    assert np.allclose((velocities * masses[:, None]).sum(axis=0), momentum)
+    assert np.array_equal(positions[2], [10, 0])
@@ -0,0 +1,76 @@
+import random
+
+import numpy as np
+
+from taxi_driver_env.math.envelope import Envelope, _break_envelopes, _union_envelopes
+from taxi_driver_env.math.geom import (
+    Point,
+    Segment,
+    distance,
+    nearest_point_segment,
+    polygon_to_segments,
+)
+from taxi_driver_env.math.linalg import lst_2_vec
+
+
+def zigzag_envelope(n: int = 30) -> Envelope:
+    points = [Point(lst_2_vec([i * 10, (i % 2) * 10])) for i in range(n)]
+    return Envelope([], polygon_to_segments(points, False), 10)
+
+
+def linear_nearest_location(envelope: Envelope, p: Point) -> Segment:
+    return min(envelope.skeleton, key=lambda x: distance(p, nearest_point_segment(p, x, True)))  # type: ignore
+
+
+def test_envelope_bone_neighbours():
+    envelope = zigzag_envelope(4)
+    assert envelope.bone_neighbours == [[0, 1], [0, 1, 2], [1, 2]]
+
+
+def test_envelope_nearest_location_without_hint():
+    random.seed(1)
+    envelope = zigzag_envelope()
+    for _ in range(100):
+        p = Point(lst_2_vec([random.uniform(-50, 350), random.uniform(-50, 60)]))
+        seg, _ = envelope.get_nearest_location(p)
+        assert seg is linear_nearest_location(envelope, p)
+
+
+def test_envelope_nearest_location_with_hint():
+    random.seed(2)
+    envelope = zigzag_envelope()
+    hint = envelope.skeleton[0]
+    for x in np.linspace(0, 290, 200):
+        p = Point(lst_2_vec([x, random.uniform(-2, 12)]))
+        hint, _ = envelope.get_nearest_location(p, hint)
+        assert hint is linear_nearest_location(envelope, p)
+
+    p = Point(lst_2_vec([15, 5]))
+    seg, _ = envelope.get_nearest_location(p, envelope.skeleton[-1])
+    assert seg is linear_nearest_location(envelope, p)
+
+
+def test_break_envelopes_splits_crossing_borders():
+    square = lambda x, y: [Point(lst_2_vec(p)) for p in [[x, y], [x + 2, y], [x + 2, y + 2], [x, y + 2]]]
+    e1 = Envelope(polygon_to_segments(square(0, 0)), [], 1)
+    e2 = Envelope(polygon_to_segments(square(1, 1)), [], 1)
+    e3 = Envelope(polygon_to_segments(square(10, 10)), [], 1)
+    n = 6
+    r1, r2, r3 = _break_envelopes([e1, e2, e3])
+    assert len(r1.segments) == len(r2.segments) == n
+    assert r3.segments == e3.segments
+    assert Segment(Point(lst_2_vec([2, 0])), Point(lst_2_vec([2, 1]))) in r1.segments
+    assert Segment(Point(lst_2_vec([1, 2])), Point(lst_2_vec([1, 1]))) in r2.segments
+
+
+def test_union_envelopes_drops_inner_and_duplicate_borders():
+    square = lambda x, y: [Point(lst_2_vec(p)) for p in [[x, y], [x + 2, y], [x + 2, y + 2], [x, y + 2]]]
+    bone = Segment(Point(lst_2_vec([0, 0])), Point(lst_2_vec([1, 1])))
+    e1 = Envelope(polygon_to_segments(square(0, 0)), [bone], 1)
+    e2 = Envelope(polygon_to_segments(square(2.00001, 0)), [bone], 1)
+    e3 = Envelope(polygon_to_segments(square(2.5, 0.5)), [bone], 1)
+    n = 7
+    result = _union_envelopes([e1, e2, e3])
+    assert len(result.segments) == n
+    assert all(not x.almost(y) for i, x in enumerate(result.segments) for y in result.segments[i + 1 :])
+    assert result.skeleton == [bone, bone, bone]
@@ -0,0 +1,152 @@
+import random
+
+import numpy as np
+
+from taxi_driver_env.math.geom import Point, SegmentArray, distance, intersect_segments
+from taxi_driver_env.math.graph import (
+    RoutingTable,
+    SpatialEdge,
+    SpatialGraph,
+    SpatialVertex,
+    generate_city,
+    generate_random,
+)
+from taxi_driver_env.math.linalg import lst_2_vec
+
+
+def square_graph() -> SpatialGraph:
+    # A square with a dead end off one corner
+    vertice = [SpatialVertex(Point(lst_2_vec(x))) for x in [[0, 0], [10, 0], [10, 10], [0, 10], [20, 20]]]
+    edges = [SpatialEdge(vertice[i], vertice[(i + 1) % 4]) for i in range(4)]
+    edges.append(SpatialEdge(vertice[0], vertice[4]))
+    return SpatialGraph(vertice, edges)
+
+
+def test_vertex_ordering():
+    a = SpatialVertex(Point(lst_2_vec([0, 1])))
+    b = SpatialVertex(Point(lst_2_vec([1, 0])))
+    assert a < b
+    assert not b < a
+
+
+def test_shortest_path():
+    g = square_graph()
+    path = g.get_shortest_path(g.vertice[0], g.vertice[2])
+    assert path.vertice in ([g.vertice[0], g.vertice[1], g.vertice[2]], [g.vertice[0], g.vertice[3], g.vertice[2]])
+    assert path.edges == [SpatialEdge(path.vertice[0], path.vertice[1]), SpatialEdge(path.vertice[1], path.vertice[2])]
+
+
+def test_shortest_path_to_self():
+    g = square_graph()
+    path = g.get_shortest_path(g.vertice[1], g.vertice[1])
+    assert path.vertice == [g.vertice[1]]
+    assert path.edges == []
+
+
+def test_adjacency():
+    g = square_graph()
+    neighbours = [x for _, x in g.get_edges_from_vextex(g.vertice[0])]
+    n = 3
+    assert len(neighbours) == n
+    assert g.vertice[1] in neighbours and g.vertice[3] in neighbours
+
+
+def test_adjacency_invalidated():
+    g = square_graph()
+    path = g.get_shortest_path(g.vertice[0], g.vertice[1])
+    assert len(list(path.get_edges_from_vextex(path.vertice[-1]))) == 1
+    v = SpatialVertex(Point(lst_2_vec([10, -10])))
+    path.append_vertex(v)
+    assert [x for _, x in path.get_edges_from_vextex(v)] == [g.vertice[1]]
+    u = SpatialVertex(Point(lst_2_vec([-10, 0])))
+    path.prepend_vertex(u)
+    assert path.get_shortest_path(u, v).vertice == [u, g.vertice[0], g.vertice[1], v]
+
+
+def test_shortest_path_heuristic():
+    g = square_graph()
+    for a in g.vertice:
+        for b in g.vertice:
+            assert g.get_shortest_path(a, b, True).vertice == g.get_shortest_path(a, b).vertice
+
+
+def test_search_nearest():
+    g = square_graph()
+    prev, origins = g.search_nearest([g.vertice[1], g.vertice[4]])
+    assert origins[g.vertice[0]] == g.vertice[1]
+    assert origins[g.vertice[2]] == g.vertice[1]
+    assert origins[g.vertice[4]] == g.vertice[4]
+    path = g.get_path(origins[g.vertice[0]], g.vertice[0], prev)
+    assert path.vertice == [g.vertice[1], g.vertice[0]]
+
+
+def test_search_nearest_matches_search():
+    random.seed(3)
+    g = generate_city(50, 60, 50)
+    starts = random.sample(g.vertice, 5)
+    prev, origins = g.search_nearest(starts)
+    length = lambda x: sum(e.segment.length for e in x.edges)
+    for v in g.vertice:
+        if v not in origins:
+            assert all(v not in g.search(x) and v != x for x in starts)
+            continue
+        best = min(length(g.get_shortest_path(x, v)) for x in starts if x == v or v in g.search(x))
+        assert np.isclose(length(g.get_path(origins[v], v, prev)), best)
+
+
+def test_routing_table():
+    g = square_graph()
+    for a in g.vertice:
+        for b in g.vertice:
+            assert g.routes.get_shortest_path(a, b) == g.get_shortest_path(a, b)
+    assert g.routes.get_farthest_vertex(g.vertice[1]) == g.vertice[4]
+    assert g.routes.get_farthest_vertex(g.vertice[4]) == g.vertice[0]
+
+
+def test_routing_table_invalidated():
+    g = square_graph()
+    path = g.get_shortest_path(g.vertice[0], g.vertice[1])
+    assert path.routes.get_farthest_vertex(path.vertice[0]) == g.vertice[1]
+    v = SpatialVertex(Point(lst_2_vec([10, -10])))
+    path.append_vertex(v)
+    assert path.routes.get_farthest_vertex(path.vertice[0]) == v
+    assert path.routes.get_shortest_path(path.vertice[0], v).vertice == [g.vertice[0], g.vertice[1], v]
+
+
+def test_generate_random_size():
+    random.seed(1)
+    n, m = 10, 12
+    g = generate_random(n, m, 50)
+    assert len(g.vertice) == n
+    assert len(g.edges) == m
+
+
+def test_generate_city():
+    random.seed(1)
+    n, m, d = 300, 375, 50
+    g = generate_city(n, m, d)
+    assert len(g.vertice) == n
+    assert len(g.edges) == m
+    assert all(distance(a.point, b.point) >= d for i, a in enumerate(g.vertice) for b in g.vertice[i + 1 :])
+    segments = SegmentArray.from_segments([x.segment for x in g.edges])
+    assert not intersect_segments(segments, segments, True)[3].any()
+    assert len({(x.start, x.end) for x in g.edges} | {(x.end, x.start) for x in g.edges}) == 2 * m
+
+
+def test_generate_city_bounds():
+    random.seed(2)
+    n, w = 1000, 200
+    g = generate_city(n, 10, 50, w)
+    points = np.array([x.point.xy for x in g.vertice])
+    assert len(g.vertice) < n
+    assert np.all(np.abs(points) <= w)
+
+
+def test_routing_table_cache_is_bounded():
+    random.seed(4)
+    g = generate_city(200, 300, 50)
+    routes = RoutingTable(g, cache_size=8)
+    for _ in range(50):
+        a, b = random.sample(g.vertice, 2)
+        assert routes.get_shortest_path(a, b) == g.get_shortest_path(a, b)
+        assert len(routes.predecessors) <= routes.cache_size
@@ -3,12 +3,15 @@ import pyray as pr
 
 from taxi_driver_env.math.geom import (
     Point,
+    PointArray,
     Segment,
     distance,
     distance_point_segment,
     nearest_point_segment,
     point_in_polygon,
     point_on_segment,
+    points_in_polygon,
+    points_in_polygons,
 )
 from taxi_driver_env.math.linalg import EPS, lst_2_vec
 
@@ -175,3 +178,32 @@ def test_point_nearest_out_of_segment_but_non_strict():
     x = nearest_point_segment(d, e, True)
     assert x is not None
     assert x.almost(Point(lst_2_vec([2, 2])))
+
+
+def test_point_array_views():
+    a = Point(lst_2_vec([1, 1]))
+    b = Point(lst_2_vec([2, 2]))
+    points = PointArray.from_points([a, b])
+    assert points.to_points() == [a, b]
+    points[1].xy[:] = a.xy
+    assert points[1] == a
+
+
+def test_points_in_polygon():
+    a = Point(lst_2_vec([1, 1]))
+    b = Point(lst_2_vec([2, 1]))
+    c = Point(lst_2_vec([2, 2]))
+    d = Point(lst_2_vec([1, 2]))
+    points = PointArray(np.array([[1.5, 1.5], [1, 1.5], [0, 0], [2, 2]]))
+    assert points_in_polygon(points, [a, b, c, d]).tolist() == [True, False, False, False]
+    assert points_in_polygon(points, [a, b, c, d], False).tolist() == [True, True, False, True]
+
+
+def test_points_in_polygons_matches_point_in_polygon():
+    polygon1 = [Point(lst_2_vec(x)) for x in [[0, 0], [4, 0], [4, 3], [2, 5], [0, 3]]]
+    polygon2 = [Point(lst_2_vec(x)) for x in [[3, 1], [6, 1], [6, 4], [3, 4]]]
+    points = PointArray(np.array([[x * 0.5, y * 0.5] for x in range(-1, 14) for y in range(-1, 12)]))
+    result = points_in_polygons(points, [polygon1, PointArray.from_points(polygon2)])
+    for p, (in1, in2) in zip(points, result, strict=True):
+        assert in1 == point_in_polygon(p, polygon1)
+        assert in2 == point_in_polygon(p, polygon2)
@@ -2,15 +2,25 @@ import numpy as np
 
 from taxi_driver_env.math.geom import (
     Point,
+    PointArray,
     Segment,
+    SegmentArray,
     break_segment,
     cast_ray_segments,
     collision_circle_segment,
+    collision_circle_segments,
     intersect,
+    intersect_segments,
+    polygon_to_segment_array,
     polygon_to_segments,
+    split_segment,
+    sweep_circle_segments,
 )
 from taxi_driver_env.math.linalg import lst_2_vec
 
+SEGMENT_COUNT = 2
+MOVED_END = 5
+
 
 def test_segment_not_equals_different_types():
     a = Point(lst_2_vec([1, 1]))
@@ -262,3 +272,123 @@ def test_segment_not_break():
     e1 = Segment(a, c)
     e2 = Segment(b, d)
     assert break_segment(e1, e2) == [e2]
+
+
+def test_segment_array_views():
+    a = Point(lst_2_vec([1, 1]))
+    b = Point(lst_2_vec([2, 2]))
+    c = Point(lst_2_vec([3, 1]))
+    segments = SegmentArray.from_segments([Segment(a, b), Segment(b, c)])
+    assert len(segments) == SEGMENT_COUNT
+    assert segments[1] == Segment(b, c)
+    assert segments.to_segments() == [Segment(a, b), Segment(b, c)]
+    assert np.allclose(segments.lengths, [np.sqrt(2), np.sqrt(2)])
+    segments[0].end.xy[:] = [MOVED_END, MOVED_END]
+    assert segments.coords[0, 3] == MOVED_END
+
+
+def test_polygon_to_segment_array():
+    a = Point(lst_2_vec([1, 1]))
+    b = Point(lst_2_vec([2, 1]))
+    c = Point(lst_2_vec([2, 2]))
+    d = Point(lst_2_vec([1, 2]))
+    polygon = PointArray.from_points([a, b, c, d])
+    assert polygon_to_segment_array(polygon).to_segments() == polygon_to_segments([a, b, c, d])
+    assert polygon_to_segments(polygon, False) == polygon_to_segments([a, b, c, d], False)
+
+
+def test_cast_ray_segment_array():
+    n = lst_2_vec([1, -1]) / np.sqrt(2)
+    a = Point(lst_2_vec([1, 1]))
+    b = Point(lst_2_vec([2, 2]))
+    c = Point(lst_2_vec([1, 2]))
+    d = Point(lst_2_vec([2, 0]))
+    e = Point(lst_2_vec([6, 4]))
+    segments = [Segment(a, b), Segment(d, e)]
+    array = SegmentArray.from_segments(segments)
+    assert cast_ray_segments(c, n, 2, array) == cast_ray_segments(c, n, 2, segments)
+    assert cast_ray_segments(c, -n, 2, array, ordered=False) == cast_ray_segments(c, -n, 2, segments, ordered=False)
+
+
+def test_segment_array_collision_circle():
+    a = Point(lst_2_vec([1, 1]))
+    b = Point(lst_2_vec([3, 3]))
+    c = Point(lst_2_vec([1, 3]))
+    array = SegmentArray.from_segments([Segment(a, b)])
+    assert np.array_equal(collision_circle_segments(c, 3, array), collision_circle_segment(c, 3, Segment(a, b)))
+    assert collision_circle_segments(c, 1, array) is None
+
+
+def test_segment_array_sweep_circle():
+    array = SegmentArray.from_segments(
+        [
+            Segment(Point(lst_2_vec([-10, 0])), Point(lst_2_vec([10, 0]))),
+            Segment(Point(lst_2_vec([-10, -2])), Point(lst_2_vec([10, -2]))),
+        ]
+    )
+    hit = sweep_circle_segments(Point(lst_2_vec([0, 5])), Point(lst_2_vec([0, -5])), 1, array)
+    assert hit is not None
+    toi, normal = hit
+    assert np.isclose(toi, 0.4)
+    assert np.allclose(normal, [0, 1])
+    assert sweep_circle_segments(Point(lst_2_vec([0, 5])), Point(lst_2_vec([0, 2])), 1, array) is None
+    assert sweep_circle_segments(Point(lst_2_vec([0, 0.5])), Point(lst_2_vec([0, 3])), 1, array) is None
+
+
+def test_segment_array_sweep_circle_end_point():
+    array = SegmentArray.from_segments([Segment(Point(lst_2_vec([-10, 0])), Point(lst_2_vec([10, 0])))])
+    hit = sweep_circle_segments(Point(lst_2_vec([12, 0])), Point(lst_2_vec([-12, 0])), 1, array)
+    assert hit is not None
+    toi, normal = hit
+    assert np.isclose(toi, 1 / 24)
+    assert np.allclose(normal, [1, 0], atol=1e-6)
+
+
+def test_segment_split():
+    a = Point(lst_2_vec([0, 0]))
+    b = Point(lst_2_vec([4, 0]))
+    x = Point(lst_2_vec([1, 0]))
+    y = Point(lst_2_vec([3, 0]))
+    e = Segment(a, b)
+    assert split_segment(e, [y, x, Point(lst_2_vec([3.00001, 0])), a]) == [
+        Segment(a, x),
+        Segment(x, y),
+        Segment(y, b),
+    ]
+
+
+def test_segment_not_split():
+    a = Point(lst_2_vec([0, 0]))
+    b = Point(lst_2_vec([4, 0]))
+    e = Segment(a, b)
+    assert split_segment(e, []) == [e]
+    assert split_segment(e, [b]) == [e]
+
+
+def test_intersect_segments():
+    points = [Point(lst_2_vec(x)) for x in [[1, 1], [3, 3], [1, 3], [3, 1], [1, 2], [3, 2], [2, 3], [2, 1], [1, 0]]]
+    segments = [Segment(points[i], points[j]) for i, j in [(0, 1), (2, 3), (4, 5), (6, 7), (3, 8)]]
+    array = SegmentArray.from_segments(segments)
+    t, u, hits_at, hits = intersect_segments(array, array, False)
+    for i, seg1 in enumerate(segments):
+        for j, seg2 in enumerate(segments):
+            p = intersect(seg1, seg2, False)
+            assert hits[i, j] == (p is not None)
+            if p is not None:
+                assert p.almost(Point(hits_at[i, j]))
+                assert Point(seg1.start.xy + t[i, j] * (seg1.end.xy - seg1.start.xy)).almost(p)
+                assert Point(seg2.start.xy + u[i, j] * (seg2.end.xy - seg2.start.xy)).almost(p)
+
+
+def test_intersect_segments_strict():
+    a = Point(lst_2_vec([1, 1]))
+    b = Point(lst_2_vec([3, 3]))
+    c = Point(lst_2_vec([3, 1]))
+    e1 = SegmentArray.from_segments([Segment(a, b)])
+    e2 = SegmentArray.from_segments([Segment(b, c), Segment(a, b)])
+    _, _, _, hits = intersect_segments(e1, e2, True)
+    assert not hits.any()
+    t, _, points, hits = intersect_segments(e1, e2, False)
+    assert hits.tolist() == [[True, False]]
+    assert np.array_equal(points[0, 0], b.xy)
+    assert np.isnan(t[0, 1]) and np.isnan(points[0, 1]).all()
@@ -0,0 +1,117 @@
+import random
+
+import numpy as np
+
+from taxi_driver_env.math.geom import (
+    Point,
+    Segment,
+    SegmentArray,
+    collision_circle_segments,
+    distance_point_segment,
+)
+from taxi_driver_env.math.linalg import lst_2_vec
+from taxi_driver_env.math.spatial import (
+    BoxGrid,
+    DistanceField,
+    SegmentGrid,
+    SpatialHash,
+)
+
+
+def random_segments(n: int, size: float = 100.0, length: float = 30.0) -> list[Segment]:
+    rand = lambda a: random.uniform(-a, a)
+    segments = []
+    for _ in range(n):
+        a = lst_2_vec([rand(size), rand(size)])
+        segments.append(Segment(Point(a), Point(a + lst_2_vec([rand(length), rand(length)]))))
+    return segments
+
+
+def test_segment_grid_query_matches_linear_scan():
+    random.seed(1)
+    segments = random_segments(200)
+    grid = SegmentGrid(segments)
+    for _ in range(50):
+        p = Point(lst_2_vec([random.uniform(-120, 120), random.uniform(-120, 120)]))
+        r = random.uniform(0.5, 25)
+        expected = [x for x in segments if distance_point_segment(p, x, True) <= r]
+        result = grid.query(p, r)
+        assert len(result) == len(expected)
+        assert all(any(x is y for y in expected) for x in result)
+
+
+def test_segment_grid_query_is_sorted():
+    random.seed(2)
+    segments = random_segments(100)
+    grid = SegmentGrid(segments)
+    p = Point(lst_2_vec([0, 0]))
+    distances = [distance_point_segment(p, x, True) for x in grid.query(p, 50)]
+    assert distances == sorted(distances)
+
+
+def test_segment_grid_query_empty():
+    a = Point(lst_2_vec([0, 0]))
+    b = Point(lst_2_vec([1, 0]))
+    grid = SegmentGrid([Segment(a, b)])
+    assert grid.query(Point(lst_2_vec([100, 100])), 5) == []
+
+
+def test_box_grid_query_points():
+    boxes = np.array([[0, 0, 15, 15], [10, 10, 40, 20], [100, 100, 101, 101]], dtype=np.float64)
+    points = np.array([[5, 5], [12, 12], [30, 30], [100.5, 100.5]], dtype=np.float64)
+    point_indices, box_indices = BoxGrid(boxes).query_points(points)
+    assert sorted(zip(point_indices.tolist(), box_indices.tolist(), strict=True)) == [(0, 0), (1, 0), (1, 1), (3, 2)]
+
+
+def square_segments(size: float = 20.0) -> list[Segment]:
+    points = [Point(x) for x in lst_2_vec([[0.0, 0.0], [size, 0.0], [size, size], [0.0, size]])]
+    return [Segment(points[i], points[(i + 1) % len(points)]) for i in range(len(points))]
+
+
+def test_distance_field_matches_exact_distance():
+    random.seed(3)
+    band, size = 5.0, 20.0
+    segments = square_segments(size)
+    field = DistanceField(SegmentArray.from_segments(segments), band=band)
+    for _ in range(200):
+        p = Point(lst_2_vec([random.uniform(-10, 30), random.uniform(-10, 30)]))
+        inside = 0 < p.xy[0] < size and 0 < p.xy[1] < size
+        expected = min(*(distance_point_segment(p, x, True) for x in segments), band)
+        d, _ = field.query(p)
+        assert abs(abs(d) - expected) < field.cell_size
+        if expected > field.cell_size:
+            assert (d < 0) == inside
+
+
+def test_distance_field_collision_matches_exact_collision():
+    segments = square_segments()
+    field = DistanceField(SegmentArray.from_segments(segments))
+    array = SegmentArray.from_segments(segments)
+    for xy in [[10, 0.5], [19.7, 10], [10, 10], [-0.5, 10]]:
+        p = Point(lst_2_vec(xy))
+        expected = collision_circle_segments(p, 1.0, array)
+        result = field.collision_circle(p, 1.0)
+        assert (result is None) == (expected is None)
+        if expected is not None:
+            assert np.allclose(result, expected, atol=1e-3)
+
+
+def test_unsigned_distance_field_nearest():
+    field = DistanceField(SegmentArray.from_segments(square_segments()), band=5.0, signed=False)
+    assert field.query(Point(lst_2_vec([10, 2])))[0] > 0
+    nearest = field.query_nearest(Point(lst_2_vec([10, 2])))
+    assert nearest is not None
+    assert np.allclose(nearest.xy, [10, 0], atol=1e-6)
+    assert field.query_nearest(Point(lst_2_vec([10, 10]))) is None
+
+
+def test_spatial_hash_pairs_match_brute_force():
+    rng = np.random.default_rng(1)
+    for n in (0, 1, 50, 500):
+        points = rng.uniform(-100, 100, (n, 2))
+        max_distance = 4.0
+        distances = np.linalg.norm(points[:, None] - points[None], axis=2)
+        expected = {(int(i), int(j)) for i, j in zip(*np.nonzero(np.triu(distances <= max_distance, 1)), strict=True)}
+        pairs = SpatialHash(points).query_pairs(max_distance)
+        assert len(pairs) == len(expected)
+        assert {(int(i), int(j)) for i, j in pairs} == expected
@@ -0,0 +1,75 @@
+import numpy as np
+
+from taxi_driver_env.envs.tutorial1_env import Tutorial1Env
+from taxi_driver_env.game.entities import car
+from taxi_driver_env.game.scenes import trainer
+from taxi_driver_env.utils.bitbang import is_bit_set
+
+AGENT_COUNT = 4
+STEP_COUNT = 60
+
+
+def run_steps(env: Tutorial1Env, actions: np.ndarray) -> tuple[list, list]:
+    # The steps of the environment without its rendering
+
+    observations, rewards = [], []
+    for action in actions:
+        for agent in trainer.get_active_agents():
+            throttle, wheel = action[agent.vin]
+            agent.push_throttle(throttle)
+            agent.turn_wheel(wheel)
+        trainer.update(1 / env.physic_rate)
+        observations.append(env._get_obs())
+        rewards.append(trainer.get_agent_rewards().copy())
+    return observations, rewards
+
+
+def random_actions(seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    actions = rng.uniform(-1, 1, (STEP_COUNT, AGENT_COUNT, 2))
+    actions[..., 0] = np.abs(actions[..., 0])
+    return actions
+
+
+def test_snapshot_round_trip():
+    env = Tutorial1Env(agent_count=AGENT_COUNT)
+    env.reset(seed=1)
+    run_steps(env, random_actions(1))
+
+    state = env.get_state()
+    actions = random_actions(2)
+    expected_observations, expected_rewards = run_steps(env, actions)
+
+    env.set_state(state)
+    observations, rewards = run_steps(env, actions)
+
+    assert len(observations) == len(expected_observations)
+    for obs, expected_obs in zip(observations, expected_observations, strict=True):
+        assert len(obs) == len(expected_obs)
+        for x, y in zip(obs, expected_obs, strict=True):
+            assert all(np.array_equal(x[k], y[k]) for k in y)
+    assert all(np.array_equal(x, y) for x, y in zip(rewards, expected_rewards, strict=True))
+
+
+def test_agents_survive_first_step_with_car_collision():
+    env = Tutorial1Env(agent_count=AGENT_COUNT, car_collision=True)
+    env.reset(seed=1)
+    try:
+        actions = np.zeros((1, AGENT_COUNT, 2))
+        actions[..., 0] = 1
+        run_steps(env, actions)
+        assert len(trainer.get_active_agents()) == AGENT_COUNT
+        assert not any(is_bit_set(x.flags, car.FLAG_DAMAGED) for x in trainer.get_active_agents())
+    finally:
+        trainer.set_car_collision(False)
+
+
+def test_masked_observations_are_not_shared():
+    env = Tutorial1Env(agent_count=AGENT_COUNT)
+    env.reset(seed=1)
+    run_steps(env, np.zeros((1, AGENT_COUNT, 2)))
+    assert not trainer.get_agent_mask().any()
+
+    observations = trainer.get_agent_observations()
+    observations[0]["agent_vel"][0] = 1.0
+    assert all(not x["agent_vel"].any() for x in observations[1:])
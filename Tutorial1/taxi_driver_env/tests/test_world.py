@@ -0,0 +1,76 @@
+import os
+import random
+
+from taxi_driver_env.game.entities import world
+from taxi_driver_env.math import envelope, graph
+from taxi_driver_env.math.geom import Point
+from taxi_driver_env.math.linalg import lst_2_vec
+
+
+def small_world(seed: int = 3) -> world.World:
+    random.seed(seed)
+    roads = graph.generate_random(6, 7)
+    borders, anchors = envelope.generare_borders_from_spatial_graph(roads, world.ROAD_WIDTH, [])
+    houses, trees = world.generate_decorations(borders, anchors)
+    return world.World(roads, borders, houses, trees)
+
+
+def test_world_cache_round_trip(tmp_path):
+    expected = small_world()
+    state = random.getstate()
+    path = os.path.join(tmp_path, "world")
+    world._save_world(path, expected)
+
+    random.seed(0)
+    loaded = world._load_world(path)
+    assert random.getstate() == state
+    assert [x.point for x in loaded.roads.vertice] == [x.point for x in expected.roads.vertice]
+    assert loaded.roads.edges == expected.roads.edges
+    assert loaded.borders.segments == expected.borders.segments
+    assert loaded.borders.skeleton == expected.borders.skeleton
+    assert loaded.borders.width == expected.borders.width
+    assert loaded.houses == expected.houses
+    assert [(x.position, x.angle, x.type) for x in loaded.trees] == [
+        (x.position, x.angle, x.type) for x in expected.trees
+    ]
+
+
+def test_world_cache_lost_race_leaves_no_directory(tmp_path):
+    expected = small_world()
+    path = os.path.join(tmp_path, "world")
+    world._save_world(path, expected)
+    world._save_world(path, expected)
+    assert os.listdir(tmp_path) == ["world"]
+
+
+def test_world_cache_key_invalidation(monkeypatch):
+    random.seed(1)
+    key = world._get_cache_key()
+    random.seed(1)
+    assert world._get_cache_key() == key
+
+    random.seed(2)
+    assert world._get_cache_key() != key
+
+    random.seed(1)
+    monkeypatch.setattr(world, "ROAD_WIDTH", world.ROAD_WIDTH + 1)
+    assert world._get_cache_key() != key
+    monkeypatch.undo()
+
+    random.seed(1)
+    monkeypatch.setattr(world, "_get_generator_hash", lambda: "edited")
+    assert world._get_cache_key() != key
+
+
+def test_neighbour_segments_without_borders():
+    anchors = [Point(lst_2_vec([0, 0])), Point(lst_2_vec([10, 0]))]
+    borders = envelope.Envelope([], [], world.ROAD_WIDTH)
+    assert world._get_neighbour_segments(anchors, borders, world.TREE_DISTANCE) == [[], []]
+
+
+def test_world_cache_prunes_stale_keys(tmp_path, monkeypatch):
+    monkeypatch.setattr(world, "WORLD_CACHE_SIZE", 2)
+    expected = small_world()
+    for key in ["a", "b", "c"]:
+        world._save_world(os.path.join(tmp_path, f"world-{key}"), expected)
+    assert sorted(os.listdir(tmp_path)) == ["world-b", "world-c"]
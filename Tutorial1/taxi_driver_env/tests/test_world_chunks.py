@@ -0,0 +1,109 @@
+import random
+
+import numpy as np
+import pyray as pr
+
+from taxi_driver_env.game.entities import car, world_chunks
+from taxi_driver_env.game.scenes import dispatch
+from taxi_driver_env.math.geom import Point, SegmentArray, intersect_segments
+from taxi_driver_env.math.linalg import lst_2_vec
+from taxi_driver_env.utils.bitbang import is_bit_set
+
+STEP_COUNT = 600
+
+
+def chunk_segments(chunk: world_chunks.Chunk) -> SegmentArray:
+    return SegmentArray.from_segments(chunk.world.borders.segments)
+
+
+def road_segments(chunk: world_chunks.Chunk) -> set[tuple[tuple[float, float], tuple[float, float]]]:
+    # The roads as undirected segments
+    get_point = lambda x: (float(x.point.xy[0]), float(x.point.xy[1]))
+    return {
+        (min(get_point(e.start), get_point(e.end)), max(get_point(e.start), get_point(e.end)))
+        for e in chunk.world.roads.edges
+    }
+
+
+def test_chunk_generation_is_deterministic():
+    world_chunks.reset()
+    random.seed(1)
+    state = random.getstate()
+    chunk = world_chunks.get_chunk(0, 1)
+    assert random.getstate() == state
+
+    world_chunks.reset()
+    regenerated = world_chunks.get_chunk(0, 1)
+    assert regenerated is not chunk
+    assert road_segments(regenerated) == road_segments(chunk)
+    assert chunk_segments(regenerated) == chunk_segments(chunk)
+    assert regenerated.world.houses == chunk.world.houses
+
+
+def test_chunk_portals_match_across_seams():
+    world_chunks.reset()
+    for key, other_key, side in [((0, 0), (1, 0), 1), ((0, 0), (0, 1), 3)]:
+        portal, normal = world_chunks._get_portals(*key)[side]
+        other_portal, other_normal = world_chunks._get_portals(*other_key)[side - 1]
+        assert (portal == other_portal).all()
+        assert (normal == -other_normal).all()
+
+        # Both chunks generate the road crossing the seam at the portal
+        shared = road_segments(world_chunks.get_chunk(*key)) & road_segments(world_chunks.get_chunk(*other_key))
+        assert any(tuple(portal.tolist()) in x for x in shared)
+
+        # The merged roads reach the neighbour through the portal
+        roads = world_chunks.get_roads([key, other_key])
+        start = world_chunks.get_chunk(*key).world.roads.vertice[0]
+        stop = world_chunks.get_chunk(*other_key).world.roads.vertice[0]
+        assert roads.get_shortest_path(start, stop).vertice[-1] is stop
+
+
+def test_chunk_cache_eviction_regenerates_the_same_chunk(monkeypatch):
+    monkeypatch.setattr(world_chunks, "CHUNK_VERTICE", 4)
+    monkeypatch.setattr(world_chunks, "CHUNK_EDGES", 4)
+    world_chunks.reset()
+    chunk = world_chunks.get_chunk(0, 0)
+    for i in range(world_chunks.CHUNK_CACHE_SIZE):
+        world_chunks.get_chunk(i + 1, 0)
+    assert world_chunks.get_chunk_cache_info().currsize == world_chunks.CHUNK_CACHE_SIZE
+
+    misses = world_chunks.get_chunk_cache_info().misses
+    regenerated = world_chunks.get_chunk(0, 0)
+    assert world_chunks.get_chunk_cache_info().misses == misses + 1
+    assert regenerated is not chunk
+    assert road_segments(regenerated) == road_segments(chunk)
+    assert chunk_segments(regenerated) == chunk_segments(chunk)
+    world_chunks.reset()
+
+
+def test_large_map_car_crosses_a_chunk_seam(monkeypatch):
+    monkeypatch.setattr(world_chunks, "CHUNK_VERTICE", 4)
+    monkeypatch.setattr(world_chunks, "CHUNK_EDGES", 4)
+    world_chunks.reset()
+
+    # The car drives the portal road from its stub in the chunk (0, 0) to its stub in the chunk (1, 0)
+    portal, normal = world_chunks._get_portals(0, 0)[1]
+    a, b = Point(portal - normal * world_chunks.CHUNK_MARGIN), Point(portal + normal * world_chunks.CHUNK_MARGIN)
+    acar = car.Car(pr.WHITE, "ai", corridor=world_chunks.get_corridor_from_a_to_b(a, b))
+    acar.set_large_map(True)
+
+    keys, sides = set(), set()
+    for _ in range(STEP_COUNT):
+        dispatch._drive_along_corridor(acar, None)
+        acar.update(1 / 60)
+        keys.add(world_chunks.get_chunk_key(acar.curr_pos))
+
+        # The streamed borders hold the ones of both chunks, the car never goes through any of them
+        assert acar.borders is not None
+        coords = acar.borders.array.coords
+        sides.update(np.sign((coords[:, 0] + coords[:, 2]) * 0.5 - portal[0]).tolist())
+        move = SegmentArray(lst_2_vec([[*acar.prev_pos.xy, *acar.curr_pos.xy]]))
+        assert not intersect_segments(move, acar.borders.array)[3].any()
+        assert not is_bit_set(acar.flags, car.FLAG_DAMAGED)
+
+    assert keys == {(0, 0), (1, 0)}
+    assert world_chunks.get_chunk_key(acar.curr_pos) == (1, 0)
+    assert {-1.0, 1.0} <= sides
+    assert any(x.length < car.RAY_MAX_LEN for x in acar.camera)
+    world_chunks.reset()